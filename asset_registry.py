@@ -0,0 +1,102 @@
+"""
+Telegram VLC Stream Bot - Media Asset Registry
+Copyright (c) 2025 Akhil TG. All Rights Reserved.
+
+Uploads each local asset (welcome banners) to Telegram once and reuses the
+returned file_id for every later send. Entries are persisted in WORK_DIR and
+tied to the file's mtime and size, so replacing a banner on disk invalidates
+its cached file_id.
+"""
+
+import os
+import json
+import random
+import logging
+from pyrogram.errors import FloodWait
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILE = os.path.join(Config.WORK_DIR, "asset_file_ids.json")
+BANNERS = ["assets/banner.png", "assets/banner1.png", "assets/banner2.png", "assets/banner3.png"]
+
+
+def random_banner():
+    return random.choice(BANNERS)
+
+
+class AssetRegistry:
+    def __init__(self, path=REGISTRY_FILE):
+        self.path = path
+        self.entries = {}  # asset path -> {"file_id", "mtime", "size"}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                logger.error(f"Unreadable asset registry, starting empty: {e}")
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+    @staticmethod
+    def _stat(asset_path):
+        try:
+            st = os.stat(asset_path)
+            return st.st_mtime, st.st_size
+        except OSError:
+            return None
+
+    def get(self, asset_path):
+        """Cached file_id for asset_path, or None if never uploaded or changed on disk"""
+        entry = self.entries.get(asset_path)
+        if not entry:
+            return None
+        if self._stat(asset_path) != (entry["mtime"], entry["size"]):
+            self.invalidate(asset_path)
+            return None
+        return entry["file_id"]
+
+    def remember(self, asset_path, sent):
+        """Store the photo file_id from a message that carried asset_path"""
+        photo = getattr(sent, "photo", None)
+        stat = self._stat(asset_path)
+        if photo is None or stat is None:
+            return
+        self.entries[asset_path] = {"file_id": photo.file_id, "mtime": stat[0], "size": stat[1]}
+        try:
+            self._save()
+        except Exception as e:
+            logger.error(f"Could not persist asset registry: {e}")
+
+    def invalidate(self, asset_path):
+        if self.entries.pop(asset_path, None) is not None:
+            try:
+                self._save()
+            except Exception as e:
+                logger.error(f"Could not persist asset registry: {e}")
+
+    async def send(self, asset_path, send):
+        """Call send(media) with the cached file_id, uploading asset_path only when needed.
+
+        send receives either a file_id or the local path and returns the sent Message.
+        """
+        file_id = self.get(asset_path)
+        if file_id:
+            try:
+                return await send(file_id)
+            except FloodWait:
+                raise
+            except Exception as e:
+                # e.g. file_id from another bot token or expired on Telegram's side
+                logger.warning(f"Cached file_id for {asset_path} rejected, re-uploading: {e}")
+                self.invalidate(asset_path)
+        sent = await send(asset_path)
+        self.remember(asset_path, sent)
+        return sent
+
+
+asset_registry = AssetRegistry()
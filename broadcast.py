@@ -0,0 +1,227 @@
+"""
+Telegram VLC Stream Bot - Broadcast Engine
+Copyright (c) 2025 Akhil TG. All Rights Reserved.
+
+Sends a message to every user with bounded concurrency under a token bucket,
+pauses all workers together on FloodWait, marks blocked/deactivated users in
+bulk, and checkpoints progress to disk so a restart can resume the broadcast.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from pyrogram import Client
+from pyrogram.errors import (
+    FloodWait,
+    UserIsBlocked,
+    InputUserDeactivated,
+    UserDeactivated,
+    PeerIdInvalid,
+)
+from config import Config
+from database import db
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = os.path.join(Config.WORK_DIR, "broadcast_checkpoint.json")
+UNREACHABLE_ERRORS = (UserIsBlocked, InputUserDeactivated, UserDeactivated, PeerIdInvalid)
+
+
+class TokenBucket:
+    """Allows `rate` sends per second with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Broadcast:
+    """One broadcast run. State is a plain dict so it can be checkpointed as JSON."""
+
+    def __init__(self, client: Client, state):
+        self.client = client
+        self.state = state
+        self.bucket = TokenBucket(Config.BROADCAST_RATE)
+        self.resume_at = 0.0  # Shared FloodWait pause for every worker
+        self.cancelled = False
+        self._last_progress = 0.0
+        self._last_checkpoint = 0.0
+
+    @classmethod
+    def new(cls, client, from_chat_id, message_id, status_chat_id, status_message_id):
+        return cls(client, {
+            "from_chat_id": from_chat_id,
+            "message_id": message_id,
+            "status_chat_id": status_chat_id,
+            "status_message_id": status_message_id,
+            "started_at": time.time(),
+            "cursor": None,  # Highest user id of the last fully processed batch
+            "total": 0,
+            "success": 0,
+            "failed": 0,
+            "blocked": 0,
+        })
+
+    @classmethod
+    def load_checkpoint(cls, client):
+        """Return a Broadcast restored from disk, or None if nothing is pending"""
+        if not os.path.exists(CHECKPOINT_FILE):
+            return None
+        try:
+            with open(CHECKPOINT_FILE, "r") as f:
+                return cls(client, json.load(f))
+        except Exception as e:
+            logger.error(f"Unreadable broadcast checkpoint, ignoring: {e}")
+            return None
+
+    def save_checkpoint(self):
+        tmp = CHECKPOINT_FILE + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, CHECKPOINT_FILE)
+
+    @staticmethod
+    def clear_checkpoint():
+        if os.path.exists(CHECKPOINT_FILE):
+            os.remove(CHECKPOINT_FILE)
+
+    def progress_text(self, done=False, interrupted=False):
+        s = self.state
+        processed = s["success"] + s["failed"] + s["blocked"]
+        elapsed = max(time.time() - s["started_at"], 1)
+        if interrupted:
+            header = "⚠️ **Broadcast interrupted** - send /resume_broadcast to continue"
+        else:
+            header = "✅ **Broadcast Complete!**" if done else "📢 **Broadcasting...**"
+        text = (
+            f"{header}\n\n"
+            f"✅ Success: {s['success']}\n"
+            f"❌ Failed: {s['failed']}\n"
+            f"🚫 Blocked: {s['blocked']}\n"
+            f"📊 Progress: {processed}/{s['total']}\n"
+            f"⚡ Rate: {processed / elapsed:.1f} msg/s"
+        )
+        if done and processed:
+            text += f"\n\nSuccess Rate: {(s['success'] / processed * 100):.1f}%"
+        return text
+
+    async def _report(self, force=False, done=False, interrupted=False):
+        """Edit the status message at most every BROADCAST_PROGRESS_INTERVAL seconds"""
+        now = time.monotonic()
+        if not force and now - self._last_progress < Config.BROADCAST_PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        try:
+            await self.client.edit_message_text(
+                self.state["status_chat_id"], self.state["status_message_id"], self.progress_text(done, interrupted)
+            )
+        except FloodWait as e:
+            # Progress edits are cosmetic: skip them for the wait instead of stalling sends
+            self._last_progress = now + e.value
+        except Exception as e:
+            logger.debug(f"Broadcast progress edit failed: {e}")
+
+    async def _send(self, user_id, unreachable):
+        for _ in range(3):
+            pause = self.resume_at - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.bucket.acquire()
+            try:
+                await self.client.copy_message(user_id, self.state["from_chat_id"], self.state["message_id"])
+                self.state["success"] += 1
+                return
+            except FloodWait as e:
+                # One FloodWait means the whole bot is limited: pause every worker
+                self.resume_at = max(self.resume_at, time.monotonic() + e.value)
+                metrics.incr("broadcast_floodwaits")
+                logger.warning(f"Broadcast FloodWait: pausing all workers for {e.value}s")
+            except UNREACHABLE_ERRORS:
+                self.state["blocked"] += 1
+                unreachable.append(user_id)
+                return
+            except Exception as e:
+                logger.error(f"Broadcast error for user {user_id}: {e}")
+                break
+        self.state["failed"] += 1
+
+    async def _send_batch(self, user_ids):
+        queue = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+        unreachable = []
+
+        async def worker():
+            while not queue.empty() and not self.cancelled:
+                user_id = queue.get_nowait()
+                await self._send(user_id, unreachable)
+                await self._report()
+
+        await asyncio.gather(*(worker() for _ in range(min(Config.BROADCAST_CONCURRENCY, len(user_ids)))))
+        if unreachable and db:
+            await db.mark_users_blocked(unreachable)
+
+    async def run(self, batches, total=None):
+        """Send to every user in `batches`, an async iterator of ascending user-id
+        lists that starts after the checkpoint cursor"""
+        if self.state["cursor"] is None and total is not None:
+            self.state["total"] = total
+        self.save_checkpoint()
+
+        try:
+            async for batch in batches:
+                if self.cancelled:
+                    break
+                if not batch:
+                    continue
+                await self._send_batch(batch)
+                if self.cancelled:
+                    break  # Batch only partly sent: keep the cursor before it
+                self.state["cursor"] = batch[-1]
+                if time.monotonic() - self._last_checkpoint >= Config.BROADCAST_CHECKPOINT_INTERVAL:
+                    self._last_checkpoint = time.monotonic()
+                    self.save_checkpoint()
+        except Exception:
+            # The user source failed mid-stream: keep the cursor so the rest can be resumed
+            self.save_checkpoint()
+            await self._report(force=True, interrupted=True)
+            raise
+
+        if self.cancelled:
+            self.save_checkpoint()
+        else:
+            self.clear_checkpoint()
+        await self._report(force=True, done=not self.cancelled)
+        return self.state
+
+
+# Only one broadcast runs at a time
+current_broadcast = None
+
+
+async def start_broadcast(broadcast: Broadcast, batches, total=None):
+    global current_broadcast
+    if current_broadcast is not None:
+        raise RuntimeError("A broadcast is already running")
+    current_broadcast = broadcast
+    try:
+        return await broadcast.run(batches, total)
+    finally:
+        current_broadcast = None
@@ -20,10 +20,124 @@ class Config:
     ADMINS = [int(x) for x in os.getenv("ADMINS", "").split()] if os.getenv("ADMINS") else []
     FORCE_SUB_CHANNEL = os.getenv("FORCE_SUB_CHANNEL", "") # Channel ID or Username
     LOG_CHANNEL = int(os.getenv("LOG_CHANNEL", "0")) # Log Channel ID
+    BIN_CHANNEL = int(os.getenv("BIN_CHANNEL", "0")) # Channel holding one stored copy of every streamed file
     
     # Database
     DATABASE_URL = os.getenv("DATABASE_URL", "")
-    
+    DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "5"))  # Seconds between counter flushes
+    DB_BUFFER_MAX_USERS = int(os.getenv("DB_BUFFER_MAX_USERS", "5000"))  # Flush early past this many users
+    DB_FAILURE_THRESHOLD = int(os.getenv("DB_FAILURE_THRESHOLD", "3"))  # Consecutive failures before failing fast
+    DB_RESET_TIMEOUT = float(os.getenv("DB_RESET_TIMEOUT", "15"))  # Seconds between health probes while open
+    USERS_DB_PATH = os.getenv("USERS_DB_PATH", "users.db")  # Local SQLite fallback when MongoDB is unavailable
+
+    # Broadcast engine (Telegram allows bots roughly 30 messages/second)
+    BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Messages per second
+    BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))  # Parallel sends
+    BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "500"))  # Users per checkpointed batch
+    BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))  # Seconds between edits
+    BROADCAST_CHECKPOINT_INTERVAL = float(os.getenv("BROADCAST_CHECKPOINT_INTERVAL", "10"))  # Seconds
+
+    # Streaming resilience (retries for GetFile part fetches)
+    STREAM_RETRY_ATTEMPTS = int(os.getenv("STREAM_RETRY_ATTEMPTS", "5"))  # Per part
+    STREAM_RETRY_BUDGET = int(os.getenv("STREAM_RETRY_BUDGET", "20"))  # Per stream
+    STREAM_RETRY_BASE_DELAY = float(os.getenv("STREAM_RETRY_BASE_DELAY", "0.5"))  # Seconds
+    STREAM_RETRY_MAX_DELAY = float(os.getenv("STREAM_RETRY_MAX_DELAY", "8"))  # Seconds
+    STREAM_SESSION_RESET_AFTER = int(os.getenv("STREAM_SESSION_RESET_AFTER", "2"))  # Failures
+    STREAM_FLOODWAIT_THRESHOLD = int(os.getenv("STREAM_FLOODWAIT_THRESHOLD", "15"))  # Seconds
+
+    # Media session lifecycle
+    SESSION_SWEEP_INTERVAL = int(os.getenv("SESSION_SWEEP_INTERVAL", "60"))  # Seconds between sweeps
+    SESSION_IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", "900"))  # Close sessions idle this long
+    SESSION_ACTIVE_WINDOW = int(os.getenv("SESSION_ACTIVE_WINDOW", "120"))  # Keepalive sessions used this recently
+    SESSION_PING_TIMEOUT = int(os.getenv("SESSION_PING_TIMEOUT", "10"))  # Seconds
+
+    # Stream admission control (0 disables a limit)
+    MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "50"))
+    MAX_STREAMS_PER_IP = int(os.getenv("MAX_STREAMS_PER_IP", "4"))
+    MAX_STREAMS_PER_FILE = int(os.getenv("MAX_STREAMS_PER_FILE", "25"))
+    STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "20"))  # Requests waiting for a slot
+    STREAM_QUEUE_TIMEOUT = float(os.getenv("STREAM_QUEUE_TIMEOUT", "5"))  # Seconds
+    STREAM_RETRY_AFTER = int(os.getenv("STREAM_RETRY_AFTER", "5"))  # Retry-After header on 503
+    TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"  # Only behind a proxy that appends it
+
+    # Fair-share scheduling of Telegram part fetches across streams
+    MAX_INFLIGHT_PARTS = int(os.getenv("MAX_INFLIGHT_PARTS", "16"))  # 0 disables scheduling
+    INTERACTIVE_PARTS = int(os.getenv("INTERACTIVE_PARTS", "3"))  # Leading parts of a response served first
+
+    # Background job queue for non-critical side effects
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))  # Jobs beyond this are dropped
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "10"))  # Seconds to finish jobs on shutdown
+
+    # Bin-channel file registry
+    FILE_REGISTRY_CACHE_SIZE = int(os.getenv("FILE_REGISTRY_CACHE_SIZE", "10000"))  # Entries kept in memory
+    FILE_REGISTRY_REFRESH = int(os.getenv("FILE_REGISTRY_REFRESH", "3600"))  # Seconds before re-resolving file_id
+
+    # Logging
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json" (one object per line)
+    LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))  # INFO/DEBUG records per call site per window, 0 = off
+    LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", "10"))  # Seconds
+
+    # Event-loop lag monitor
+    LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))  # Seconds between lag samples
+    LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD", "0.1"))  # Stalls longer than this are captured
+    LOOP_LAG_SAMPLES = int(os.getenv("LOOP_LAG_SAMPLES", "3000"))  # Samples kept for percentiles
+    LOOP_MONITOR_STRICT = os.getenv("LOOP_MONITOR_STRICT", "false").lower() == "true"  # Fail on a block (tests)
+
+    # Canonical file identity (many links, one file)
+    FILE_IDENTITY_MAX_ALIASES = int(os.getenv("FILE_IDENTITY_MAX_ALIASES", "100000"))  # Remembered links
+
+    # /batch message fetching
+    BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "3"))  # Parallel 200-id get_messages pages
+    BATCH_PROGRESS_INTERVAL = float(os.getenv("BATCH_PROGRESS_INTERVAL", "3"))  # Seconds between progress edits
+
+    # /playlist M3U endpoint
+    PLAYLIST_MAX_MESSAGES = int(os.getenv("PLAYLIST_MAX_MESSAGES", "10000"))  # Largest id range per playlist
+    PLAYLIST_CACHE_PAGES = int(os.getenv("PLAYLIST_CACHE_PAGES", "256"))  # Cached 200-id pages
+    PLAYLIST_CACHE_TTL = float(os.getenv("PLAYLIST_CACHE_TTL", "600"))  # Seconds
+
+    # Admin diagnostics (/admin HTTP endpoints, /perf)
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # X-Admin-Token header value; endpoints are disabled when empty
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))  # Seconds between stack samples
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))  # Longest CPU profile allowed
+    TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "1"))  # Frames stored per allocation
+
+    # Request tracing
+    TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))  # Streams slower than this to first byte are kept
+    TRACE_RING_SIZE = int(os.getenv("TRACE_RING_SIZE", "50"))  # Slow traces kept for /admin/traces
+    TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "64"))  # Spans recorded per trace
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")  # OTLP/JSON lines file for every trace, empty = off
+
+    # Access trace (binary log of served ranges, for tools/replay_trace.py)
+    ACCESS_TRACE_PATH = os.getenv("ACCESS_TRACE_PATH", "")  # Empty = off
+    ACCESS_TRACE_SALT = os.getenv("ACCESS_TRACE_SALT", "")  # Client IP hash salt; empty = random per process
+
+    # Chunk cache (downloaded 1 MB parts shared by all streams of a file)
+    CHUNK_CACHE_MB = int(os.getenv("CHUNK_CACHE_MB", "128"))  # Memory budget, 0 = off
+    CHUNK_CACHE_WINDOW = float(os.getenv("CHUNK_CACHE_WINDOW", "0.01"))  # Share of the budget for the W-TinyLFU window
+
+    # Popularity tracking and cache pre-warming
+    POPULARITY_CAPACITY = int(os.getenv("POPULARITY_CAPACITY", "200"))  # Files monitored by the space-saving sketch
+    POPULARITY_TOP_K = int(os.getenv("POPULARITY_TOP_K", "20"))  # Files shown in the admin view
+    POPULARITY_HALF_LIFE = float(os.getenv("POPULARITY_HALF_LIFE", "3600"))  # Seconds for a count to halve
+    WARM_ENABLED = os.getenv("WARM_ENABLED", "true").lower() == "true"
+    WARM_INTERVAL = float(os.getenv("WARM_INTERVAL", "60"))  # Seconds between warming cycles
+    WARM_TOP_N = int(os.getenv("WARM_TOP_N", "5"))  # Trending files warmed per cycle
+    WARM_HEAD_MB = int(os.getenv("WARM_HEAD_MB", "4"))  # Head of each file (container header, first frames)
+    WARM_TAIL_MB = int(os.getenv("WARM_TAIL_MB", "2"))  # Tail of each file (moov atom / cues probed by players)
+    WARM_MINUTES = float(os.getenv("WARM_MINUTES", "2"))  # Playback minutes from the start, when duration is known
+    WARM_BUDGET_MB = int(os.getenv("WARM_BUDGET_MB", "64"))  # Telegram download budget per cycle
+    WARM_IDLE_SHARE = float(os.getenv("WARM_IDLE_SHARE", "0.5"))  # Warm only while fewer fetch slots are busy
+    WARM_TRENDING_SHARE = float(os.getenv("WARM_TRENDING_SHARE", "0.5"))  # Share of the protected cache segment
+    WARM_REWARM_AFTER = float(os.getenv("WARM_REWARM_AFTER", "3600"))  # Seconds before an evicted warmed part is refetched
+    WARM_JOB_MB = int(os.getenv("WARM_JOB_MB", "32"))  # Default head per file for admin /warm jobs
+    WARM_JOB_CONCURRENCY = int(os.getenv("WARM_JOB_CONCURRENCY", "2"))  # Files fetched at once per job
+    WARM_JOB_MAX_FILES = int(os.getenv("WARM_JOB_MAX_FILES", "500"))  # Largest message range per job
+    WARM_MAX_JOBS = int(os.getenv("WARM_MAX_JOBS", "2"))  # Jobs running at once
+    WARM_JOB_HOLD = float(os.getenv("WARM_JOB_HOLD", "14400"))  # Seconds a finished job pauses trending warm-up
+    WARM_PROGRESS_INTERVAL = float(os.getenv("WARM_PROGRESS_INTERVAL", "5"))  # Seconds between /warm status edits
+
     # Directory to store small thumbnails or temporary data if needed
     WORK_DIR = "work_dir"
 
@@ -1,11 +1,159 @@
 import motor.motor_asyncio
 from config import Config
+import asyncio
 import logging
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, OperationFailure
+import time
+from pymongo.write_concern import WriteConcern
+from server import metrics
 
 logger = logging.getLogger(__name__)
 
+class CounterBuffer:
+    """Accumulates per-user $inc deltas and $set fields (last_seen, profile)
+    in memory so hot paths never wait on MongoDB. Drained into one bulk_write."""
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self.incs = {}  # user_id -> {field: delta}
+        self.sets = {}  # user_id -> {field: value}
+
+    def __len__(self):
+        return len(self.incs.keys() | self.sets.keys())
+
+    def inc(self, user_id, field, amount=1):
+        deltas = self.incs.setdefault(user_id, {})
+        deltas[field] = deltas.get(field, 0) + amount
+
+    def set(self, user_id, fields):
+        self.sets.setdefault(user_id, {}).update(fields)
+
+    def drain(self):
+        """Return pending UpdateOne ops and reset the buffer."""
+        incs, sets = self.incs, self.sets
+        self.incs, self.sets = {}, {}
+        ops = []
+        for user_id in incs.keys() | sets.keys():
+            update = {}
+            if user_id in incs:
+                update['$inc'] = incs[user_id]
+            if user_id in sets:
+                update['$set'] = sets[user_id]
+            ops.append(UpdateOne({'id': user_id}, update))
+        return ops, incs, sets
+
+    def restore(self, incs, sets):
+        """Put back updates from a failed flush, dropping what no longer fits."""
+        for user_id, deltas in incs.items():
+            if user_id not in self.incs and len(self) >= self.max_users:
+                metrics.incr("db_buffer_dropped_users")
+                continue
+            for field, amount in deltas.items():
+                self.inc(user_id, field, amount)
+        for user_id, fields in sets.items():
+            if user_id not in self.sets and len(self) >= self.max_users:
+                continue
+            self.sets[user_id] = {**fields, **self.sets.get(user_id, {})}
+
+    def overlay(self, user_id, user):
+        """Apply pending updates to a fetched user document (read-your-writes)."""
+        if not user:
+            return user
+        for field, amount in self.incs.get(user_id, {}).items():
+            user[field] = user.get(field, 0) + amount
+        user.update(self.sets.get(user_id, {}))
+        return user
+
+class CircuitBreaker:
+    """Tracks MongoDB health so calls fail fast during an outage.
+
+    closed    -> normal operation; consecutive connection failures are counted
+    open      -> calls are refused immediately; a background probe pings MongoDB
+    half_open -> a probe is in flight; success closes the circuit, failure reopens it
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, ping, failure_threshold, reset_timeout):
+        self._ping = ping  # coroutine function used by the health probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.total_failures = 0
+        self.times_opened = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probe_task = None
+
+    def allow(self):
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            logger.info("MongoDB circuit closed, database available again")
+            self.state = self.CLOSED
+            metrics.incr("db_circuit_closed")
+
+    def record_failure(self, error):
+        self.consecutive_failures += 1
+        self.total_failures += 1
+        self.last_error = str(error)
+        metrics.incr("db_connection_failures")
+        if self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = time.time()
+        self.times_opened += 1
+        metrics.incr("db_circuit_opened")
+        logger.warning(
+            f"MongoDB circuit opened after {self.consecutive_failures} failures: {self.last_error}"
+        )
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def _probe_loop(self):
+        """Ping MongoDB in the background until it answers, then close the circuit."""
+        while self.state != self.CLOSED:
+            await asyncio.sleep(self.reset_timeout)
+            self.state = self.HALF_OPEN
+            try:
+                await self._ping()
+                self.record_success()
+            except Exception as e:
+                self.last_error = str(e)
+                self.total_failures += 1
+                self.state = self.OPEN
+                self.opened_at = time.time()
+                logger.debug(f"MongoDB health probe failed: {e}")
+
+    def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def get_stats(self, detailed=False):
+        stats = {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "times_opened": self.times_opened,
+            "open_for_seconds": int(time.time() - self.opened_at) if self.state != self.CLOSED and self.opened_at else 0,
+        }
+        if detailed:
+            stats["last_error"] = self.last_error
+        return stats
+
 class Database:
     def __init__(self, uri, database_name):
+        self.counters = CounterBuffer(Config.DB_BUFFER_MAX_USERS)
+        self._flush_task = None
+        self._flush_lock = None
         try:
             self._client = motor.motor_asyncio.AsyncIOMotorClient(
                 uri,
@@ -19,30 +167,111 @@ class Database:
             )
             self.db = self._client[database_name]
             self.col = self.db.users
+            self.files = self.db.files  # Bin-channel file registry, one document per unique file
+            # Counters are best-effort stats: acknowledge on the primary only
+            self._counter_col = self.col.with_options(write_concern=WriteConcern(w=1))
             self.connected = True
-            self._connection_checked = False
         except Exception as e:
             logger.error(f"Failed to initialize MongoDB client: {e}")
             self.connected = False
-            self._connection_checked = True
+        self.breaker = CircuitBreaker(
+            self._ping, Config.DB_FAILURE_THRESHOLD, Config.DB_RESET_TIMEOUT
+        )
+
+    async def _ping(self):
+        await self._client.admin.command('ping')
 
     async def _check_connection(self):
-        """Check connection status once and cache result"""
-        if self._connection_checked:
-            return self.connected
-        
+        """Fast check used before every operation: False while the circuit is open"""
+        return self.connected and self.breaker.allow()
+
+    async def _guard(self, awaitable):
+        """Await a MongoDB operation, feeding the outcome to the circuit breaker"""
         try:
-            # Quick ping to verify connection
-            await self._client.admin.command('ping')
-            self.connected = True
-            self._connection_checked = True
-            logger.info("MongoDB connection verified")
+            result = await awaitable
+        except ConnectionFailure as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return result
+
+    # name -> (key pattern, options); every lookup filters on 'id'
+    REQUIRED_INDEXES = {
+        'id_unique': ([('id', ASCENDING)], {'unique': True}),
+        'last_seen_desc': ([('last_seen', DESCENDING)], {}),
+    }
+
+    # Registry lookups are by unique file id (dedupe) and by bin message id (streaming)
+    FILE_INDEXES = {
+        'unique_id_unique': ([('unique_id', ASCENDING)], {'unique': True}),
+        'bin_msg_id': ([('bin_msg_id', ASCENDING)], {}),
+    }
+
+    # Non-unique index created while duplicate ids block 'id_unique'
+    FALLBACK_ID_INDEX = 'id_1'
+
+    async def ensure_indexes(self):
+        """Create the indexes the users collection relies on (idempotent, run at startup).
+        Without the unique index on 'id' every lookup is a collection scan and
+        add_user's duplicate-key detection can never fire."""
+        try:
+            if not await self._check_connection():
+                return False
         except Exception as e:
-            logger.warning(f"MongoDB not available: {e}")
-            self.connected = False
-            self._connection_checked = True
-        
-        return self.connected
+            logger.error(f"Error ensuring MongoDB indexes: {e}")
+            return False
+
+        ok = True
+        try:
+            existing = await self._guard(self.col.index_information())
+            for name, (keys, options) in self.REQUIRED_INDEXES.items():
+                if name in existing:
+                    continue
+                unique_id_index = options.get('unique') and keys == [('id', ASCENDING)]
+                if unique_id_index and self.FALLBACK_ID_INDEX in existing:
+                    # Same key as the fallback: MongoDB refuses a second index on it (not code 11000)
+                    await self._guard(self.col.drop_index(self.FALLBACK_ID_INDEX))
+                try:
+                    await self._guard(self.col.create_index(keys, name=name, background=True, **options))
+                except (DuplicateKeyError, OperationFailure) as e:
+                    if not unique_id_index or getattr(e, 'code', None) != 11000:
+                        raise
+                    # Existing duplicate ids block the unique index; index lookups anyway
+                    logger.error(
+                        "Duplicate user ids prevent a unique index on users.id; "
+                        "creating a non-unique index. Remove duplicates and restart to enforce uniqueness."
+                    )
+                    await self._guard(self.col.create_index(keys, name=self.FALLBACK_ID_INDEX, background=True))
+            report = await self.check_indexes()
+            if report['missing']:
+                logger.warning(f"Users collection is missing indexes: {', '.join(report['missing'])}")
+            else:
+                logger.info("MongoDB indexes verified")
+        except Exception as e:
+            logger.error(f"Error ensuring MongoDB user indexes: {e}")
+            ok = False
+
+        # Independent of the users collection: a failure there must not leave the registry unindexed
+        try:
+            for name, (keys, options) in self.FILE_INDEXES.items():
+                await self._guard(self.files.create_index(keys, name=name, background=True, **options))
+        except Exception as e:
+            logger.error(f"Error ensuring MongoDB file registry indexes: {e}")
+            ok = False
+        return ok
+
+    async def check_indexes(self):
+        """Report which required indexes are missing from the users collection"""
+        existing = await self._guard(self.col.index_information())
+        missing = []
+        for name, (keys, options) in self.REQUIRED_INDEXES.items():
+            found = any(
+                info.get('key') == keys and bool(info.get('unique')) == bool(options.get('unique'))
+                for info in existing.values()
+            )
+            if not found:
+                missing.append(f"{name} {keys}")
+        return {'existing': sorted(existing), 'missing': missing}
 
     def new_user(self, id, user_data=None):
         from datetime import datetime
@@ -67,7 +296,7 @@ class Database:
                 return False
             user = self.new_user(id, user_data)
             # Use insert_one without waiting for acknowledgment for speed
-            await self.col.insert_one(user)
+            await self._guard(self.col.insert_one(user))
             return True
         except Exception as e:
             # Don't log every duplicate key error
@@ -79,126 +308,233 @@ class Database:
         try:
             if not await self._check_connection():
                 return False
-            user = await self.col.find_one({'id': int(id)})
+            # Covered by the id index: projecting only 'id' (no _id) avoids fetching the document
+            user = await self._guard(self.col.find_one({'id': int(id)}, {'id': 1, '_id': 0}))
             return True if user else False
         except Exception as e:
             logger.error(f"Error checking user existence in MongoDB: {e}")
             return False
 
-    async def total_users_count(self):
+    async def total_users_count(self, include_blocked=True):
         try:
             if not await self._check_connection():
                 return 0
-            count = await self.col.count_documents({})
+            query = {} if include_blocked else {'blocked': {'$ne': True}}
+            count = await self._guard(self.col.count_documents(query))
             return count
         except Exception as e:
             logger.error(f"Error counting users in MongoDB: {e}")
             return 0
 
+    async def iter_user_ids(self, batch_size=1000, after=None, include_blocked=True):
+        """Yield user IDs in ascending batches without loading the whole collection.
+
+        Pages are keyset queries on the id index ('id' > last id seen), so each
+        batch is a short indexed range scan, duplicate ids are skipped across
+        page boundaries, and iteration can resume from a saved id via `after`.
+        If MongoDB is unavailable before the first batch, yields nothing so the
+        caller can fall back to the local store; once batches have been
+        yielded, a failure is raised so the caller keeps its resume cursor
+        instead of mistaking a partial stream for the end.
+        """
+        last_id = after
+        yielded = False
+        while True:
+            try:
+                if not await self._check_connection():
+                    if yielded:
+                        raise ConnectionError("MongoDB not available")
+                    return
+                query = {} if last_id is None else {'id': {'$gt': last_id}}
+                if not include_blocked:
+                    query['blocked'] = {'$ne': True}
+                cursor = self.col.find(query, {'id': 1, '_id': 0}).sort('id', ASCENDING).limit(batch_size)
+                docs = await self._guard(cursor.to_list(length=batch_size))
+            except Exception as e:
+                logger.error(f"Error streaming user IDs from MongoDB after id {last_id}: {e}")
+                if yielded:
+                    raise
+                return
+            if not docs:
+                return
+            batch = []
+            for doc in docs:
+                if doc['id'] != last_id:  # Duplicates are adjacent when sorted by id
+                    batch.append(doc['id'])
+                    last_id = doc['id']
+            yielded = True
+            yield batch
+            if len(docs) < batch_size:
+                return
+
     async def get_all_users(self):
-        """Get list of all user IDs"""
-        try:
-            if not await self._check_connection():
-                return []
-            users = []
-            # Use projection to only fetch IDs for speed
-            async for user in self.col.find({}, {'id': 1, '_id': 0}):
-                users.append(user['id'])
-            return list(set(users))
-        except Exception as e:
-            logger.error(f"Error getting all users from MongoDB: {e}")
-            return []
+        """Get list of all user IDs (prefer iter_user_ids for large collections)"""
+        users = []
+        async for batch in self.iter_user_ids():
+            users.extend(batch)
+        return users
+
+    def _ensure_flusher(self):
+        """Start the periodic flush task on first use (needs a running loop)."""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_lock = self._flush_lock or asyncio.Lock()
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(Config.DB_FLUSH_INTERVAL)
+            await self.flush_counters()
+
+    def _buffered(self):
+        """Common bookkeeping after buffering an update."""
+        self._ensure_flusher()
+        if len(self.counters) >= self.counters.max_users and not self._flush_lock.locked():
+            # Bound memory: flush early instead of growing without limit
+            asyncio.create_task(self.flush_counters())
+
+    async def flush_counters(self):
+        """Write all buffered counter/activity updates as a single bulk_write."""
+        if not len(self.counters):
+            return True
+        async with self._flush_lock:
+            ops, incs, sets = self.counters.drain()
+            if not ops:
+                return True
+            try:
+                if not await self._check_connection():
+                    raise ConnectionError("MongoDB not available")
+                await self._guard(self._counter_col.bulk_write(ops, ordered=False))
+                metrics.incr("db_counter_flushes")
+                metrics.incr("db_counter_updates", len(ops))
+                return True
+            except Exception as e:
+                logger.error(f"Error flushing {len(ops)} buffered user updates: {e}")
+                metrics.incr("db_counter_flush_errors")
+                self.counters.restore(incs, sets)
+                return False
+
+    async def close(self):
+        """Stop the flusher and write out anything still buffered (call on shutdown)."""
+        if self._flush_task is not None:
+            # Cancel only while holding the flush lock: a flusher cancelled inside
+            # bulk_write would have drained the buffer without writing or restoring it
+            async with self._flush_lock:
+                self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._flush_lock is not None:
+            await self.flush_counters()
+        self.breaker.stop()
 
     async def update_user_activity(self, user_id, user_data=None):
-        """Update user's last seen and optionally their profile data"""
+        """Update user's last seen and optionally their profile data (buffered)"""
+        update_data = {'last_seen': datetime.now()}
+        
+        if user_data:
+            for field in ('username', 'first_name', 'last_name', 'is_premium', 'language_code'):
+                if field in user_data:
+                    update_data[field] = user_data[field]
+        
+        self.counters.set(int(user_id), update_data)
+        self._buffered()
+        return True
+
+    async def increment_streams(self, user_id, count=1):
+        """Increment user's total streams counter (buffered)"""
+        self.counters.inc(int(user_id), 'total_streams', count)
+        self._buffered()
+        return True
+
+    async def increment_files(self, user_id, count=1):
+        """Increment user's total files counter (buffered)"""
+        self.counters.inc(int(user_id), 'total_files', count)
+        self._buffered()
+        return True
+
+    async def increment_batch_requests(self, user_id, count=1):
+        """Increment user's total batch requests counter (buffered)"""
+        self.counters.inc(int(user_id), 'total_batch_requests', count)
+        self._buffered()
+        return True
+
+    async def mark_users_blocked(self, user_ids):
+        """Flag users who blocked the bot or deleted their account (one bulk update)"""
         try:
             if not await self._check_connection():
                 return False
-            from datetime import datetime
-            update_data = {'last_seen': datetime.now()}
-            
-            if user_data:
-                if 'username' in user_data:
-                    update_data['username'] = user_data['username']
-                if 'first_name' in user_data:
-                    update_data['first_name'] = user_data['first_name']
-                if 'last_name' in user_data:
-                    update_data['last_name'] = user_data['last_name']
-                if 'is_premium' in user_data:
-                    update_data['is_premium'] = user_data['is_premium']
-                if 'language_code' in user_data:
-                    update_data['language_code'] = user_data['language_code']
-            
-            await self.col.update_one(
-                {'id': int(user_id)},
-                {'$set': update_data}
-            )
+            await self._guard(self.col.update_many(
+                {'id': {'$in': [int(uid) for uid in user_ids]}},
+                {'$set': {'blocked': True, 'blocked_at': datetime.now()}}
+            ))
             return True
         except Exception as e:
-            logger.error(f"Error updating user activity: {e}")
+            logger.error(f"Error marking {len(user_ids)} users as blocked: {e}")
             return False
 
-    async def increment_streams(self, user_id):
-        """Increment user's total streams counter"""
+    async def get_user_details(self, user_id):
+        """Get detailed user information"""
         try:
             if not await self._check_connection():
-                return False
-            await self.col.update_one(
-                {'id': int(user_id)},
-                {'$inc': {'total_streams': 1}}
-            )
-            return True
+                return None
+            user = await self._guard(self.col.find_one({'id': int(user_id)}))
+            return self.counters.overlay(int(user_id), user)
         except Exception as e:
-            logger.error(f"Error incrementing streams: {e}")
-            return False
+            logger.error(f"Error getting user details: {e}")
+            return None
 
-    async def increment_files(self, user_id):
-        """Increment user's total files counter"""
+    async def delete_user(self, user_id):
         try:
             if not await self._check_connection():
                 return False
-            await self.col.update_one(
-                {'id': int(user_id)},
-                {'$inc': {'total_files': 1}}
-            )
+            await self._guard(self.col.delete_many({'id': int(user_id)}))
             return True
         except Exception as e:
-            logger.error(f"Error incrementing files: {e}")
+            logger.error(f"Error deleting user from MongoDB: {e}")
             return False
 
-    async def increment_batch_requests(self, user_id):
-        """Increment user's total batch requests counter"""
+    async def get_file_entry(self, unique_id=None, bin_msg_id=None):
+        """Find a file registry entry by unique file id or by its bin channel message id"""
         try:
             if not await self._check_connection():
-                return False
-            await self.col.update_one(
-                {'id': int(user_id)},
-                {'$inc': {'total_batch_requests': 1}}
-            )
-            return True
+                return None
+            query = {'unique_id': unique_id} if unique_id is not None else {'bin_msg_id': int(bin_msg_id)}
+            return await self._guard(self.files.find_one(query, {'_id': 0}))
         except Exception as e:
-            logger.error(f"Error incrementing batch requests: {e}")
-            return False
+            logger.error(f"Error reading file registry: {e}")
+            return None
 
-    async def get_user_details(self, user_id):
-        """Get detailed user information"""
+    async def save_file_entry(self, entry):
+        """Upsert a file registry entry; returns the stored entry (the first one wins on a race)"""
         try:
             if not await self._check_connection():
-                return None
-            user = await self.col.find_one({'id': int(user_id)})
-            return user
+                return entry
+            stored = await self._guard(self.files.find_one_and_update(
+                {'unique_id': entry['unique_id']},
+                {'$setOnInsert': entry},
+                upsert=True,
+                projection={'_id': 0},
+                return_document=ReturnDocument.AFTER,
+            ))
+            return stored or entry
         except Exception as e:
-            logger.error(f"Error getting user details: {e}")
-            return None
+            logger.error(f"Error saving file registry entry: {e}")
+            return entry
 
-    async def delete_user(self, user_id):
+    async def refresh_file_entry(self, unique_id, file_id):
+        """Store a freshly resolved file_id (new file_reference) for a registry entry"""
         try:
             if not await self._check_connection():
                 return False
-            await self.col.delete_many({'id': int(user_id)})
+            await self._guard(self.files.update_one(
+                {'unique_id': unique_id},
+                {'$set': {'file_id': file_id, 'resolved_at': time.time()}}
+            ))
             return True
         except Exception as e:
-            logger.error(f"Error deleting user from MongoDB: {e}")
+            logger.error(f"Error refreshing file registry entry: {e}")
             return False
 
 db = None
@@ -208,7 +544,7 @@ if Config.DATABASE_URL:
         logger.info("MongoDB client initialized (connection will be verified on first use)")
     except Exception as e:
         logger.error(f"Failed to initialize MongoDB: {e}")
-        logger.warning("Falling back to JSON file storage")
+        logger.warning("Falling back to local SQLite user store")
         db = None
 else:
-    logger.warning("DATABASE_URL not found! Using JSON file storage (not recommended for production)")
+    logger.warning("DATABASE_URL not found! Using local SQLite user store (not recommended for production)")
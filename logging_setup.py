@@ -0,0 +1,168 @@
+"""
+Telegram VLC Stream Bot - Logging Setup
+Copyright (c) 2025 Akhil TG. All Rights Reserved.
+
+Log calls only enqueue the record; a QueueListener thread does the
+formatting and the file/console writes, so a slow disk or a flood of
+logs never stalls the event loop. Repetitive per-request messages are
+rate-limited per call site, and each record carries the request id of
+the stream it was logged for.
+"""
+
+import sys
+import json
+import time
+import queue
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from config import Config
+from server.tracing import RequestIdFilter
+
+LOG_FILE = "bot.log"
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Attributes every LogRecord has; anything else was passed via extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any extra= fields included"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `limit` records per call site through every `window` seconds.
+
+    A call site is (logger, message template), so lazy %-style calls such as
+    logger.info("Stream request: %s/%s", chat_id, msg_id) share one budget no
+    matter the arguments. Warnings and errors are never dropped. The first
+    record after a suppressed burst notes how many were dropped.
+    """
+
+    def __init__(self, limit, window):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sites = {}  # (logger, template) -> [window_start, passed, suppressed]
+        self.suppressed_total = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.limit or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self.sites[key] = [now, 1, 0]
+                if len(self.sites) > 10000:
+                    self.sites.clear()  # Templates built with f-strings never repeat
+                if suppressed:
+                    record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+                    record.args = None
+                return True
+            if site[1] < self.limit:
+                site[1] += 1
+                return True
+            site[2] += 1
+            self.suppressed_total += 1
+            return False
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() formats the message (and any traceback) on the calling
+    thread so records can be pickled; the listener here is in-process, so the
+    record is enqueued as is. Arguments must not be mutated after logging.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class NamedQueueListener(QueueListener):
+    """QueueListener on a thread it creates and names, so the CPU profiler can skip it"""
+
+    _STOP = object()
+
+    def __init__(self, log_queue, *handlers, thread_name="log-listener", respect_handler_level=False):
+        super().__init__(log_queue, *handlers, respect_handler_level=respect_handler_level)
+        self.thread_name = thread_name
+        self.worker = None
+
+    def start(self):
+        self.worker = threading.Thread(target=self._drain, name=self.thread_name, daemon=True)
+        self.worker.start()
+
+    def enqueue_sentinel(self):
+        self.queue.put_nowait(self._STOP)
+
+    def stop(self):
+        """Write everything queued so far, then end the thread"""
+        if self.worker is not None:
+            self.enqueue_sentinel()
+            self.worker.join()
+            self.worker = None
+
+    def _drain(self):
+        while True:
+            record = self.dequeue(True)
+            if record is self._STOP:
+                break
+            self.handle(record)
+
+
+def setup_logging(log_file=LOG_FILE, stream=None):
+    """Route all logging through a queue to a background writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if Config.LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler(stream or sys.stderr)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(Config.LOG_RATE_LIMIT, Config.LOG_RATE_WINDOW))
+    # Context variables are only visible on the calling thread, so stamp before enqueueing
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(Config.LOG_LEVEL)
+
+    _listener = NamedQueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
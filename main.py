@@ -11,17 +11,19 @@ import uvicorn
 from fastapi import FastAPI
 from bot_client import bot
 from server.routes_improved import router
+from server.byte_streamer import get_byte_streamer
+from server.admin_routes import router as admin_router
+from server import session_manager, tracing
+from server.job_queue import jobs
+from server.loop_monitor import loop_monitor
+from server.access_trace import recorder as access_recorder
+from server.cache_warmer import cache_warmer
+from database import db
 from config import Config
+from logging_setup import setup_logging, stop_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (file and console writes happen on a background thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 from contextlib import asynccontextmanager
@@ -43,6 +45,7 @@ async def lifespan(app: FastAPI):
                     bot.boot_status = f"Connecting... (Attempt {attempt + 1})"
                     await bot.start()
                     bot.boot_status = "Online"
+                    session_manager.start()
                     logger.info("Bot Started in Background Loop")
                     print("Bot Started in Background Loop")
                     break
@@ -66,9 +69,23 @@ async def lifespan(app: FastAPI):
 
         # Start bot in background so Uvicorn can start immediately
         asyncio.create_task(start_bot_background())
+        jobs.start()
+        loop_monitor.start()
+        cache_warmer.start(get_byte_streamer)
+
+        if db:
+            asyncio.create_task(db.ensure_indexes())
     
     yield
     
+    session_manager.stop()
+    loop_monitor.stop()
+    cache_warmer.stop()
+    # Let queued side effects (stats, log posts) finish before the DB flush
+    await jobs.drain()
+    if db:
+        # Flush buffered user counters before the loop goes away
+        await db.close()
     try:
         await bot.stop()
         print("Bot Stopped")
@@ -81,6 +98,9 @@ async def lifespan(app: FastAPI):
             print(f"Bot shutdown error: {e}")
     except Exception as e:
         print(f"Bot shutdown error (can be ignored): {e}")
+    tracing.shutdown()
+    access_recorder.close()
+    stop_logging()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -89,6 +109,7 @@ from server.error_handler import AIErrorMiddleware
 app.add_middleware(AIErrorMiddleware)
 
 app.include_router(router)
+app.include_router(admin_router)
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -2,38 +2,29 @@ import os
 import sys
 import time
 import asyncio
+import io
 import logging
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated
+from pyrogram.errors import FloodWait
 from config import Config
 from database import db
+# Fallback local storage if DB is not available
+from user_store import local_users
+from asset_registry import asset_registry
+from server.job_queue import jobs
+from server.profiler import ProfilerBusy, memory_tracer, profiler, top_frames
+from server.popularity import popularity
+from server.cache_warmer import WarmJobRejected, cache_warmer, parse_warm_target
+from server.chunk_cache import chunk_cache
+import broadcast as broadcast_engine
+from broadcast import Broadcast, start_broadcast
 
 logger = logging.getLogger(__name__)
 
-# Fallback JSON storage if DB is not available
-import json
-USERS_FILE = "users.json"
-
 # Store broadcast state
 broadcast_state = {}
 
-def load_users_local():
-    if os.path.exists(USERS_FILE):
-        try:
-            with open(USERS_FILE, "r") as f:
-                return set(json.load(f))
-        except:
-            return set()
-    return set()
-
-def save_user_local(user_id):
-    users = load_users_local()
-    if user_id not in users:
-        users.add(user_id)
-        with open(USERS_FILE, "w") as f:
-            json.dump(list(users), f)
-
 async def add_user(user_id, user_obj=None, client=None):
     """Add user without blocking - runs in background"""
     try:
@@ -54,8 +45,7 @@ async def add_user(user_id, user_obj=None, client=None):
             if await db.add_user(user_id, user_data):
                 is_new = True
         else:
-            if user_id not in load_users_local():
-                save_user_local(user_id)
+            if await local_users.add(user_id):
                 is_new = True
         
         # Log new user if configured
@@ -78,42 +68,47 @@ async def add_user(user_id, user_obj=None, client=None):
             logger.error(f"Error adding user {user_id}: {e}")
         # Fallback to local storage on any error
         try:
-            save_user_local(user_id)
+            await local_users.add(user_id)
         except:
             pass  # Silent fail for user tracking
 
-async def get_users_count():
+async def get_users_count(include_blocked=True):
     try:
         if db:
-            count = await db.total_users_count()
+            count = await db.total_users_count(include_blocked)
             # If MongoDB returns 0 but we have local users, use local count
             if count == 0:
-                local_count = len(load_users_local())
-                return local_count if local_count > 0 else 0
+                return len(local_users)
             return count
         else:
-            return len(load_users_local())
+            return len(local_users)
     except Exception as e:
         logger.error(f"Error getting user count: {e}")
         # Fallback to local storage
-        return len(load_users_local())
+        return len(local_users)
 
-async def get_all_users():
-    """Get list of all user IDs"""
-    try:
-        if db:
-            users = await db.get_all_users()
-            # If MongoDB returns empty but we have local users, use local
-            if not users:
-                local_users = list(load_users_local())
-                return local_users if local_users else []
-            return users
-        else:
-            return list(load_users_local())
-    except Exception as e:
-        logger.error(f"Error getting all users: {e}")
-        # Fallback to local storage
-        return list(load_users_local())
+async def iter_all_users(batch_size=1000, after=None, include_blocked=True):
+    """Yield user IDs in ascending batches, from MongoDB or the local store.
+
+    Falls back to the local store only if MongoDB yields nothing; a failure
+    after the first batch propagates so a broadcast stays resumable."""
+    streamed = False
+    if db:
+        async for batch in db.iter_user_ids(batch_size, after, include_blocked):
+            streamed = True
+            yield batch
+    if streamed:
+        return
+    # MongoDB not configured, down or empty: use local storage
+    ids = sorted(uid for uid in local_users.all_ids() if after is None or uid > after)
+    for i in range(0, len(ids), batch_size):
+        yield ids[i:i + batch_size]
+
+async def user_exists(user_id):
+    """Indexed existence check instead of scanning every user ID"""
+    if db and await db.is_user_exist(user_id):
+        return True
+    return user_id in local_users
 
 # Admin Filter
 def is_admin(user_id):
@@ -190,11 +185,14 @@ async def admin_callbacks(client: Client, callback_query: CallbackQuery):
         )
         
     elif data == "admin_users":
-        users = await get_all_users()
-        users_count = len(users)
+        users_count = await get_users_count()
         
         # Show first 20 users
-        user_list = "\n".join([f"• `{uid}`" for uid in users[:20]])
+        users = []
+        async for batch in iter_all_users(batch_size=20):
+            users = batch
+            break
+        user_list = "\n".join([f"• `{uid}`" for uid in users])
         
         text = (
             f"👥 **User List** (Total: {users_count})\n\n"
@@ -418,7 +416,7 @@ async def close_admin(client: Client, callback_query: CallbackQuery):
 # Handle admin state-based messages (exclude media files for auto_stream)
 @Client.on_message(
     filters.private & 
-    ~filters.command(["start", "help", "about", "stream", "batch", "admin", "cancel"]) &
+    ~filters.command(["start", "help", "about", "stream", "batch", "admin", "cancel", "resume_broadcast", "stop_broadcast", "perf", "popular", "warm"]) &
     ~filters.document & ~filters.video & ~filters.audio  # Don't catch media files
 )
 async def handle_admin_input(client: Client, message: Message):
@@ -578,8 +576,7 @@ async def handle_admin_input(client: Client, message: Message):
                 
             except Exception as e:
                 # User not found on Telegram or error fetching
-                users = await get_all_users()
-                if search_id in users:
+                if await user_exists(search_id):
                     # User exists in DB but can't fetch from Telegram
                     user_db_data = None
                     if db:
@@ -654,6 +651,9 @@ async def handle_admin_input(client: Client, message: Message):
         try:
             file_path = f"assets/{caption}.png"
             await message.download(file_path)
+            # Reuse the admin's upload as the banner's file_id: no re-upload on /start
+            asset_registry.invalidate(file_path)
+            asset_registry.remember(file_path, message)
             
             await message.reply_text(
                 f"✅ **Banner Updated!**\n\n"
@@ -691,59 +691,265 @@ async def confirm_broadcast(client: Client, callback_query: CallbackQuery):
         await callback_query.answer("❌ Message not found!", show_alert=True)
         return
     
+    if current_broadcast_running():
+        await callback_query.answer("⚠️ A broadcast is already running!", show_alert=True)
+        return
+    
     await callback_query.edit_message_text("📢 **Broadcasting...**\n\nPlease wait...")
     
-    # Get all users
-    users = await get_all_users()
+    job = Broadcast.new(
+        client,
+        from_chat_id=broadcast_msg.chat.id,
+        message_id=broadcast_msg.id,
+        status_chat_id=callback_query.message.chat.id,
+        status_message_id=callback_query.message.id,
+    )
+    # Run in background so this handler does not hold a worker for the whole broadcast
+    asyncio.create_task(run_broadcast(job))
+
+
+def current_broadcast_running():
+    return broadcast_engine.current_broadcast is not None
+
+
+async def run_broadcast(job):
+    # Users are streamed from the checkpoint cursor in batches, never held in memory at once
+    batches = iter_all_users(Config.BROADCAST_BATCH_SIZE, job.state["cursor"], include_blocked=False)
+    try:
+        total = await get_users_count(include_blocked=False)
+        await start_broadcast(job, batches, total)
+    except Exception as e:
+        logger.exception(f"Broadcast failed: {e}")
+
+
+@Client.on_message(filters.command("resume_broadcast") & filters.private)
+async def resume_broadcast(client: Client, message: Message):
+    """Resume a broadcast interrupted by a restart or /stop_broadcast"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    if current_broadcast_running():
+        await message.reply_text("⚠️ A broadcast is already running.")
+        return
     
-    success = 0
-    failed = 0
-    blocked = 0
+    job = Broadcast.load_checkpoint(client)
+    if job is None:
+        await message.reply_text("ℹ️ No interrupted broadcast to resume.")
+        return
+    
+    status = await message.reply_text(job.progress_text())
+    job.state["status_chat_id"] = status.chat.id
+    job.state["status_message_id"] = status.id
     
-    for user_id in users:
+    asyncio.create_task(run_broadcast(job))
+
+
+@Client.on_message(filters.command("stop_broadcast") & filters.private)
+async def stop_broadcast(client: Client, message: Message):
+    """Pause the running broadcast (resumable), or discard a saved one"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    job = broadcast_engine.current_broadcast
+    if job is not None:
+        job.cancelled = True
+        await message.reply_text("⏸️ Broadcast paused. Send /resume_broadcast to continue.")
+    elif Broadcast.load_checkpoint(client) is not None:
+        Broadcast.clear_checkpoint()
+        await message.reply_text("🗑️ Saved broadcast discarded.")
+    else:
+        await message.reply_text("ℹ️ No broadcast to stop.")
+
+
+PERF_USAGE = (
+    "**Usage:**\n"
+    "`/perf cpu [seconds]` - sampling CPU profile (collapsed stacks)\n"
+    "`/perf mem start|snapshot|diff|stop` - tracemalloc allocation sites"
+)
+
+
+@Client.on_message(filters.command("perf") & filters.private)
+async def perf_command(client: Client, message: Message):
+    """CPU profiles and tracemalloc snapshots of the running node"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    args = message.command[1:]
+    if not args:
+        await message.reply_text(PERF_USAGE)
+        return
+    
+    if args[0] == "cpu":
         try:
-            await broadcast_msg.copy(user_id)
-            success += 1
-            
-            # Update progress every 10 users
-            if success % 10 == 0:
-                await callback_query.edit_message_text(
-                    f"📢 **Broadcasting...**\n\n"
-                    f"✅ Success: {success}\n"
-                    f"❌ Failed: {failed}\n"
-                    f"🚫 Blocked: {blocked}\n"
-                    f"📊 Progress: {success + failed + blocked}/{len(users)}"
-                )
-            
-            await asyncio.sleep(0.05)  # Avoid flood
-            
-        except (UserIsBlocked, InputUserDeactivated):
-            blocked += 1
-        except FloodWait as e:
-            await asyncio.sleep(e.value)
+            seconds = float(args[1]) if len(args) > 1 else 10
+        except ValueError:
+            await message.reply_text(PERF_USAGE)
+            return
+        seconds = min(seconds, Config.PROFILE_MAX_SECONDS)
+        status = await message.reply_text(f"⏱️ Profiling for {seconds:g}s...")
+        try:
+            collapsed = await profiler.profile(seconds)
+        except ProfilerBusy:
+            await status.edit_text("⚠️ A CPU profile is already running.")
+            return
+        summary = profiler.last_summary
+        hot = "\n".join(top_frames(collapsed, 10)) or "no samples"
+        document = io.BytesIO(collapsed.encode())
+        document.name = f"cpu_profile_{int(time.time())}.collapsed"
+        await message.reply_document(
+            document,
+            caption=f"🔥 {summary['samples']} samples over {summary['seconds']}s (flamegraph.pl / speedscope)"
+        )
+        await status.edit_text(f"**Hottest frames:**\n```\n{hot[:3500]}\n```")
+        return
+    
+    if args[0] == "mem" and len(args) > 1:
+        action = args[1]
+        if action == "start":
+            memory_tracer.start()
+            await message.reply_text("🧠 tracemalloc started. Use `/perf mem snapshot` or `/perf mem diff`.")
+        elif action == "stop":
+            memory_tracer.stop()
+            await message.reply_text("🧠 tracemalloc stopped.")
+        elif action in ("snapshot", "diff"):
             try:
-                await broadcast_msg.copy(user_id)
-                success += 1
-            except:
-                failed += 1
-        except Exception as e:
-            failed += 1
-            logger.error(f"Broadcast error for user {user_id}: {e}")
-    
-    # Final report
-    await callback_query.edit_message_text(
-        f"✅ **Broadcast Complete!**\n\n"
-        f"📊 **Results:**\n"
-        f"✅ Success: {success}\n"
-        f"❌ Failed: {failed}\n"
-        f"🚫 Blocked: {blocked}\n"
-        f"📈 Total: {len(users)}\n\n"
-        f"Success Rate: {(success/len(users)*100):.1f}%"
+                result = await asyncio.to_thread(getattr(memory_tracer, action), 15)
+            except RuntimeError as e:
+                await message.reply_text(f"⚠️ {e}")
+                return
+            if action == "diff":
+                if result["baseline_taken"]:
+                    await message.reply_text("🧠 Baseline taken. Run `/perf mem diff` again later.")
+                    return
+                lines = [f"{e['size_diff_bytes'] / 1024:+10.1f} KiB  {e['site']}" for e in result["top"]]
+            else:
+                lines = [f"{e['size_bytes'] / 1024:10.1f} KiB  {e['site']}" for e in result["top"]]
+                lines.insert(0, f"traced {result['traced_bytes'] / 1048576:.1f} MiB, peak {result['peak_bytes'] / 1048576:.1f} MiB")
+            await message.reply_text("```\n" + "\n".join(lines)[:3900] + "\n```")
+        else:
+            await message.reply_text(PERF_USAGE)
+        return
+    
+    await message.reply_text(PERF_USAGE)
+
+
+@Client.on_message(filters.command("popular") & filters.private)
+async def popular_command(client: Client, message: Message):
+    """Trending files, as seen by the popularity tracker and cache warmer"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    top = popularity.top()
+    if not top:
+        await message.reply_text("ℹ️ No streams or links recorded yet.")
+        return
+    
+    lines = ["🔥 **Trending files**\n"]
+    for rank, entry in enumerate(top, 1):
+        name = entry.get("file_name") or str(entry["file_key"])
+        lines.append(
+            f"{rank}. `{name[:40]}` - score {entry['score']:g} "
+            f"({entry.get('streams', 0)} views, {entry.get('links', 0)} links)"
+        )
+    
+    cache = chunk_cache.get_stats()
+    warmer = cache_warmer.get_stats()
+    lines.append(
+        f"\n💾 Cache: {cache['size_bytes'] / 1048576:.0f}/{cache['capacity_bytes'] / 1048576:.0f} MiB, "
+        f"byte hit ratio {cache['byte_hit_ratio'] * 100:.1f}%"
+    )
+    lines.append(
+        f"🌡️ Warmer: {warmer['bytes_warmed'] / 1048576:.0f} MiB warmed in {warmer['cycles']} cycles, "
+        f"{warmer['skipped_busy']} skipped while busy"
     )
+    await message.reply_text("\n".join(lines)[:4000])
+
+
+WARM_USAGE = (
+    "**Usage:**\n"
+    "`/warm <link> [last_link] [MB]` - pre-download the first MB (default {mb}) "
+    "and the tail of each file into the cache\n"
+    "`/warm <t.me/c/123/10-20> [MB]` - same, for a message range\n"
+    "`/warm status` - recent jobs\n"
+    "`/warm cancel <id>` - stop a running job, or release a finished one's cache hold"
+)
+
+
+@Client.on_message(filters.command("warm") & filters.private)
+async def warm_command(client: Client, message: Message):
+    """Pre-download files of a scheduled premiere into the chunk cache"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    args = message.command[1:]
+    usage = WARM_USAGE.format(mb=Config.WARM_JOB_MB)
+    if not args:
+        await message.reply_text(usage)
+        return
+    
+    if args[0] == "status":
+        if not cache_warmer.jobs:
+            await message.reply_text("ℹ️ No warm jobs yet.")
+            return
+        texts = [job.progress_text() for job in list(cache_warmer.jobs.values())[-5:]]
+        await message.reply_text("\n\n".join(texts)[:4000])
+        return
+    
+    if args[0] == "cancel":
+        if len(args) < 2 or not args[1].isdigit():
+            await message.reply_text(usage)
+            return
+        job = cache_warmer.jobs.get(int(args[1]))
+        if not cache_warmer.cancel_job(int(args[1])):
+            await message.reply_text(f"ℹ️ No running or holding warm job #{args[1]}.")
+        elif job.done:
+            await message.reply_text(f"🔓 Warm job #{args[1]} released; trending warm-up may resume.")
+        else:
+            await message.reply_text(f"⏹️ Warm job #{args[1]} stopping after its in-flight parts.")
+        return
+    
+    try:
+        chat, first, last = parse_warm_target(args[0])
+        rest = args[1:]
+        if rest and not rest[0].replace(".", "", 1).isdigit():
+            last_chat, _, last = parse_warm_target(rest[0])
+            if last_chat != chat:
+                raise WarmJobRejected("Both links must be from the same chat")
+            rest = rest[1:]
+        head_mb = float(rest[0]) if rest else None
+        job = cache_warmer.submit_job(chat, first, last, head_mb)
+    except ValueError:
+        await message.reply_text(usage)
+        return
+    except WarmJobRejected as e:
+        await message.reply_text(f"⚠️ {e}")
+        return
+    
+    status = await message.reply_text(job.progress_text())
+    # Report in the background so this handler does not hold a worker for the whole job
+    asyncio.create_task(report_warm_progress(status, job))
+
+
+async def report_warm_progress(status: Message, job):
+    last_text = None
+    while True:
+        await asyncio.sleep(Config.WARM_PROGRESS_INTERVAL)
+        done = job.done
+        text = job.progress_text()
+        if text != last_text:
+            try:
+                await status.edit_text(text)
+                last_text = text
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                logger.debug(f"Warm progress update failed: {e}")
+        if done:
+            return
 
 
 # Hook into start command to save users (non-blocking)
 @Client.on_message(filters.command("start"), group=-1)
 async def log_user(client: Client, message: Message):
     # Run user tracking in background without blocking the response
-    asyncio.create_task(add_user(message.from_user.id, message.from_user, client))
+    jobs.submit(add_user, message.from_user.id, message.from_user, client)
@@ -4,25 +4,33 @@ Copyright (c) 2025 Akhil TG. All Rights Reserved.
 
 Enhanced commands plugin with batch support, better link generation, and file info
 """
-import os
+import io
 import re
 import json
 import base64
 import logging
-import random
+import time
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, InputMediaPhoto
 from pyrogram.errors import FloodWait
 from config import Config
 from database import db
+from asset_registry import asset_registry, random_banner
+from server.byte_streamer import get_byte_streamer
+from server.job_queue import jobs
+from server.file_registry import file_registry
+from server.popularity import popularity
+from server import file_identity
 from urllib.parse import quote_plus
 import asyncio
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 print("Loading enhanced commands plugin...")
 
+# Telegram returns at most 200 messages per get_messages call
+MESSAGES_PER_PAGE = 200
+
 
 def get_file_info(media_msg: Message) -> dict:
     """Extract file information from message."""
@@ -72,9 +80,9 @@ async def start(client: Client, message: Message):
     """Start command with minimal colorful welcome message."""
     logger.info(f"Received /start from {message.from_user.id}")
     
-    # Update user activity
+    # Update user activity in the background
     if db:
-        await db.update_user_activity(message.from_user.id, {
+        jobs.submit(db.update_user_activity, message.from_user.id, {
             'username': message.from_user.username,
             'first_name': message.from_user.first_name,
             'last_name': message.from_user.last_name,
@@ -83,8 +91,7 @@ async def start(client: Client, message: Message):
         })
     
     # Random banner selection
-    banners = ["assets/banner.png", "assets/banner1.png", "assets/banner2.png", "assets/banner3.png"]
-    selected_banner = random.choice(banners)
+    selected_banner = random_banner()
     
     # Create inline keyboard buttons
     buttons = [
@@ -117,13 +124,13 @@ async def start(client: Client, message: Message):
         "_© 2025 Akhil TG_"
     )
     
-    # Send random banner with welcome message
+    # Send random banner with welcome message (uploaded once, then sent by file_id)
     try:
-        await message.reply_photo(
-            photo=selected_banner,
+        await asset_registry.send(selected_banner, lambda photo: message.reply_photo(
+            photo=photo,
             caption=welcome_text,
             reply_markup=InlineKeyboardMarkup(buttons)
-        )
+        ))
     except Exception as e:
         logger.error(f"Error sending banner: {e}")
         # Fallback to text-only message
@@ -235,28 +242,22 @@ async def generate_and_send_link(reply_to: Message, media_msg: Message):
         await reply_to.reply_text("❌ No media found in this message.")
         return
     
-    # Update user stats
-    if db:
-        await db.increment_streams(reply_to.from_user.id)
-        await db.increment_files(reply_to.from_user.id)
-    
-    # Log to channel
-    if Config.LOG_CHANNEL:
+    # Stream from the bin channel copy when configured (one stored copy per unique file)
+    source_chat_id, source_msg_id = media_msg.chat.id, media_msg.id
+    if file_registry.enabled:
         try:
-            log_text = (
-                "**#NEW_FILE_REQUEST**\n\n"
-                f"**User:** [{reply_to.from_user.first_name}](tg://user?id={reply_to.from_user.id})\n"
-                f"**ID:** `{reply_to.from_user.id}`\n"
-                f"**File Name:** `{file_info.get('file_name', 'Unknown')}`\n"
-                f"**File Size:** `{format_file_size(file_info.get('file_size', 0))}`\n"
-                f"**Mime Type:** `{file_info.get('mime_type', 'Unknown')}`"
-            )
-            await reply_to._client.send_message(Config.LOG_CHANNEL, log_text)
+            entry = await file_registry.register(media_msg)
+            if entry:
+                source_chat_id, source_msg_id = Config.BIN_CHANNEL, entry["bin_msg_id"]
         except Exception as e:
-            logger.error(f"Error sending log: {e}")
+            logger.error(f"Bin channel copy failed, linking the original message: {e}")
     
     # Generate stream link
-    stream_link = f"{Config.URL}/stream/{media_msg.chat.id}/{media_msg.id}"
+    stream_link = f"{Config.URL}/stream/{source_chat_id}/{source_msg_id}"
+    media = getattr(media_msg, media_msg.media.value)
+    unique_id = getattr(media, "file_unique_id", None)
+    if unique_id:
+        popularity.record_link(unique_id, source_chat_id, source_msg_id, file_info)
     file_name = file_info.get("file_name", "Unknown")
     file_size = file_info.get('file_size', 0)
     duration = file_info.get("duration", 0)
@@ -278,7 +279,7 @@ async def generate_and_send_link(reply_to: Message, media_msg: Message):
             InlineKeyboardButton("📥 Download", url=stream_link)
         ],
         [
-            InlineKeyboardButton("📋 Copy Link", callback_data=f"copy_{media_msg.chat.id}_{media_msg.id}")
+            InlineKeyboardButton("📋 Copy Link", callback_data=f"copy_{source_chat_id}_{source_msg_id}")
         ]
     ]
     
@@ -306,6 +307,34 @@ async def generate_and_send_link(reply_to: Message, media_msg: Message):
         reply_markup=InlineKeyboardMarkup(buttons),
         disable_web_page_preview=True
     )
+    
+    # Side effects run after the reply, on the background job queue
+    if db:
+        jobs.submit(record_link_stats, reply_to.from_user.id)
+    if Config.LOG_CHANNEL:
+        jobs.submit(post_file_log, reply_to._client, reply_to.from_user, file_info)
+
+
+async def record_link_stats(user_id: int):
+    """Update user stats (buffered in memory, flushed to MongoDB in the background)."""
+    await db.increment_streams(user_id)
+    await db.increment_files(user_id)
+
+
+async def post_file_log(client: Client, user, file_info: dict):
+    """Log a new file request to LOG_CHANNEL."""
+    try:
+        log_text = (
+            "**#NEW_FILE_REQUEST**\n\n"
+            f"**User:** [{user.first_name}](tg://user?id={user.id})\n"
+            f"**ID:** `{user.id}`\n"
+            f"**File Name:** `{file_info.get('file_name', 'Unknown')}`\n"
+            f"**File Size:** `{format_file_size(file_info.get('file_size', 0))}`\n"
+            f"**Mime Type:** `{file_info.get('mime_type', 'Unknown')}`"
+        )
+        await client.send_message(Config.LOG_CHANNEL, log_text)
+    except Exception as e:
+        logger.error(f"Error sending log: {e}")
 
 
 @Client.on_message(filters.command("batch"))
@@ -376,44 +405,80 @@ async def batch_command(client: Client, message: Message):
     
     total_messages = last_msg_id - first_msg_id + 1
     links_generated = []
+    timings = {}
     
     try:
-        for msg_id in range(first_msg_id, last_msg_id + 1):
-            try:
-                msg = await client.get_messages(first_chat_id, msg_id)
-                
-                if msg and msg.media:
-                    file_info = get_file_info(msg)
-                    stream_link = f"{Config.URL}/stream/{first_chat_id}/{msg_id}"
-                    
-                    links_generated.append({
-                        "message_id": msg_id,
-                        "file_name": file_info.get("file_name", "Unknown"),
-                        "file_size": file_info.get("file_size", 0),
-                        "stream_link": stream_link
-                    })
-                    
-                    # Update stats per file
-                    if db:
-                        await db.increment_files(message.from_user.id)
-                
-                # Update progress every 10 messages
-                if len(links_generated) % 10 == 0:
+        # Phase 1: fetch messages in pages of up to 200 ids, a few pages at a time
+        phase_start = time.monotonic()
+        streamer = await get_byte_streamer()
+        pages = [
+            list(range(page_start, min(page_start + MESSAGES_PER_PAGE, last_msg_id + 1)))
+            for page_start in range(first_msg_id, last_msg_id + 1, MESSAGES_PER_PAGE)
+        ]
+        semaphore = asyncio.Semaphore(Config.BATCH_FETCH_CONCURRENCY)
+        fetched = []
+        progress = {"scanned": 0, "last_edit": time.monotonic()}
+        
+        async def fetch_page(page_ids):
+            async with semaphore:
+                while True:
+                    try:
+                        msgs = await client.get_messages(first_chat_id, page_ids)
+                        break
+                    except FloodWait as e:
+                        await asyncio.sleep(e.value)
+                    except Exception as e:
+                        logger.error(f"Error fetching messages {page_ids[0]}-{page_ids[-1]}: {e}")
+                        msgs = []
+                        break
+            fetched.extend(msgs)
+            progress["scanned"] += len(page_ids)
+            
+            # Throttle progress edits by time, not by count
+            now = time.monotonic()
+            if now - progress["last_edit"] >= Config.BATCH_PROGRESS_INTERVAL:
+                progress["last_edit"] = now
+                try:
                     await sts.edit_text(
                         f"🔄 **Generating batch links...**\n\n"
-                        f"Progress: {len(links_generated)}/{total_messages}"
+                        f"Progress: {progress['scanned']}/{total_messages}"
                     )
-                
-            except FloodWait as e:
-                await asyncio.sleep(e.value)
-            except Exception as e:
-                logger.error(f"Error processing message {msg_id}: {e}")
+                except Exception:
+                    pass
+        
+        await asyncio.gather(*(fetch_page(page_ids) for page_ids in pages))
+        timings["fetch"] = time.monotonic() - phase_start
+        
+        # Phase 2: build links and pre-populate the stream metadata cache
+        phase_start = time.monotonic()
+        for msg in sorted(fetched, key=lambda m: m.id):
+            file_info = streamer.cache_message(msg)
+            if file_info is None:
                 continue
+            popularity.record_link(file_identity.file_key(msg.chat.id, msg.id), msg.chat.id, msg.id, file_info)
+            links_generated.append({
+                "message_id": msg.id,
+                "file_name": file_info["file_name"] or "Unknown",
+                "file_size": file_info["file_size"],
+                "stream_link": f"{Config.URL}/stream/{first_chat_id}/{msg.id}"
+            })
+        timings["build"] = time.monotonic() - phase_start
+        # Update stats once for the whole batch
+        if db and links_generated:
+            await db.increment_files(message.from_user.id, len(links_generated))
+        
+        # Phase 3: send the result
+        phase_start = time.monotonic()
+        timing_text = f"⏱️ Fetch: {timings['fetch']:.1f}s ({len(pages)} pages) • Build: {timings['build']:.2f}s"
+        
+        # One URL that opens the whole range in VLC
+        playlist_link = f"{Config.URL}/playlist/{first_chat_id}/{first_msg_id}/{last_msg_id}.m3u"
         
         # Create result file
         if links_generated:
             result_text = "✅ **Batch Links Generated!**\n\n"
-            result_text += f"**Total Files:** {len(links_generated)}\n\n"
+            result_text += f"**Total Files:** {len(links_generated)}\n{timing_text}\n\n"
+            result_text += f"📃 **Playlist:** `{playlist_link}`\n\n"
             
             for idx, link_data in enumerate(links_generated, 1):
                 result_text += (
@@ -422,23 +487,32 @@ async def batch_command(client: Client, message: Message):
                     f"   Link: `{link_data['stream_link']}`\n\n"
                 )
             
-            # If too long, save to file
+            # If too long, send as a file (built in memory, nothing written to disk)
             if len(result_text) > 4000:
-                file_name = f"batch_links_{message.from_user.id}.txt"
-                with open(file_name, "w", encoding="utf-8") as f:
-                    for link_data in links_generated:
-                        f.write(f"{link_data['file_name']}\n")
-                        f.write(f"{link_data['stream_link']}\n\n")
+                links_file = io.BytesIO("".join(
+                    f"{link_data['file_name']}\n{link_data['stream_link']}\n\n"
+                    for link_data in links_generated
+                ).encode("utf-8"))
+                links_file.name = f"batch_links_{message.from_user.id}.txt"
                 
                 await message.reply_document(
-                    file_name,
-                    caption=f"✅ **Batch Links Generated!**\n\n**Total Files:** {len(links_generated)}"
+                    links_file,
+                    caption=(
+                        f"✅ **Batch Links Generated!**\n\n**Total Files:** {len(links_generated)}\n{timing_text}\n\n"
+                        f"📃 **Playlist:** `{playlist_link}`"
+                    )
                 )
-                os.remove(file_name)
             else:
                 await sts.edit_text(result_text, disable_web_page_preview=True)
         else:
             await sts.edit_text("❌ No media files found in the specified range!")
+        timings["send"] = time.monotonic() - phase_start
+        
+        logger.info(
+            f"/batch {first_chat_id} {first_msg_id}-{last_msg_id}: {len(links_generated)} files, "
+            f"fetch {timings['fetch']:.2f}s ({len(pages)} pages), "
+            f"build {timings['build']:.3f}s, send {timings['send']:.2f}s"
+        )
     
     except Exception as e:
         logger.error(f"Batch generation error: {e}")
@@ -475,8 +549,7 @@ async def callback_handler(client: Client, callback_query: CallbackQuery):
 
     if data == "start":
         # Show welcome message again with random banner
-        banners = ["assets/banner.png", "assets/banner1.png", "assets/banner2.png", "assets/banner3.png"]
-        selected_banner = random.choice(banners)
+        selected_banner = random_banner()
         
         buttons = [
             [
@@ -507,13 +580,13 @@ async def callback_handler(client: Client, callback_query: CallbackQuery):
             "_© 2025 Akhil TG_"
         )
         
-        await callback_query.edit_message_media(
+        await asset_registry.send(selected_banner, lambda photo: callback_query.edit_message_media(
             media=InputMediaPhoto(
-                media=selected_banner,
+                media=photo,
                 caption=welcome_text
             ),
             reply_markup=InlineKeyboardMarkup(buttons)
-        )
+        ))
     
     elif data == "help":
         help_text = (
@@ -0,0 +1,192 @@
+"""
+Access Trace - Compact binary log of served byte ranges for replay and cache studies
+"""
+import os
+import queue
+import struct
+import hashlib
+import logging
+import threading
+from typing import Dict, Hashable, Iterator, NamedTuple, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TGAT"
+VERSION = 1
+HEADER = struct.Struct("<4sH")
+# ts, client, file, file_size, range_start, range_end, bytes_delivered
+RECORD = struct.Struct("<dQQQQQQ")
+
+
+class AccessRecord(NamedTuple):
+    """One stream request: the range asked for and how much of it was delivered."""
+
+    ts: float  # Unix time the request arrived
+    client: int  # Keyed hash of the client IP
+    file: int  # Hash of the canonical file key
+    file_size: int
+    range_start: int
+    range_end: int  # Inclusive
+    bytes_delivered: int
+
+
+def _hash64(data: bytes, key: bytes = b"") -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8, key=key).digest(), "little")
+
+
+def file_hash(file_key: Hashable) -> int:
+    """Stable 64-bit id of a canonical file key (unique_id or (chat_id, message_id))."""
+    return _hash64(repr(file_key).encode())
+
+
+class AccessTraceRecorder:
+    """
+    Appends one fixed-size record per finished stream to ACCESS_TRACE_PATH.
+
+    Records are packed on the event loop (a single struct.pack) and written
+    by a background thread. Client IPs are never stored: they are hashed
+    with a salt that is random per process unless ACCESS_TRACE_SALT is set,
+    so clients can be told apart within a trace but not identified.
+    """
+
+    def __init__(self, path: str = None, salt: str = None):
+        """Initialize with the output path and client-hash salt from Config."""
+        self.path = Config.ACCESS_TRACE_PATH if path is None else path
+        salt = Config.ACCESS_TRACE_SALT if salt is None else salt
+        self.salt = hashlib.blake2b(salt.encode()).digest()[:16] if salt else os.urandom(16)
+        self.records = 0
+        self.write_errors = 0
+        self._queue: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(
+        self,
+        started_at: float,
+        client_ip: str,
+        file_key: Hashable,
+        file_size: int,
+        range_start: int,
+        range_end: int,
+        bytes_delivered: int,
+    ) -> None:
+        """
+        Queue one access record (no-op unless ACCESS_TRACE_PATH is set).
+
+        Args:
+            started_at: Unix time the request arrived
+            client_ip: Client address, hashed before it is stored
+            file_key: Canonical file key of the streamed file
+            file_size: Total size of the file
+            range_start: First requested byte
+            range_end: Last requested byte (inclusive)
+            bytes_delivered: Bytes actually sent before the body ended
+        """
+        if not self.path:
+            return
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write, name="access-trace", daemon=True)
+            self._writer.start()
+        self._queue.put(RECORD.pack(
+            started_at,
+            _hash64(client_ip.encode(), self.salt),
+            file_hash(file_key),
+            file_size,
+            range_start,
+            range_end,
+            bytes_delivered,
+        ))
+        self.records += 1
+
+    def _write(self) -> None:
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            try:
+                with open(self.path, "ab") as f:
+                    if f.tell() == 0:
+                        f.write(HEADER.pack(MAGIC, VERSION))
+                    f.write(data)
+                    # Batch whatever queued up meanwhile with the file already open
+                    while True:
+                        try:
+                            data = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if data is None:
+                            return
+                        f.write(data)
+            except OSError as e:
+                self.write_errors += 1
+                logger.warning("Access trace write to %s failed: %s", self.path, e)
+
+    def close(self, timeout: float = 5) -> None:
+        """Flush queued records and stop the writer thread."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout)
+            self._writer = None
+
+    def get_stats(self) -> Dict:
+        """
+        Get recorder counters.
+
+        Returns:
+            Dictionary with the output path and record/error counts
+        """
+        return {
+            "path": self.path or None,
+            "records": self.records,
+            "write_errors": self.write_errors,
+        }
+
+
+def read_trace(path: str) -> Iterator[AccessRecord]:
+    """
+    Iterate over the records of an access trace file.
+
+    Args:
+        path: File written by AccessTraceRecorder
+
+    Yields:
+        AccessRecord: Records in the order they were written
+
+    Raises:
+        ValueError: If the file is not an access trace
+    """
+    with open(path, "rb") as f:
+        magic, version = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} access trace")
+        while True:
+            data = f.read(RECORD.size * 4096)
+            if not data:
+                return
+            usable = len(data) - len(data) % RECORD.size  # Ignore a record cut short by a crash
+            for fields in RECORD.iter_unpack(data[:usable]):
+                yield AccessRecord(*fields)
+
+
+def write_trace(path: str, records) -> int:
+    """
+    Write records to a new access trace file (for synthetic or filtered traces).
+
+    Returns:
+        Number of records written
+    """
+    count = 0
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION))
+        for record in records:
+            f.write(RECORD.pack(*record))
+            count += 1
+    return count
+
+
+recorder = AccessTraceRecorder()
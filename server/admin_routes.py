@@ -0,0 +1,158 @@
+"""
+Admin Routes - Token-protected diagnostics endpoints
+"""
+import asyncio
+import secrets
+import logging
+from typing import Optional, Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from config import Config
+from database import db
+from server import tracing
+from server.cache_warmer import WarmJobRejected, cache_warmer, parse_warm_target
+from server.chunk_cache import chunk_cache
+from server.loop_monitor import loop_monitor
+from server.popularity import popularity
+from server.profiler import ProfilerBusy, memory_tracer, profiler
+from server.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Allow the request only with the configured X-Admin-Token header."""
+    if not Config.ADMIN_TOKEN:
+        # Diagnostics are disabled until a token is configured
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, Config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@router.get("/profile/cpu")
+async def cpu_profile(seconds: float = 10):
+    """Sample all threads for N seconds and return flamegraph-ready collapsed stacks."""
+    try:
+        collapsed = await profiler.profile(seconds)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": 'attachment; filename="cpu_profile.collapsed"'},
+    )
+
+
+@router.post("/profile/memory/start")
+async def memory_start(frames: int = None):
+    """Start tracemalloc (slows allocations until stopped)."""
+    memory_tracer.start(frames)
+    return {"tracing": memory_tracer.tracing}
+
+
+@router.post("/profile/memory/stop")
+async def memory_stop():
+    """Stop tracemalloc and drop the baseline snapshot."""
+    memory_tracer.stop()
+    return {"tracing": memory_tracer.tracing}
+
+
+@router.get("/profile/memory/snapshot")
+async def memory_snapshot(limit: int = 20):
+    """Top allocation sites by size."""
+    try:
+        # Snapshots walk every traced block; keep that off the event loop
+        return await asyncio.to_thread(memory_tracer.snapshot, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/profile/memory/diff")
+async def memory_diff(limit: int = 20):
+    """Allocation growth per site since the previous snapshot or diff."""
+    try:
+        return await asyncio.to_thread(memory_tracer.diff, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/stats")
+async def detailed_stats():
+    """Detail left out of the public /stats: clients, files, loop-block stacks, DB errors."""
+    return {
+        "bandwidth": scheduler.get_stats(detailed=True),
+        "database": db.breaker.get_stats(detailed=True) if db else None,
+        "event_loop": loop_monitor.get_stats(detailed=True),
+        "popularity": popularity.get_stats(detailed=True),
+    }
+
+
+@router.get("/traces")
+async def slow_traces(limit: int = 20):
+    """Recent requests slower than TRACE_SLOW_MS to first byte, with their spans."""
+    return {"stats": tracing.get_stats(), "traces": tracing.get_slow_traces(limit)}
+
+
+@router.get("/popular")
+async def popular_files(limit: int = None):
+    """Current trending files (space-saving top-K) with warmer and cache state."""
+    return {
+        "top": popularity.top(limit),
+        "cache_warmer": cache_warmer.get_stats(),
+        "chunk_cache": chunk_cache.get_stats(),
+    }
+
+
+@router.post("/warm")
+async def start_warm_job(
+    link: str = None,
+    chat_id: Union[int, str] = None,
+    first: int = None,
+    last: int = None,
+    mb: float = None,
+    tail_mb: float = None,
+):
+    """
+    Pre-download a message range into the chunk cache ahead of a premiere.
+
+    Give either a link (t.me/c/123/10, t.me/c/123/10-20 or a stream link)
+    or chat_id and first [and last]. mb is the head fetched per file.
+    """
+    try:
+        if link:
+            chat, first_id, last_id = parse_warm_target(link)
+            last_id = last or last_id
+        elif chat_id is not None and first is not None:
+            chat, first_id, last_id = chat_id, first, last or first
+        else:
+            raise WarmJobRejected("Give a link, or chat_id and first")
+        job = cache_warmer.submit_job(chat, first_id, last_id, mb, tail_mb)
+    except WarmJobRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+
+@router.get("/warm")
+async def warm_jobs():
+    """Progress of recent warm jobs."""
+    return {"jobs": [job.to_dict() for job in cache_warmer.jobs.values()], "chunk_cache": chunk_cache.get_stats()}
+
+
+@router.get("/warm/{job_id}")
+async def warm_job(job_id: int):
+    job = cache_warmer.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown warm job")
+    return job.to_dict()
+
+
+@router.delete("/warm/{job_id}")
+async def cancel_warm_job(job_id: int):
+    """Stop a running warm job after its in-flight parts, or release a finished job's hold."""
+    if not cache_warmer.cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="No running or holding warm job with that id")
+    return cache_warmer.jobs[job_id].to_dict()
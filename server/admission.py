@@ -0,0 +1,185 @@
+"""
+Admission Control - Caps concurrent streams globally, per client IP and per file
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Hashable
+
+from fastapi import Request
+
+from config import Config
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a stream cannot be admitted; carries a Retry-After hint."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class StreamTicket:
+    """A granted stream slot. release() is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", client_ip: str, file_key: Hashable):
+        self.controller = controller
+        self.client_ip = client_ip
+        self.file_key = file_key
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Admits /stream requests up to a concurrency limit.
+
+    Per-IP and per-file caps reject immediately. When only the global limit is
+    hit, requests wait in a short FIFO queue and get a 503 if no slot frees up
+    within the queue timeout. A limit of 0 disables that check.
+    """
+
+    def __init__(
+        self,
+        max_streams: int = None,
+        max_per_ip: int = None,
+        max_per_file: int = None,
+        queue_size: int = None,
+        queue_timeout: float = None,
+        retry_after: int = None,
+    ):
+        """Initialize with limits, defaulting to Config values."""
+        self.max_streams = Config.MAX_CONCURRENT_STREAMS if max_streams is None else max_streams
+        self.max_per_ip = Config.MAX_STREAMS_PER_IP if max_per_ip is None else max_per_ip
+        self.max_per_file = Config.MAX_STREAMS_PER_FILE if max_per_file is None else max_per_file
+        self.queue_size = Config.STREAM_QUEUE_SIZE if queue_size is None else queue_size
+        self.queue_timeout = Config.STREAM_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self.retry_after = Config.STREAM_RETRY_AFTER if retry_after is None else retry_after
+
+        self.active = 0
+        self.per_ip: Dict[str, int] = {}
+        self.per_file: Dict[Hashable, int] = {}
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        metrics.incr(f"admission_rejected_{reason}")
+        logger.warning(f"Stream rejected ({reason}); active={self.active}, queued={len(self.waiters)}")
+        return AdmissionRejected(reason, self.retry_after)
+
+    def _has_capacity(self) -> bool:
+        return not self.max_streams or self.active < self.max_streams
+
+    async def acquire(self, client_ip: str, file_key: Hashable) -> StreamTicket:
+        """
+        Wait for a stream slot.
+
+        Args:
+            client_ip: Client address used for the per-IP cap
+            file_key: File identity used for the per-file cap
+
+        Returns:
+            StreamTicket to release when the stream ends
+
+        Raises:
+            AdmissionRejected: If a cap is hit, the queue is full, or the wait times out
+        """
+        if self.max_per_ip and self.per_ip.get(client_ip, 0) >= self.max_per_ip:
+            raise self._reject("per_ip")
+        if self.max_per_file and self.per_file.get(file_key, 0) >= self.max_per_file:
+            raise self._reject("per_file")
+
+        if not self._has_capacity() or self.waiters:
+            if len(self.waiters) >= self.queue_size:
+                raise self._reject("queue_full")
+
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            metrics.incr("admission_queued")
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # A slot was handed over just as we gave up: pass it on
+                    self._free_slot()
+                else:
+                    waiter.cancel()
+                    if waiter in self.waiters:
+                        self.waiters.remove(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._reject("queue_timeout")
+                raise
+            # _free_slot() already counted the handed-over slot as active
+        else:
+            self.active += 1
+
+        self.per_ip[client_ip] = self.per_ip.get(client_ip, 0) + 1
+        self.per_file[file_key] = self.per_file.get(file_key, 0) + 1
+        metrics.incr("admission_granted")
+        return StreamTicket(self, client_ip, file_key)
+
+    def _free_slot(self) -> None:
+        """Give a slot back, handing it straight to the oldest live waiter."""
+        self.active -= 1
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(True)
+                break
+
+    def _release(self, ticket: StreamTicket) -> None:
+        for counts, key in ((self.per_ip, ticket.client_ip), (self.per_file, ticket.file_key)):
+            remaining = counts.get(key, 0) - 1
+            if remaining > 0:
+                counts[key] = remaining
+            else:
+                counts.pop(key, None)
+        self._free_slot()
+
+    def get_stats(self) -> Dict:
+        """
+        Get current admission state.
+
+        Returns:
+            Dictionary with active/queued counts and configured limits
+        """
+        return {
+            "active_streams": self.active,
+            "queued": len(self.waiters),
+            "distinct_clients": len(self.per_ip),
+            "distinct_files": len(self.per_file),
+            "limits": {
+                "max_streams": self.max_streams,
+                "max_per_ip": self.max_per_ip,
+                "max_per_file": self.max_per_file,
+                "queue_size": self.queue_size,
+                "queue_timeout": self.queue_timeout,
+            },
+        }
+
+
+def client_ip(request: Request) -> str:
+    """
+    Best-effort client address for per-IP limits.
+
+    Behind a reverse proxy (Koyeb, Heroku) every request comes from the proxy,
+    so with TRUST_FORWARDED_FOR set the right-most X-Forwarded-For hop is used:
+    it is the one the proxy appended. Earlier hops are client-supplied and
+    could be rotated to dodge the per-IP cap.
+    """
+    if Config.TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+admission = AdmissionController()
@@ -2,16 +2,21 @@
 ByteStreamer - Advanced file streaming with caching and session management
 Inspired by: https://github.com/eyaadh/megadlbot_oss
 """
-import math
+import time
 import asyncio
 import logging
-from typing import Dict, Union, AsyncGenerator
+from typing import Dict, Iterable, Optional, Union, AsyncGenerator
 from pyrogram import Client
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
-from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid, FileMigrate, FloodWait
+from pyrogram.session import Session
 from pyrogram import raw, utils
 
+from server import file_identity, metrics, session_manager, tracing
+from server.chunk_cache import PART_SIZE, chunk_cache
+from server.dc_manager import get_dc_media_session, invalidate_dc_media_session
+from server.part_fetcher import RetryBudget, fetch_part
+from server.scheduler import BACKGROUND, StreamHandle
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,13 +27,17 @@ class ByteStreamer:
     Attributes:
         client: The Pyrogram client instance
         cached_file_ids: Dict of cached file IDs and their properties
+        cached_media_info: Dict of cached size/MIME/name per message
         clean_timer: Cache cleanup interval in seconds (default: 30 minutes)
     
     Functions:
         get_file_properties: Returns cached or fetches file properties
+        get_media_info: Returns cached or fetches size/MIME/name of a message's media
+        cache_message: Caches properties of an already fetched message
         generate_media_session: Creates/returns media session for specific DC
         get_location: Returns InputFileLocation for the file
         yield_file: Yields file chunks for streaming
+        prefetch: Downloads parts into the chunk cache without a client
         clean_cache: Periodically cleans the cache
     """
 
@@ -36,7 +45,9 @@ class ByteStreamer:
         """Initialize ByteStreamer with a client."""
         self.clean_timer = 30 * 60  # 30 minutes
         self.client: Client = client
-        self.cached_file_ids: Dict[int, FileId] = {}
+        # Keyed by canonical file key (unique_id): every link to the same bytes shares one entry
+        self.cached_file_ids: Dict[str, FileId] = {}
+        self.cached_media_info: Dict[str, dict] = {}
         asyncio.create_task(self.clean_cache())
         logger.info("ByteStreamer initialized")
 
@@ -52,14 +63,94 @@ class ByteStreamer:
         Returns:
             FileId: File properties
         """
-        cache_key = f"{chat_id}:{message_id}"
+        cache_key = file_identity.canonical_key(chat_id, message_id)
         
         if cache_key not in self.cached_file_ids:
-            await self.generate_file_properties(chat_id, message_id)
-            logger.debug(f"Cached file properties for {cache_key}")
+            file_id = await self.generate_file_properties(chat_id, message_id)
+            logger.debug("Cached file properties for %s:%s", chat_id, message_id)
+            return file_id
         
         return self.cached_file_ids[cache_key]
 
+    async def get_media_info(self, chat_id: int, message_id: int) -> Optional[dict]:
+        """
+        Returns size, MIME type, name and duration of a message's media.
+        If cached, returns cached results. Otherwise, fetches and caches.
+        
+        Args:
+            chat_id: Telegram chat ID
+            message_id: Telegram message ID
+            
+        Returns:
+            dict: Media info, or None if the message has no media
+        """
+        cache_key = file_identity.canonical_key(chat_id, message_id)
+        
+        if cache_key not in self.cached_media_info:
+            with tracing.span("telegram.get_messages"):
+                msg = await self.client.get_messages(chat_id, message_id)
+            return self.cache_message(msg)
+        
+        return self.cached_media_info[cache_key]
+
+    def cache_message(self, msg) -> Optional[dict]:
+        """
+        Caches FileId and media info of an already fetched message,
+        so bulk fetches (e.g. /batch) save a get_messages call per stream.
+        
+        Args:
+            msg: Pyrogram Message
+            
+        Returns:
+            dict: Media info, or None if the message has no media
+        """
+        if not msg or getattr(msg, "empty", False) or not msg.media:
+            return None
+        
+        media = getattr(msg, msg.media.value, None)
+        if media is None or not getattr(media, "file_id", None):
+            return None
+        
+        info = {
+            "file_size": getattr(media, "file_size", 0) or 0,
+            "mime_type": getattr(media, "mime_type", None) or "application/octet-stream",
+            "file_name": getattr(media, "file_name", None),
+            "duration": getattr(media, "duration", 0) or 0,
+        }
+        return self.cache_media(msg.chat.id, msg.id, media.file_id, info, getattr(media, "file_unique_id", None))
+
+    def cache_media(
+        self,
+        chat_id: int,
+        message_id: int,
+        file_id: str,
+        info: dict,
+        unique_id: Optional[str] = None,
+    ) -> dict:
+        """
+        Caches FileId and media info known from elsewhere (e.g. the file registry).
+        
+        Args:
+            chat_id: Telegram chat ID
+            message_id: Telegram message ID
+            file_id: Encoded file_id string
+            info: Dict with file_size, mime_type, file_name, duration
+            unique_id: The media's file_unique_id (derived from file_id if omitted)
+            
+        Returns:
+            dict: The cached media info
+        """
+        decoded = FileId.decode(file_id)
+        cache_key = file_identity.register(chat_id, message_id, unique_id or file_identity.unique_id_of(decoded))
+        self.cached_file_ids[cache_key] = decoded
+        self.cached_media_info[cache_key] = info
+        return info
+
+    def is_cached(self, chat_id: int, message_id: int) -> bool:
+        """Returns True if both FileId and media info are cached."""
+        cache_key = file_identity.canonical_key(chat_id, message_id)
+        return cache_key in self.cached_media_info and cache_key in self.cached_file_ids
+
     async def generate_file_properties(self, chat_id: int, message_id: int) -> FileId:
         """
         Generates and caches the properties of a media file.
@@ -72,19 +163,15 @@ class ByteStreamer:
             FileId: File properties
         """
         try:
-            msg = await self.client.get_messages(chat_id, message_id)
+            with tracing.span("telegram.get_messages"):
+                msg = await self.client.get_messages(chat_id, message_id)
             
-            if not msg or not msg.media:
+            if self.cache_message(msg) is None:
                 raise ValueError(f"No media found in message {message_id}")
             
-            media = getattr(msg, msg.media.value)
-            file_id = FileId.decode(media.file_id)
-            
-            cache_key = f"{chat_id}:{message_id}"
-            self.cached_file_ids[cache_key] = file_id
-            
-            logger.debug(f"Generated file ID for {cache_key}")
-            return file_id
+            cache_key = file_identity.canonical_key(chat_id, message_id)
+            logger.debug("Generated file ID for %s:%s (%s)", chat_id, message_id, cache_key)
+            return self.cached_file_ids[cache_key]
             
         except Exception as e:
             logger.error(f"Failed to generate file properties: {e}")
@@ -105,53 +192,11 @@ class ByteStreamer:
         media_session = client.media_sessions.get(file_id.dc_id, None)
 
         if media_session is None:
-            if file_id.dc_id != await client.storage.dc_id():
-                # File is on a different DC, need to create session
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await Auth(
-                        client, file_id.dc_id, await client.storage.test_mode()
-                    ).create(),
-                    await client.storage.test_mode(),
-                    is_media=True,
-                )
-                await media_session.start()
-
-                # Export and import authorization
-                for attempt in range(6):
-                    try:
-                        exported_auth = await client.invoke(
-                            raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
-                        )
-                        
-                        await media_session.send(
-                            raw.functions.auth.ImportAuthorization(
-                                id=exported_auth.id, bytes=exported_auth.bytes
-                            )
-                        )
-                        break
-                    except AuthBytesInvalid:
-                        logger.debug(f"Invalid auth bytes for DC {file_id.dc_id}, attempt {attempt + 1}")
-                        if attempt == 5:
-                            await media_session.stop()
-                            raise
-                        continue
-            else:
-                # File is on same DC as client
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await client.storage.auth_key(),
-                    await client.storage.test_mode(),
-                    is_media=True,
-                )
-                await media_session.start()
-            
-            logger.debug(f"Created media session for DC {file_id.dc_id}")
-            client.media_sessions[file_id.dc_id] = media_session
+            # Single-flight: concurrent streams for the same DC share one handshake
+            media_session = await get_dc_media_session(file_id.dc_id, client)
+            logger.debug("Created media session for DC %s", file_id.dc_id)
         else:
-            logger.debug(f"Using cached media session for DC {file_id.dc_id}")
+            logger.debug("Using cached media session for DC %s", file_id.dc_id)
         
         return media_session
 
@@ -218,6 +263,7 @@ class ByteStreamer:
         last_part_cut: int,
         part_count: int,
         chunk_size: int,
+        stream: Optional[StreamHandle] = None,
     ) -> AsyncGenerator[bytes, None]:
         """
         Custom generator that yields the bytes of the media file.
@@ -229,61 +275,150 @@ class ByteStreamer:
             last_part_cut: Bytes to keep in last chunk
             part_count: Number of chunks to fetch
             chunk_size: Size of each chunk
+            stream: Scheduler handle; when given, fetches are fair-queued and
+                delivered bytes are recorded for bandwidth stats
             
         Yields:
             bytes: File chunks
         """
         client = self.client
         current_part = 1
+        budget = RetryBudget()
         
-        logger.debug(f"Starting to yield file with {part_count} parts")
+        logger.debug("Starting to yield file with %s parts", part_count)
         
-        media_session = await self.generate_media_session(client, file_id)
         location = await self.get_location(file_id)
 
-        try:
-            r = await media_session.send(
-                raw.functions.upload.GetFile(
-                    location=location, offset=offset, limit=chunk_size
-                ),
+        async def get_part():
+            # Only the first part delays playback start, so only its attempts are traced
+            first = current_part == 1
+            # Resolve the session on every attempt so a replaced session is picked up
+            with tracing.span("media_session", dc_id=file_id.dc_id) if first else tracing.NOOP:
+                media_session = await self.generate_media_session(client, file_id)
+            session_manager.record_use(file_id.dc_id, media_session)
+            request = raw.functions.upload.GetFile(
+                location=location, offset=offset, limit=chunk_size
             )
-            
-            if isinstance(r, raw.types.upload.File):
-                while True:
+            if stream is None:
+                with tracing.span("telegram.get_file", offset=offset) if first else tracing.NOOP:
+                    return await media_session.send(request)
+            queued_ns = time.time_ns()
+            async with stream.slot(stream.priority_for(current_part - 1), chunk_size):
+                if first:
+                    tracing.record("scheduler.wait", queued_ns)
+                with tracing.span("telegram.get_file", offset=offset) if first else tracing.NOOP:
+                    return await media_session.send(request)
+
+        async def reset_session():
+            await self.reset_media_session(client, file_id.dc_id)
+
+        # Whole aligned parts are shared through the chunk cache by every link to the file
+        cache_key = file_identity.unique_id_of(file_id) if chunk_size == PART_SIZE else None
+
+        try:
+            while current_part <= part_count:
+                chunk = chunk_cache.get(cache_key, offset) if cache_key else None
+                if chunk is None:
+                    r = await fetch_part(
+                        get_part,
+                        budget,
+                        reset_session=reset_session,
+                        description=f"part {current_part}/{part_count} at offset {offset}",
+                    )
+                    if not isinstance(r, raw.types.upload.File):
+                        break
+
                     chunk = r.bytes
                     if not chunk:
                         break
-                    
-                    # Handle first/last part cutting for precise range requests
-                    if part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
-
-                    current_part += 1
-                    offset += chunk_size
-
-                    if current_part > part_count:
-                        break
+                    if cache_key:
+                        chunk_cache.put(cache_key, offset, chunk)
+                elif current_part == 1:
+                    tracing.record("chunk_cache.hit", time.time_ns(), offset=offset)
+                
+                # Handle first/last part cutting for precise range requests
+                if part_count == 1:
+                    chunk = chunk[first_part_cut:last_part_cut]
+                elif current_part == 1:
+                    chunk = chunk[first_part_cut:]
+                elif current_part == part_count:
+                    chunk = chunk[:last_part_cut]
 
-                    r = await media_session.send(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
-                    )
-        except (TimeoutError, AttributeError) as e:
-            logger.error(f"Error while yielding file: {e}")
-        except FloodWait as e:
-            logger.warning(f"FloodWait during file yield: {e.value}s")
-            await asyncio.sleep(e.value)
+                if stream is not None:
+                    stream.record(len(chunk))
+                yield chunk
+
+                current_part += 1
+                offset += chunk_size
         except Exception as e:
-            logger.exception(f"Unexpected error during file yield: {e}")
+            # Client disconnects surface as GeneratorExit/CancelledError and are not counted
+            metrics.incr("stream_truncations")
+            logger.error(f"Error while yielding file, stream truncated: {e!r}")
         finally:
-            logger.debug(f"Finished yielding file with {current_part - 1} parts")
+            metrics.incr("stream_retries_used", budget.used)
+            logger.debug("Finished yielding file with %s parts", current_part - 1)
+
+    async def prefetch(
+        self,
+        file_id: FileId,
+        offsets: Iterable[int],
+        stream: StreamHandle,
+        priority: int = BACKGROUND,
+    ) -> int:
+        """
+        Downloads whole parts into the chunk cache, skipping cached ones.
+        
+        Args:
+            file_id: Decoded file ID
+            offsets: PART_SIZE-aligned byte offsets to fetch
+            stream: Scheduler handle the fetches are queued under
+            priority: Scheduler priority class (background by default)
+            
+        Returns:
+            int: Bytes downloaded from Telegram
+        """
+        cache_key = file_identity.unique_id_of(file_id)
+        location = await self.get_location(file_id)
+        budget = RetryBudget()
+        fetched = 0
+
+        for offset in offsets:
+            if chunk_cache.contains(cache_key, offset):
+                continue
+
+            async def get_part():
+                media_session = await self.generate_media_session(self.client, file_id)
+                session_manager.record_use(file_id.dc_id, media_session)
+                request = raw.functions.upload.GetFile(location=location, offset=offset, limit=PART_SIZE)
+                async with stream.slot(priority, PART_SIZE):
+                    return await media_session.send(request)
+
+            async def reset_session():
+                await self.reset_media_session(self.client, file_id.dc_id)
+
+            r = await fetch_part(
+                get_part,
+                budget,
+                reset_session=reset_session,
+                description=f"prefetch at offset {offset}",
+            )
+            if not isinstance(r, raw.types.upload.File) or not r.bytes:
+                break
+            # Chosen by popularity or an admin, so bypass the frequency test
+            chunk_cache.put(cache_key, offset, r.bytes, admit=True)
+            fetched += len(r.bytes)
+
+        return fetched
+
+    async def reset_media_session(self, client: Client, dc_id: int) -> None:
+        """
+        Drops the cached media session for a DC so the next request builds a new one.
+        
+        Args:
+            client: Pyrogram client owning the session
+            dc_id: Data center ID of the session
+        """
+        await invalidate_dc_media_session(dc_id, client)
 
     async def clean_cache(self) -> None:
         """
@@ -293,4 +428,18 @@ class ByteStreamer:
         while True:
             await asyncio.sleep(self.clean_timer)
             self.cached_file_ids.clear()
+            self.cached_media_info.clear()
             logger.debug("Cleaned file cache")
+
+
+# Shared instance used by the routes, bot commands and the cache warmer
+byte_streamer: Optional[ByteStreamer] = None
+
+
+async def get_byte_streamer() -> ByteStreamer:
+    """Get or create the shared ByteStreamer bound to the bot client."""
+    global byte_streamer
+    if byte_streamer is None:
+        from bot_client import bot  # Deferred: the bot is built from Config at import
+        byte_streamer = ByteStreamer(bot)
+    return byte_streamer
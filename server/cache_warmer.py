@@ -0,0 +1,540 @@
+"""
+Cache Warmer - Background prefetch of trending files into the chunk cache
+"""
+import re
+import time
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from pyrogram.errors import FloodWait
+
+from config import Config
+from server import file_identity, metrics
+from server.chunk_cache import PART_SIZE, chunk_cache
+from server.popularity import popularity
+from server.scheduler import BULK, scheduler
+
+logger = logging.getLogger(__name__)
+
+WARMER_FLOW = "cache-warmer"  # Scheduler flow all warming fetches are charged to
+WARM_JOB_FLOW = "cache-warm-job"  # Admin jobs share one flow: together they get one viewer's share
+MESSAGES_PER_PAGE = 200
+JOBS_KEPT = 20
+
+_TG_LINK = re.compile(
+    r"^(?:https?://)?(?:t\.me|telegram\.me|telegram\.dog)/(c/)?(\d+|[A-Za-z][A-Za-z0-9_]{3,})/(\d+)(?:-(\d+))?/?$"
+)
+_STREAM_LINK = re.compile(r"/stream/(-?\d+)/(\d+)/?$")
+
+
+class WarmJobRejected(Exception):
+    """Raised when a warm job cannot be started (bad target, limits)."""
+
+
+def parse_warm_target(text: str) -> Tuple[Union[int, str], int, int]:
+    """
+    Parse a message link, a link range or a stream link.
+
+    Accepts t.me/c/123456/10, t.me/channel/10, t.me/c/123456/10-20 and
+    {URL}/stream/-100123456/10.
+
+    Returns:
+        (chat, first_message_id, last_message_id)
+
+    Raises:
+        WarmJobRejected: If the text is not a supported link
+    """
+    text = text.strip()
+    match = _TG_LINK.match(text)
+    if match:
+        private, chat, first, last = match.groups()
+        chat = int("-100" + chat) if private or chat.isdigit() else chat
+        return chat, int(first), int(last or first)
+    match = _STREAM_LINK.search(text)
+    if match:
+        return int(match.group(1)), int(match.group(2)), int(match.group(2))
+    raise WarmJobRejected("Not a Telegram message link or stream link")
+
+
+def warm_offsets(file_size: int, duration: int, head_mb: float, tail_mb: float, minutes: float) -> List[int]:
+    """
+    Part offsets a player needs to start quickly: head, first minutes, tail.
+
+    Args:
+        file_size: File size in bytes
+        duration: Duration in seconds, 0 if unknown
+        head_mb: MiB from the start, always warmed
+        tail_mb: MiB at the end (players probe it for the index)
+        minutes: Playback minutes from the start, estimated from the average bitrate
+
+    Returns:
+        Sorted, de-duplicated PART_SIZE-aligned offsets
+    """
+    if file_size <= 0:
+        return []
+    head = int(head_mb * 1024 * 1024)
+    if duration and minutes:
+        head = max(head, int(file_size * min(1.0, minutes * 60 / duration)))
+    head = min(head, file_size)
+    offsets = set(range(0, head, PART_SIZE))
+    tail_start = max(0, file_size - int(tail_mb * 1024 * 1024))
+    offsets.update(range(tail_start - tail_start % PART_SIZE, file_size, PART_SIZE))
+    return sorted(offsets)
+
+
+class WarmJob:
+    """An admin request to pre-download part of a range of files before a premiere."""
+
+    def __init__(self, job_id: int, chat: Union[int, str], first: int, last: int, head_mb: float, tail_mb: float):
+        self.id = job_id
+        self.chat = chat
+        self.first = first
+        self.last = last
+        self.head_mb = head_mb
+        self.tail_mb = tail_mb
+        self.status = "resolving"
+        self.files: List[Dict] = []  # Resolved media: ids, name, FileId, cache key, offsets
+        self.files_done = 0
+        self.parts_total = 0
+        self.parts_done = 0
+        self.bytes_fetched = 0
+        self.errors: List[str] = []
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.head_reduced = False  # head_mb was lowered to fit the cache
+        self.released = False  # Hold given up early with /warm cancel
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def holding(self) -> bool:
+        """
+        Whether the job's parts are meant to stay resident.
+
+        True while it runs and for WARM_JOB_HOLD seconds after it completes,
+        until the premiere has started; the trending warmer pauses meanwhile.
+        """
+        if self.released or self.status in ("cancelled", "rejected", "failed"):
+            return False
+        return not self.done or time.time() - self.finished_at < Config.WARM_JOB_HOLD
+
+    def resident_parts(self) -> int:
+        """Planned parts currently in the chunk cache (may drop as the cache evicts)."""
+        return sum(
+            1 for f in self.files for offset in f["offsets"] if chunk_cache.contains(f["unique_id"], offset)
+        )
+
+    def to_dict(self) -> Dict:
+        cache = chunk_cache.get_stats()
+        return {
+            "id": self.id,
+            "target": f"{self.chat}/{self.first}-{self.last}",
+            "status": self.status,
+            "head_mb": self.head_mb,
+            "head_reduced": self.head_reduced,
+            "tail_mb": self.tail_mb,
+            "files": len(self.files),
+            "files_done": self.files_done,
+            "parts_total": self.parts_total,
+            "parts_done": self.parts_done,
+            "planned_bytes": self.parts_total * PART_SIZE,
+            "bytes_fetched": self.bytes_fetched,
+            "resident_parts": self.resident_parts(),
+            "holding": self.holding,
+            "cache_size_bytes": cache["size_bytes"],
+            "cache_capacity_bytes": cache["capacity_bytes"],
+            "errors": self.errors[-10:],
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 1),
+        }
+
+    def progress_text(self) -> str:
+        info = self.to_dict()
+        mib = 1024 * 1024
+        text = (
+            f"🌡️ **Cache warm #{self.id}** - {self.status}\n\n"
+            f"📁 Files: {info['files_done']}/{info['files']}\n"
+            f"🧩 Parts: {info['parts_done']}/{info['parts_total']} "
+            f"({info['bytes_fetched'] / mib:.0f} MiB downloaded)\n"
+            f"💾 In cache: {info['resident_parts']}/{info['parts_total']} parts, "
+            f"cache {info['cache_size_bytes'] / mib:.0f}/{info['cache_capacity_bytes'] / mib:.0f} MiB\n"
+            f"⏱️ {info['seconds']}s"
+        )
+        if self.done and info["resident_parts"] < info["parts_done"]:
+            text += f"\n\n⚠️ {info['parts_done'] - info['resident_parts']} warmed parts were evicted since."
+        if self.done and info["holding"]:
+            left = Config.WARM_JOB_HOLD - (time.time() - self.finished_at)
+            text += f"\n\n🔒 Trending warm-up paused for {left / 60:.0f} more min to keep these parts."
+        if self.head_reduced:
+            text += f"\n\n⚠️ Head reduced to {self.head_mb:g} MiB per file to fit the cache."
+        if self.errors:
+            text += f"\n\n❌ {len(self.errors)} errors, last: {self.errors[-1][:200]}"
+        return text
+
+
+class CacheWarmer:
+    """
+    Periodically prefetches the head, first minutes and tail of trending files.
+
+    Runs only while the scheduler is mostly idle, queues its fetches at
+    BACKGROUND priority behind every stream, and stops a cycle as soon as
+    streams need the capacity back or the per-cycle byte budget is spent.
+    Each cycle is planned to fit WARM_TRENDING_SHARE of the protected cache
+    segment, and parts the cache evicted after warming are left alone for
+    WARM_REWARM_AFTER seconds, so cycles settle instead of churning.
+
+    Admins can also submit warm jobs for a message range ahead of a
+    premiere; those run at BULK priority regardless of load, a few files
+    at a time.
+    """
+
+    def __init__(self):
+        self.enabled = Config.WARM_ENABLED and chunk_cache.enabled
+        self.cycles = 0
+        self.skipped_busy = 0
+        self.skipped_jobs = 0
+        self.bytes_warmed = 0
+        self.files_warmed = 0
+        self.errors = 0
+        self.last_cycle: Optional[Dict] = None
+        self._get_streamer: Optional[Callable[[], Awaitable]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._warmed: Dict[Tuple[str, int], float] = {}  # (file key, offset) -> when the warmer fetched it
+        self.jobs: "OrderedDict[int, WarmJob]" = OrderedDict()
+        self._job_ids = itertools.count(1)
+
+    def start(self, get_streamer: Callable[[], Awaitable]) -> None:
+        """
+        Start the warming loop (idempotent).
+
+        Args:
+            get_streamer: Coroutine function returning the ByteStreamer to fetch with
+        """
+        self._get_streamer = get_streamer
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Cache warmer started (every %ss, top %s files)", Config.WARM_INTERVAL, Config.WARM_TOP_N)
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(Config.WARM_INTERVAL)
+            if not scheduler.is_idle(Config.WARM_IDLE_SHARE):
+                self.skipped_busy += 1
+                continue
+            if self.holding_jobs():
+                # Its forced admits would push out the parts an admin warmed for a premiere
+                self.skipped_jobs += 1
+                continue
+            try:
+                await self.warm_trending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Cache warming cycle failed: %r", e)
+
+    def _trending_room(self) -> int:
+        """Parts the trending warmer may keep force-admitted (its share of the protected segment)."""
+        return int(chunk_cache.cache.protected_capacity * Config.WARM_TRENDING_SHARE) // PART_SIZE
+
+    def _plan_trending(self, top: List[Dict], cycle: Dict) -> List[Tuple[Dict, List[int]]]:
+        """
+        Choose the files and parts of a cycle so they fit the trending share of the cache.
+
+        Files are taken in rank order with head, first minutes and tail; a file
+        that does not fit gets head and tail only, and is dropped if even that
+        does not fit. Planning more than the share would make every cycle evict
+        the previous cycle's parts and download them again.
+        """
+        room = self._trending_room()
+        plan = []
+        for entry in top:
+            if "chat_id" not in entry or not entry.get("file_size"):
+                continue
+            for minutes in (Config.WARM_MINUTES, 0):
+                offsets = warm_offsets(
+                    entry["file_size"], entry.get("duration", 0), Config.WARM_HEAD_MB, Config.WARM_TAIL_MB, minutes
+                )
+                if len(offsets) <= room:
+                    room -= len(offsets)
+                    plan.append((entry, offsets))
+                    break
+            else:
+                cycle["dropped"] += 1
+        return plan
+
+    def _forget_warmed(self, now: float) -> None:
+        """Allow re-warming parts warmed more than WARM_REWARM_AFTER seconds ago."""
+        cutoff = now - Config.WARM_REWARM_AFTER
+        self._warmed = {part: at for part, at in self._warmed.items() if at > cutoff}
+
+    async def warm_trending(self) -> Dict:
+        """
+        Run one warming cycle over the current top files.
+
+        Returns:
+            Summary of the cycle (files, bytes, failed and dropped files, stop reason)
+        """
+        streamer = await self._get_streamer()
+        budget = Config.WARM_BUDGET_MB * 1024 * 1024
+        started = time.monotonic()
+        cycle = {"files": 0, "bytes": 0, "errors": 0, "dropped": 0, "stopped": "done"}
+        self._forget_warmed(started)
+        handle = scheduler.open_stream(WARMER_FLOW, "trending warm-up")
+        try:
+            for entry, offsets in self._plan_trending(popularity.top(Config.WARM_TOP_N), cycle):
+                try:
+                    file_id = await streamer.get_file_properties(entry["chat_id"], entry["message_id"])
+                    cache_key = file_identity.unique_id_of(file_id)
+                    for offset in offsets:
+                        if (cache_key, offset) in self._warmed:
+                            # Warmed recently and evicted since: the cache chose other parts, don't fight it
+                            continue
+                        if cycle["bytes"] >= budget:
+                            cycle["stopped"] = "budget"
+                            return cycle
+                        if not scheduler.is_idle(Config.WARM_IDLE_SHARE):
+                            cycle["stopped"] = "busy"
+                            return cycle
+                        fetched = await streamer.prefetch(file_id, [offset], handle)
+                        self._warmed[(cache_key, offset)] = time.monotonic()
+                        cycle["bytes"] += fetched
+                except Exception as e:
+                    # A deleted or inaccessible message must not block the files ranked below it
+                    self.errors += 1
+                    cycle["errors"] += 1
+                    logger.warning(
+                        "Cache warming skipped %s/%s: %r", entry["chat_id"], entry["message_id"], e
+                    )
+                    continue
+                cycle["files"] += 1
+            return cycle
+        finally:
+            handle.close()
+            cycle["seconds"] = round(time.monotonic() - started, 2)
+            self.cycles += 1
+            self.files_warmed += cycle["files"]
+            self.bytes_warmed += cycle["bytes"]
+            metrics.incr("cache_warm_bytes", cycle["bytes"])
+            self.last_cycle = cycle
+            if cycle["bytes"]:
+                logger.info(
+                    "Cache warming: %s bytes over %s files (%s)", cycle["bytes"], cycle["files"], cycle["stopped"]
+                )
+
+    def submit_job(
+        self,
+        chat: Union[int, str],
+        first: int,
+        last: int,
+        head_mb: float = None,
+        tail_mb: float = None,
+    ) -> WarmJob:
+        """
+        Start pre-downloading a message range into the cache in the background.
+
+        Args:
+            chat: Chat ID or username (see parse_warm_target)
+            first: First message ID
+            last: Last message ID, inclusive
+            head_mb: MiB to fetch from the start of each file, default WARM_JOB_MB
+            tail_mb: MiB to fetch from the end of each file, default WARM_TAIL_MB
+
+        Returns:
+            WarmJob: The running job; poll to_dict()/progress_text() for progress
+
+        Raises:
+            WarmJobRejected: For bad ranges, a disabled cache or too many running jobs
+        """
+        if not chunk_cache.enabled:
+            raise WarmJobRejected("The chunk cache is disabled (CHUNK_CACHE_MB=0)")
+        if self._get_streamer is None:
+            raise WarmJobRejected("The streaming server is not running")
+        if first <= 0 or first > last:
+            raise WarmJobRejected("Invalid message range")
+        if (head_mb or 0) < 0 or (tail_mb or 0) < 0:
+            raise WarmJobRejected("MiB per file must not be negative")
+        if last - first + 1 > Config.WARM_JOB_MAX_FILES:
+            raise WarmJobRejected(f"Range too large (max {Config.WARM_JOB_MAX_FILES} messages)")
+        if sum(1 for job in self.jobs.values() if not job.done) >= Config.WARM_MAX_JOBS:
+            raise WarmJobRejected(f"{Config.WARM_MAX_JOBS} warm jobs already running")
+
+        job = WarmJob(
+            next(self._job_ids),
+            chat,
+            first,
+            last,
+            Config.WARM_JOB_MB if head_mb is None else head_mb,
+            Config.WARM_TAIL_MB if tail_mb is None else tail_mb,
+        )
+        self.jobs[job.id] = job
+        while len(self.jobs) > JOBS_KEPT:
+            oldest = next(iter(self.jobs))
+            if self.jobs[oldest].holding:
+                break
+            self.jobs.pop(oldest)
+        job.task = asyncio.create_task(self._run_job(job))
+        logger.info("Warm job %s started for %s/%s-%s", job.id, chat, first, last)
+        return job
+
+    def holding_jobs(self, exclude: WarmJob = None) -> List[WarmJob]:
+        """Jobs whose parts are meant to stay resident (see WarmJob.holding)."""
+        return [job for job in self.jobs.values() if job is not exclude and job.holding]
+
+    def cancel_job(self, job_id: int) -> bool:
+        """
+        Stop a running job after its in-flight parts, or release a finished job's hold.
+
+        Returns:
+            bool: False if the job is unknown or neither running nor holding
+        """
+        job = self.jobs.get(job_id)
+        if job is None or not job.holding:
+            return False
+        if job.done:
+            job.released = True
+        else:
+            job.cancelled = True
+        return True
+
+    async def _resolve(self, streamer, job: WarmJob) -> None:
+        ids = list(range(job.first, job.last + 1))
+        for start in range(0, len(ids), MESSAGES_PER_PAGE):
+            if job.cancelled:
+                return
+            page = ids[start:start + MESSAGES_PER_PAGE]
+            while True:
+                try:
+                    messages = await streamer.client.get_messages(job.chat, page)
+                    break
+                except FloodWait as e:
+                    await asyncio.sleep(e.value)
+            for msg in messages:
+                # Caching the message also saves get_messages on the first real stream
+                info = streamer.cache_message(msg)
+                if info is None or not info["file_size"]:
+                    continue
+                file_id = await streamer.get_file_properties(msg.chat.id, msg.id)
+                job.files.append({
+                    "chat_id": msg.chat.id,
+                    "message_id": msg.id,
+                    "file_name": info["file_name"],
+                    "file_size": info["file_size"],
+                    "file_id": file_id,
+                    "unique_id": file_identity.unique_id_of(file_id),
+                    "offsets": [],
+                })
+                if job.cancelled:
+                    return
+
+    def _plan(self, job: WarmJob) -> None:
+        """
+        Pick the parts to fetch, shrinking the head so the whole job fits the cache.
+
+        Warmed parts go to the protected segment; planning more than is left
+        of it after other holding jobs would make this job evict its own
+        earlier files or theirs. The trending warmer pauses while jobs hold,
+        so its share is not reserved.
+
+        Raises:
+            WarmJobRejected: If the files do not fit even with a 1 MiB head
+        """
+        reserved = sum(other.parts_total for other in self.holding_jobs(exclude=job))
+        budget = chunk_cache.cache.protected_capacity // PART_SIZE - reserved
+        head_mb = job.head_mb
+        while True:
+            for entry in job.files:
+                entry["offsets"] = warm_offsets(entry["file_size"], 0, head_mb, job.tail_mb, 0)
+            job.parts_total = sum(len(entry["offsets"]) for entry in job.files)
+            if job.parts_total <= budget:
+                break
+            if head_mb <= 1:
+                raise WarmJobRejected(
+                    f"{len(job.files)} files need {job.parts_total} MiB even with a 1 MiB head; "
+                    f"the cache has room for {max(budget, 0)} MiB of warmed parts"
+                    + (f" ({reserved} MiB held by other warm jobs)" if reserved else "")
+                )
+            head_mb = max(1, min(head_mb - 1, int(head_mb * budget / job.parts_total)))
+        if head_mb != job.head_mb:
+            logger.info("Warm job %s: head reduced from %s to %s MiB to fit the cache", job.id, job.head_mb, head_mb)
+            job.head_mb = head_mb
+            job.head_reduced = True
+
+    async def _run_job(self, job: WarmJob) -> None:
+        streamer = await self._get_streamer()
+        handle = scheduler.open_stream(WARM_JOB_FLOW, f"warm job {job.id}")
+        semaphore = asyncio.Semaphore(Config.WARM_JOB_CONCURRENCY)
+
+        async def warm_file(entry: Dict):
+            async with semaphore:
+                for offset in entry["offsets"]:
+                    if job.cancelled:
+                        return
+                    try:
+                        fetched = await streamer.prefetch(entry["file_id"], [offset], handle, priority=BULK)
+                    except Exception as e:
+                        job.errors.append(f"{entry['message_id']}@{offset}: {e!r}")
+                        return
+                    job.bytes_fetched += fetched
+                    job.parts_done += 1
+                job.files_done += 1
+
+        try:
+            await self._resolve(streamer, job)
+            self._plan(job)
+            job.status = "cancelled" if job.cancelled else "warming"
+            await asyncio.gather(*(warm_file(entry) for entry in job.files))
+            job.status = "cancelled" if job.cancelled else "done"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except WarmJobRejected as e:
+            job.status = "rejected"
+            job.errors.append(str(e))
+        except Exception as e:
+            job.status = "failed"
+            job.errors.append(repr(e))
+            logger.warning("Warm job %s failed: %r", job.id, e)
+        finally:
+            handle.close()
+            job.finished_at = time.time()
+            metrics.incr("cache_warm_bytes", job.bytes_fetched)
+            logger.info("Warm job %s %s: %s bytes fetched", job.id, job.status, job.bytes_fetched)
+
+    def get_stats(self) -> Dict:
+        """
+        Get warming counters.
+
+        Returns:
+            Dictionary with cycle counts, bytes warmed and the last cycle
+        """
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "cycles": self.cycles,
+            "skipped_busy": self.skipped_busy,
+            "skipped_jobs": self.skipped_jobs,
+            "files_warmed": self.files_warmed,
+            "bytes_warmed": self.bytes_warmed,
+            "errors": self.errors,
+            "last_cycle": self.last_cycle,
+            "jobs": [
+                {"id": job.id, "status": job.status, "parts": f"{job.parts_done}/{job.parts_total}"}
+                for job in self.jobs.values()
+            ],
+        }
+
+
+cache_warmer = CacheWarmer()
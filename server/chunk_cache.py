@@ -0,0 +1,289 @@
+"""
+Chunk Cache - Byte-bounded cache of downloaded file parts with W-TinyLFU admission
+"""
+import logging
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PART_SIZE = 1024 * 1024  # Parts are cached as fetched: 1 MB, aligned
+SKETCH_DEPTH = 4
+COUNTER_MAX = 15  # 4-bit counters, as in the TinyLFU paper
+FORCED_CREDIT = 3  # Sketch increments credited to a forced admission (beats one-hit scan parts)
+_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x85EBCA77C2B2AE63)
+_MASK64 = (1 << 64) - 1
+_HALVE = bytes(i >> 1 for i in range(256))
+
+
+class FrequencySketch:
+    """
+    Count-min sketch with a doorkeeper bloom filter and periodic aging.
+
+    The first access to a key only sets its doorkeeper bits, so the long
+    tail of one-hit parts never touches the counters. After `sample_size`
+    increments every counter is halved and the doorkeeper cleared, so old
+    popularity fades out.
+    """
+
+    def __init__(self, expected_items: int):
+        width = 16
+        while width < max(expected_items, 1):
+            width <<= 1
+        self.mask = width - 1
+        self.table = bytearray(width * SKETCH_DEPTH)
+        self.doorkeeper = bytearray(width)  # 8 bits per counter column
+        self.door_bits = width * 8
+        self.sample_size = 10 * max(expected_items, 1)
+        self.additions = 0
+
+    def _indexes(self, key: Hashable):
+        h = hash(key) & _MASK64
+        for row, seed in enumerate(_SEEDS):
+            yield row * (self.mask + 1) + ((((h * seed) & _MASK64) >> 32) & self.mask)
+
+    def _door_bits_of(self, key: Hashable):
+        h = hash(key) & _MASK64
+        return h % self.door_bits, ((h >> 32) * 0x9E3779B1) % self.door_bits
+
+    def _in_doorkeeper(self, key: Hashable) -> bool:
+        return all(self.doorkeeper[b >> 3] & (1 << (b & 7)) for b in self._door_bits_of(key))
+
+    def increment(self, key: Hashable) -> None:
+        if not self._in_doorkeeper(key):
+            for b in self._door_bits_of(key):
+                self.doorkeeper[b >> 3] |= 1 << (b & 7)
+        else:
+            table = self.table
+            for i in self._indexes(key):
+                if table[i] < COUNTER_MAX:
+                    table[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.reset()
+
+    def frequency(self, key: Hashable) -> int:
+        table = self.table
+        count = min(table[i] for i in self._indexes(key))
+        return count + (1 if self._in_doorkeeper(key) else 0)
+
+    def reset(self) -> None:
+        self.table = self.table.translate(_HALVE)
+        self.doorkeeper = bytearray(len(self.doorkeeper))
+        self.additions //= 2
+
+
+class WTinyLFUCache:
+    """
+    Window TinyLFU over byte-sized entries (Einziger, Friedman & Manes).
+
+    New entries land in a small LRU window. Entries pushed out of the window
+    only enter the main segmented LRU if the sketch says they are accessed
+    more often than the main cache's eviction victim, so a one-off sequential
+    download cannot flush the parts everyone else is watching. Values may be
+    None when only the policy is needed (tools/cache_sim.py).
+    """
+
+    def __init__(self, capacity_bytes: int, window_ratio: float = 0.01, item_size: int = PART_SIZE):
+        self.capacity = capacity_bytes
+        self.window_capacity = max(int(capacity_bytes * window_ratio), 1)
+        self.main_capacity = max(capacity_bytes - self.window_capacity, 0)
+        self.protected_capacity = int(self.main_capacity * 0.8)
+        self.window: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, size)
+        self.probation: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.protected: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.window_bytes = self.probation_bytes = self.protected_bytes = 0
+        self.sketch = FrequencySketch(max(capacity_bytes // item_size, 1))
+        self.hits = self.misses = 0
+        self.hit_bytes = self.miss_bytes = 0
+        self.admitted = self.rejected = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self.window_bytes + self.probation_bytes + self.protected_bytes
+
+    def __len__(self) -> int:
+        return len(self.window) + len(self.probation) + len(self.protected)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.window or key in self.probation or key in self.protected
+
+    def get(self, key: Hashable, record: bool = True):
+        """
+        Look up a key, counting the access in the frequency sketch.
+
+        Args:
+            key: Cache key
+            record: False to peek without touching recency, frequency or stats
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        if not record:
+            entry = self.window.get(key) or self.probation.get(key) or self.protected.get(key)
+            return entry[0] if entry else None
+
+        self.sketch.increment(key)
+        if key in self.window:
+            entry = self.window[key]
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            entry = self.protected[key]
+            self.protected.move_to_end(key)
+        elif key in self.probation:
+            # Second hit in main: promote to protected
+            entry = self.probation.pop(key)
+            self.probation_bytes -= entry[1]
+            self._protect(key, entry)
+        else:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.hit_bytes += entry[1]
+        return entry[0]
+
+    def put(self, key: Hashable, value, size: int = None, admit: bool = False) -> None:
+        """
+        Insert an entry into the window; admission to main happens on window eviction.
+
+        Args:
+            key: Cache key
+            value: Value to store (may be None in simulations)
+            size: Bytes charged for the entry, defaults to len(value)
+            admit: Skip the window and the frequency test and insert straight
+                into the protected segment (prefetched parts chosen by
+                popularity or an admin)
+        """
+        size = len(value) if size is None else size
+        if size > self.capacity or key in self:
+            return
+        if admit:
+            self._admit(key, (value, size), force=True)
+            return
+        self.miss_bytes += size
+        self.window[key] = (value, size)
+        self.window_bytes += size
+        while self.window_bytes > self.window_capacity and self.window:
+            candidate_key, candidate = self.window.popitem(last=False)
+            self.window_bytes -= candidate[1]
+            self._admit(candidate_key, candidate)
+
+    def _protect(self, key: Hashable, entry: tuple) -> None:
+        """Insert into protected, demoting protected overflow back to probation."""
+        self.protected[key] = entry
+        self.protected_bytes += entry[1]
+        while self.protected_bytes > self.protected_capacity and len(self.protected) > 1:
+            demoted_key, demoted = self.protected.popitem(last=False)
+            self.protected_bytes -= demoted[1]
+            self.probation[demoted_key] = demoted
+            self.probation_bytes += demoted[1]
+
+    def _admit(self, key: Hashable, entry: tuple, force: bool = False) -> None:
+        size = entry[1]
+        if size > self.main_capacity:
+            self.rejected += 1
+            return
+        if force:
+            # A forced entry has never been read, so in probation with a zero count it
+            # would be the first victim of the next scan. Credit the sketch and protect it.
+            for _ in range(FORCED_CREDIT):
+                self.sketch.increment(key)
+            while self.probation_bytes + self.protected_bytes + size > self.main_capacity:
+                self._evict_main()
+            self._protect(key, entry)
+            self.admitted += 1
+            return
+        if self.probation_bytes + self.protected_bytes + size > self.main_capacity:
+            victim_key = self._victim_key()
+            # Ties go to the incumbent: scans of never-repeated parts are rejected
+            if self.sketch.frequency(key) <= self.sketch.frequency(victim_key):
+                self.rejected += 1
+                return
+            while self.probation_bytes + self.protected_bytes + size > self.main_capacity:
+                self._evict_main()
+        self.probation[key] = entry
+        self.probation_bytes += size
+        self.admitted += 1
+
+    def _victim_key(self) -> Hashable:
+        return next(iter(self.probation)) if self.probation else next(iter(self.protected))
+
+    def _evict_main(self) -> None:
+        if self.probation:
+            _, entry = self.probation.popitem(last=False)
+            self.probation_bytes -= entry[1]
+        else:
+            _, entry = self.protected.popitem(last=False)
+            self.protected_bytes -= entry[1]
+
+    def clear(self) -> None:
+        self.window.clear()
+        self.probation.clear()
+        self.protected.clear()
+        self.window_bytes = self.probation_bytes = self.protected_bytes = 0
+
+    def get_stats(self) -> Dict:
+        """
+        Get occupancy and hit ratios.
+
+        Returns:
+            Dictionary with sizes, hit/miss counts and byte hit ratio
+        """
+        lookups = self.hits + self.misses
+        return {
+            "capacity_bytes": self.capacity,
+            "size_bytes": self.size_bytes,
+            "entries": len(self),
+            "window_bytes": self.window_bytes,
+            "probation_bytes": self.probation_bytes,
+            "protected_bytes": self.protected_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "byte_hit_ratio": round(self.hit_bytes / (self.hit_bytes + self.miss_bytes), 4)
+            if self.hit_bytes + self.miss_bytes else 0.0,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class ChunkCache:
+    """
+    Downloaded parts keyed by (canonical file key, offset).
+
+    Every link to the same file shares entries. A capacity of 0 disables the
+    cache: lookups miss without touching the sketch and puts are ignored.
+    """
+
+    def __init__(self, capacity_bytes: int = None, window_ratio: float = None):
+        """Initialize with capacity and window share from Config."""
+        capacity = Config.CHUNK_CACHE_MB * 1024 * 1024 if capacity_bytes is None else capacity_bytes
+        window = Config.CHUNK_CACHE_WINDOW if window_ratio is None else window_ratio
+        self.enabled = capacity > 0
+        self.cache = WTinyLFUCache(max(capacity, 1), window)
+
+    def get(self, file_key: Hashable, offset: int) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        return self.cache.get((file_key, offset))
+
+    def put(self, file_key: Hashable, offset: int, data: bytes, admit: bool = False) -> None:
+        if self.enabled and data:
+            self.cache.put((file_key, offset), data, admit=admit)
+
+    def contains(self, file_key: Hashable, offset: int) -> bool:
+        return self.enabled and (file_key, offset) in self.cache
+
+    def get_stats(self) -> Dict:
+        """
+        Get cache occupancy and hit ratios.
+
+        Returns:
+            Dictionary with enabled flag and policy statistics
+        """
+        return {"enabled": self.enabled, **self.cache.get_stats()}
+
+
+chunk_cache = ChunkCache()
@@ -5,12 +5,16 @@ import time
 import logging
 import os
 import asyncio
-from typing import Dict
+from typing import Dict, Tuple
 from pyrogram import Client
-from pyrogram.errors import FloodWait
+from pyrogram.errors import AuthBytesInvalid, FloodWait
 from pyrogram.raw.functions.auth import ExportAuthorization, ImportAuthorization
+from pyrogram.session import Session, Auth
 from pathlib import Path
 from config import Config
+from server import tracing
+from server.part_fetcher import RETRYABLE_ERRORS
+from server.single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +26,10 @@ os.makedirs(SESSION_DIR, exist_ok=True)
 dc_clients: Dict[int, Client] = {}  # dc_id -> Client
 dc_flood_until: Dict[int, float] = {}  # dc_id -> unix timestamp when FloodWait ends
 
+# In-progress creations, so concurrent callers share one login/handshake
+pending_dc_clients: Dict[int, asyncio.Future] = {}  # dc_id -> Future[Client]
+pending_media_sessions: Dict[Tuple[int, int], asyncio.Future] = {}  # (id(client), dc_id) -> Future[Session]
+
 MAIN_DC_ID = 5  # Main bot DC (Observed from logs)
 
 async def get_main_client() -> Client:
@@ -49,6 +57,18 @@ async def get_dc_client(dc_id: int) -> Client:
         RuntimeError: If DC is in FloodWait period or client creation fails
     """
     # Check if we're in FloodWait period for this DC
+    _check_flood_wait(dc_id)
+
+    # Return existing client if available
+    if dc_id in dc_clients:
+        logger.debug(f"Reusing existing client for DC {dc_id}")
+        return dc_clients[dc_id]
+
+    # Join an in-progress creation instead of logging in again
+    return await single_flight(pending_dc_clients, dc_id, lambda: _create_dc_client(dc_id))
+
+def _check_flood_wait(dc_id: int) -> None:
+    """Raise RuntimeError if dc_id is inside a recorded FloodWait window."""
     now = time.time()
     flood_end = dc_flood_until.get(dc_id, 0)
     if now < flood_end:
@@ -57,12 +77,8 @@ async def get_dc_client(dc_id: int) -> Client:
         logger.warning(msg)
         raise RuntimeError(msg)
 
-    # Return existing client if available
-    if dc_id in dc_clients:
-        logger.info(f"Reusing existing client for DC {dc_id}")
-        return dc_clients[dc_id]
-
-    # Create new client for this DC
+async def _create_dc_client(dc_id: int) -> Client:
+    """Create, start and register a full client for dc_id (bot-token login)."""
     logger.info(f"Creating client for DC {dc_id}")
     
     # Use in-memory session for DC clients to avoid filesystem issues on Koyeb
@@ -100,6 +116,98 @@ async def get_dc_client(dc_id: int) -> Client:
     dc_clients[dc_id] = client
     return client
 
+async def get_dc_media_session(dc_id: int, client: Client = None) -> Session:
+    """Get or create a media-only session for a DC.
+    Much lighter than get_dc_client: no second bot login, just an auth key
+    handshake plus ExportAuthorization/ImportAuthorization from the main client.
+    Sessions are cached in client.media_sessions, shared with ByteStreamer.
+
+    Args:
+        dc_id: Target data center ID
+        client: Authorized client to export from (defaults to the main client)
+
+    Returns:
+        Started media Session for the specified DC
+
+    Raises:
+        RuntimeError: If DC is in FloodWait period or session creation fails
+    """
+    if client is None:
+        client = await get_main_client()
+
+    media_session = client.media_sessions.get(dc_id)
+    if media_session is not None:
+        return media_session
+
+    _check_flood_wait(dc_id)
+    return await single_flight(
+        pending_media_sessions,
+        (id(client), dc_id),
+        lambda: _create_media_session(client, dc_id),
+    )
+
+async def _create_media_session(client: Client, dc_id: int) -> Session:
+    """Build, authorize and register a media session for dc_id."""
+    test_mode = await client.storage.test_mode()
+    logger.info(f"Creating media session for DC {dc_id}")
+
+    if dc_id == await client.storage.dc_id():
+        # Same DC as the client: reuse its auth key, no export needed
+        media_session = Session(
+            client, dc_id, await client.storage.auth_key(), test_mode, is_media=True
+        )
+        await media_session.start()
+    else:
+        # Spans land in the trace of the request that started the handshake
+        with tracing.span("auth.create_key", dc_id=dc_id):
+            auth_key = await Auth(client, dc_id, test_mode).create()
+        media_session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+        with tracing.span("media_session.start", dc_id=dc_id):
+            await media_session.start()
+
+        try:
+            for attempt in range(6):
+                try:
+                    with tracing.span("auth.export_import", dc_id=dc_id, attempt=attempt + 1):
+                        exported_auth = await client.invoke(ExportAuthorization(dc_id=dc_id))
+                        await media_session.send(
+                            ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes)
+                        )
+                    break
+                except AuthBytesInvalid:
+                    logger.debug(f"Invalid auth bytes for DC {dc_id}, attempt {attempt + 1}")
+                    if attempt == 5:
+                        raise
+        except FloodWait as fw:
+            logger.error(f"FloodWait when authorizing DC {dc_id} media session: {fw.value}s")
+            dc_flood_until[dc_id] = time.time() + fw.value
+            await media_session.stop()
+            raise RuntimeError(f"FloodWait for DC {dc_id}: {fw.value}s")
+        except RETRYABLE_ERRORS:
+            # Transient network errors propagate as-is so callers can retry them
+            await media_session.stop()
+            raise
+        except Exception as e:
+            logger.error(f"Failed to authorize DC {dc_id} media session: {e}")
+            await media_session.stop()
+            raise RuntimeError(f"Failed to create DC {dc_id} media session: {e}")
+
+    client.media_sessions[dc_id] = media_session
+    logger.info(f"Media session for DC {dc_id} ready")
+    return media_session
+
+async def invalidate_dc_media_session(dc_id: int, client: Client = None):
+    """Remove a media session from cache, forcing a new handshake next time."""
+    if client is None:
+        client = await get_main_client()
+    media_session = client.media_sessions.pop(dc_id, None)
+    if media_session is not None:
+        try:
+            await media_session.stop()
+        except Exception:
+            pass
+        logger.warning(f"Invalidated and stopped media session for DC {dc_id}")
+
 async def cleanup_dc_clients():
     """Stop all DC clients gracefully.
     Call this on application shutdown.
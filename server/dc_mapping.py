@@ -2,12 +2,14 @@
 DC Mapping - Tracks which DC each file/message belongs to
 """
 import logging
-from typing import Dict, Tuple, Optional
+from typing import Dict, Hashable, Optional
+
+from server.file_identity import file_key
 
 logger = logging.getLogger(__name__)
 
-# Map (chat_id, message_id) -> dc_id
-file_dc_mapping: Dict[Tuple[int, int], int] = {}
+# Map canonical file key (unique_id, or (chat_id, message_id) until resolved) -> dc_id
+file_dc_mapping: Dict[Hashable, int] = {}
 
 
 def set_file_dc(chat_id: int, message_id: int, dc_id: int) -> None:
@@ -19,9 +21,9 @@ def set_file_dc(chat_id: int, message_id: int, dc_id: int) -> None:
         message_id: Telegram message ID
         dc_id: Data center ID where the file is stored
     """
-    key = (chat_id, message_id)
+    key = file_key(chat_id, message_id)
     file_dc_mapping[key] = dc_id
-    logger.info(f"Saved mapping: Chat {chat_id}, Message {message_id} → DC {dc_id}")
+    logger.debug("Saved mapping: Chat %s, Message %s → DC %s", chat_id, message_id, dc_id)
 
 
 def get_file_dc(chat_id: int, message_id: int) -> Optional[int]:
@@ -35,10 +37,10 @@ def get_file_dc(chat_id: int, message_id: int) -> Optional[int]:
     Returns:
         DC ID if known, None otherwise
     """
-    key = (chat_id, message_id)
+    key = file_key(chat_id, message_id)
     dc_id = file_dc_mapping.get(key)
     if dc_id:
-        logger.debug(f"Found mapping: Chat {chat_id}, Message {message_id} → DC {dc_id}")
+        logger.debug("Found mapping: Chat %s, Message %s → DC %s", chat_id, message_id, dc_id)
     return dc_id
 
 
@@ -51,10 +53,10 @@ def clear_mapping(chat_id: int, message_id: int) -> None:
         chat_id: Telegram chat ID
         message_id: Telegram message ID
     """
-    key = (chat_id, message_id)
+    key = file_key(chat_id, message_id)
     if key in file_dc_mapping:
         del file_dc_mapping[key]
-        logger.info(f"Cleared mapping for Chat {chat_id}, Message {message_id}")
+        logger.debug("Cleared mapping for Chat %s, Message %s", chat_id, message_id)
 
 
 def get_stats() -> Dict:
@@ -65,7 +67,7 @@ def get_stats() -> Dict:
         Dictionary with mapping statistics
     """
     dc_counts = {}
-    for (chat_id, msg_id), dc_id in file_dc_mapping.items():
+    for dc_id in file_dc_mapping.values():
         dc_counts[dc_id] = dc_counts.get(dc_id, 0) + 1
     
     return {
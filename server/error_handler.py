@@ -1,5 +1,4 @@
 import logging
-import traceback
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 
@@ -11,9 +10,6 @@ class AIErrorMiddleware(BaseHTTPMiddleware):
             response = await call_next(request)
             return response
         except Exception as exc:
-            # Capture the full traceback
-            tb_str = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-            
             # Analyze the error (Simple AI Simulation)
             diagnosis = "Unknown Error"
             recommendation = "Check logs for details."
@@ -31,24 +27,13 @@ class AIErrorMiddleware(BaseHTTPMiddleware):
                 diagnosis = "Telegram Rate Limit"
                 recommendation = "Too many requests. The bot must wait before retrying."
             
-            # Log the structured report
-            log_report = (
-                f"\n{'='*40}\n"
-                f"🚨 AI ERROR DIAGNOSIS SYSTEM 🚨\n"
-                f"{'='*40}\n"
-                f"📍 Request: {request.method} {request.url}\n"
-                f"❌ Error Type: {type(exc).__name__}\n"
-                f"💬 Message: {str(exc)}\n"
-                f"🧐 Diagnosis: {diagnosis}\n"
-                f"💡 Recommendation: {recommendation}\n"
-                f"{'-'*40}\n"
-                f"📜 Traceback:\n{tb_str}\n"
-                f"{'='*40}\n"
+            # One lazy log call; the traceback is formatted on the logging thread
+            logger.error(
+                "AI ERROR DIAGNOSIS: %s %s -> %s: %s | Diagnosis: %s | Recommendation: %s",
+                request.method, request.url, type(exc).__name__, exc, diagnosis, recommendation,
+                exc_info=exc,
+                extra={"diagnosis": diagnosis, "path": request.url.path},
             )
             
-            # Print to stdout/logs so it appears in Koyeb
-            print(log_report)
-            logger.error(log_report)
-            
             # Re-raise to let FastAPI handle the 500 response
             raise exc
@@ -0,0 +1,98 @@
+"""
+File Identity - Maps every (chat_id, message_id) link to one canonical file key
+"""
+import logging
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from pyrogram.file_id import FileId, FileUniqueId, FileUniqueType
+
+from config import Config
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+# (chat_id, message_id) -> canonical key (the file's unique_id), most recent last
+aliases: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+# canonical key -> number of known links to it
+alias_counts: Dict[str, int] = {}
+
+
+def unique_id_of(file_id: FileId) -> str:
+    """
+    Compute the file_unique_id Telegram reports for a decoded FileId.
+
+    Pyrogram derives it from the media id alone, so every copy, forward and
+    re-upload-free resend of the same bytes shares it.
+    """
+    return FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=file_id.media_id).encode()
+
+
+def register(chat_id: int, message_id: int, unique_id: str) -> str:
+    """
+    Record that a message carries the file with unique_id.
+
+    Args:
+        chat_id: Telegram chat ID
+        message_id: Telegram message ID
+        unique_id: The media's file_unique_id
+
+    Returns:
+        The canonical key for the file
+    """
+    key = (chat_id, message_id)
+    previous = aliases.get(key)
+    if previous != unique_id:
+        if previous is not None:
+            _forget(previous)
+        alias_counts[unique_id] = alias_counts.get(unique_id, 0) + 1
+        if alias_counts[unique_id] > 1:
+            metrics.incr("file_identity_shared")
+    aliases[key] = unique_id
+    aliases.move_to_end(key)
+    while len(aliases) > Config.FILE_IDENTITY_MAX_ALIASES:
+        _, evicted = aliases.popitem(last=False)
+        _forget(evicted)
+    return unique_id
+
+
+def _forget(unique_id: str) -> None:
+    remaining = alias_counts.get(unique_id, 0) - 1
+    if remaining > 0:
+        alias_counts[unique_id] = remaining
+    else:
+        alias_counts.pop(unique_id, None)
+
+
+def canonical_key(chat_id: int, message_id: int) -> Optional[str]:
+    """
+    Get the canonical key of a message's file, if it has been seen.
+
+    Args:
+        chat_id: Telegram chat ID
+        message_id: Telegram message ID
+
+    Returns:
+        The file's unique_id, or None if the message has not been resolved yet
+    """
+    return aliases.get((chat_id, message_id))
+
+
+def file_key(chat_id: int, message_id: int) -> Hashable:
+    """Canonical key when known, else the (chat_id, message_id) pair itself."""
+    return aliases.get((chat_id, message_id)) or (chat_id, message_id)
+
+
+def get_stats() -> Dict:
+    """
+    Get how many links collapse onto how many files.
+
+    Returns:
+        Dictionary with link, file and shared-file counts
+    """
+    return {
+        "links": len(aliases),
+        "files": len(alias_counts),
+        "shared_files": sum(1 for n in alias_counts.values() if n > 1),
+        "max_links_per_file": max(alias_counts.values(), default=0),
+    }
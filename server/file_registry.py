@@ -0,0 +1,173 @@
+"""
+File Registry - One stored copy per unique file in BIN_CHANNEL
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from pyrogram import Client
+from pyrogram.file_id import FileId
+from pyrogram.types import Message
+
+from config import Config
+from database import db
+from server import metrics
+from server.single_flight import single_flight
+
+logger = logging.getLogger(__name__)
+
+
+class FileRegistry:
+    """
+    Maps a file's unique_id to its copy in BIN_CHANNEL.
+
+    The first user to send a file pays for one copy_message; everyone else
+    who sends the same bytes gets a link to that copy. Entries hold what the
+    streaming route needs (file_id, dc_id, size, MIME, name), so a bin-channel
+    stream starts without a get_messages call. Entries live in MongoDB when
+    configured, with an LRU of recent ones in memory.
+    """
+
+    def __init__(self, cache_size: int = None):
+        """Initialize with the in-memory entry limit, defaulting to Config."""
+        self.cache_size = Config.FILE_REGISTRY_CACHE_SIZE if cache_size is None else cache_size
+        self.by_unique_id: "OrderedDict[str, Dict]" = OrderedDict()
+        self.by_bin_msg: Dict[int, str] = {}  # bin_msg_id -> unique_id
+        self.pending: Dict[str, asyncio.Future] = {}  # unique_id -> in-progress copy
+
+    @property
+    def enabled(self) -> bool:
+        return bool(Config.BIN_CHANNEL)
+
+    def _remember(self, entry: Dict) -> Dict:
+        unique_id = entry["unique_id"]
+        self.by_unique_id[unique_id] = entry
+        self.by_unique_id.move_to_end(unique_id)
+        self.by_bin_msg[entry["bin_msg_id"]] = unique_id
+        while len(self.by_unique_id) > self.cache_size:
+            _, evicted = self.by_unique_id.popitem(last=False)
+            self.by_bin_msg.pop(evicted["bin_msg_id"], None)
+        return entry
+
+    async def lookup(self, unique_id: str = None, bin_msg_id: int = None) -> Optional[Dict]:
+        """
+        Find an entry by unique file id or by bin channel message id.
+
+        Returns:
+            Registry entry, or None if the file has not been registered
+        """
+        if unique_id is None:
+            unique_id = self.by_bin_msg.get(bin_msg_id)
+        entry = self.by_unique_id.get(unique_id) if unique_id is not None else None
+        if entry is not None:
+            self.by_unique_id.move_to_end(unique_id)
+            return entry
+        if db:
+            entry = await db.get_file_entry(unique_id=unique_id, bin_msg_id=bin_msg_id)
+            if entry:
+                return self._remember(entry)
+        return None
+
+    @staticmethod
+    def _entry_from(copy: Message, unique_id: str) -> Dict:
+        media = getattr(copy, copy.media.value)
+        return {
+            "unique_id": unique_id,
+            "bin_msg_id": copy.id,
+            "dc_id": FileId.decode(media.file_id).dc_id,
+            "file_size": getattr(media, "file_size", 0) or 0,
+            "mime_type": getattr(media, "mime_type", None) or "application/octet-stream",
+            "file_name": getattr(media, "file_name", None),
+            "duration": getattr(media, "duration", 0) or 0,
+            "file_id": media.file_id,
+            "created_at": time.time(),
+            "resolved_at": time.time(),
+        }
+
+    async def register(self, msg: Message) -> Optional[Dict]:
+        """
+        Return the bin channel entry for msg's media, copying it there if it is new.
+
+        Concurrent registrations of the same file share a single copy.
+
+        Returns:
+            Registry entry, or None if the registry is disabled or msg has no media
+        """
+        if not self.enabled or not msg or not msg.media:
+            return None
+        media = getattr(msg, msg.media.value, None)
+        unique_id = getattr(media, "file_unique_id", None)
+        if not unique_id:
+            return None
+
+        entry = await self.lookup(unique_id=unique_id)
+        if entry is not None:
+            metrics.incr("file_registry_hits")
+            return entry
+
+        return await single_flight(self.pending, unique_id, lambda: self._copy(msg, unique_id))
+
+    async def _copy(self, msg: Message, unique_id: str) -> Dict:
+        copy = await msg.copy(Config.BIN_CHANNEL)
+        entry = self._entry_from(copy, unique_id)
+        if db:
+            # Another instance may have stored the same file first: keep its entry
+            entry = await db.save_file_entry(entry)
+        metrics.incr("file_registry_copies")
+        logger.info(f"Stored {unique_id} in bin channel as message {entry['bin_msg_id']}")
+        return self._remember(entry)
+
+    async def prime(self, streamer, client: Client, bin_msg_id: int) -> bool:
+        """
+        Warm streamer's metadata cache for a bin channel message from its entry.
+
+        Entries older than FILE_REGISTRY_REFRESH are re-resolved with one
+        get_messages so the cached file_reference stays valid.
+
+        Returns:
+            True if the streamer cache now holds the file
+        """
+        if streamer.is_cached(Config.BIN_CHANNEL, bin_msg_id):
+            return True
+        entry = await self.lookup(bin_msg_id=bin_msg_id)
+        if entry is None:
+            return False
+
+        if time.time() - entry.get("resolved_at", 0) > Config.FILE_REGISTRY_REFRESH:
+            msg = await client.get_messages(Config.BIN_CHANNEL, bin_msg_id)
+            if streamer.cache_message(msg) is None:
+                return False
+            media = getattr(msg, msg.media.value)
+            entry["file_id"] = media.file_id
+            entry["resolved_at"] = time.time()
+            if db:
+                await db.refresh_file_entry(entry["unique_id"], media.file_id)
+            return True
+
+        streamer.cache_media(Config.BIN_CHANNEL, bin_msg_id, entry["file_id"], {
+            "file_size": entry["file_size"],
+            "mime_type": entry["mime_type"],
+            "file_name": entry["file_name"],
+            "duration": entry["duration"],
+        }, entry["unique_id"])
+        metrics.incr("file_registry_primed")
+        return True
+
+    def get_stats(self) -> Dict:
+        """
+        Get registry size.
+
+        Returns:
+            Dictionary with cached entry count and limits
+        """
+        return {
+            "enabled": self.enabled,
+            "cached_entries": len(self.by_unique_id),
+            "cache_size": self.cache_size,
+            "pending_copies": len(self.pending),
+        }
+
+
+file_registry = FileRegistry()
@@ -0,0 +1,117 @@
+"""
+Job Queue - Bounded background queue for non-critical side effects
+"""
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from config import Config
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Runs side effects (stats updates, log-channel posts, user tracking) on a
+    fixed pool of worker tasks so handlers can reply first.
+
+    The queue is bounded: when it is full new jobs are dropped and counted
+    rather than piling up unbounded tasks behind a slow MongoDB or FloodWait.
+    """
+
+    def __init__(self, max_size: int = None, workers: int = None):
+        """Initialize with queue size and worker count, defaulting to Config values."""
+        self.max_size = Config.JOB_QUEUE_SIZE if max_size is None else max_size
+        self.num_workers = Config.JOB_WORKERS if workers is None else workers
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.closed = False
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Start the worker tasks (idempotent)."""
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.max_size)
+        self.closed = False
+        self.workers = [w for w in self.workers if not w.done()]
+        while len(self.workers) < self.num_workers:
+            self.workers.append(asyncio.create_task(self._worker()))
+
+    def submit(self, func: Callable[..., Awaitable], *args, name: str = None, **kwargs) -> bool:
+        """
+        Queue func(*args, **kwargs) to run in the background.
+
+        The coroutine is only created when a worker picks the job up, so a
+        dropped job leaves no un-awaited coroutine behind.
+
+        Returns:
+            True if queued, False if dropped because the queue is full or closed
+        """
+        if self.closed:
+            self.dropped += 1
+            metrics.incr("jobs_dropped")
+            return False
+        if not self.workers:
+            self.start()
+        try:
+            self.queue.put_nowait((name or getattr(func, "__name__", "job"), func, args, kwargs))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            metrics.incr("jobs_dropped")
+            logger.warning(f"Job queue full ({self.max_size}), dropping {name or func.__name__}")
+            return False
+        self.submitted += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            name, func, args, kwargs = await self.queue.get()
+            try:
+                await func(*args, **kwargs)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                metrics.incr("jobs_failed")
+                logger.error(f"Background job {name} failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def drain(self, timeout: float = None) -> None:
+        """Stop accepting jobs, wait for queued ones (up to timeout), then stop workers."""
+        self.closed = True
+        timeout = Config.JOB_DRAIN_TIMEOUT if timeout is None else timeout
+        if self.queue is not None and self.workers:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+                logger.info(f"Job queue drained in {time.monotonic() - started:.1f}s")
+            except asyncio.TimeoutError:
+                logger.warning(f"Job queue drain timed out with {self.queue.qsize()} jobs left")
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    def get_stats(self) -> Dict:
+        """
+        Get queue depth and job counters.
+
+        Returns:
+            Dictionary with depth, capacity, workers and submitted/completed/failed/dropped counts
+        """
+        return {
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_size": self.max_size,
+            "workers": len(self.workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+jobs = JobQueue()
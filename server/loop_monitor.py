@@ -0,0 +1,183 @@
+"""
+Loop Monitor - Event-loop lag sampling and blocking-call detection
+"""
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional
+
+from config import Config
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LoopBlockedError(AssertionError):
+    """Raised in strict mode when the event loop was blocked past the threshold."""
+
+
+class BlockEvent:
+    """One stall of the event loop, with the stack that was running when it was caught."""
+
+    def __init__(self, stack: List[str]):
+        self.at = time.time()
+        self.duration = 0.0  # Updated by the sampler once the loop gets going again
+        self.stack = stack
+
+    def to_dict(self) -> Dict:
+        return {
+            "at": self.at,
+            "duration_ms": round(self.duration * 1000, 1),
+            "stack": self.stack,
+        }
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop wakes up from a fixed sleep.
+
+    A watchdog thread checks the loop's heartbeat; when the loop has not
+    ticked for longer than the threshold it snapshots the loop thread's
+    stack with sys._current_frames(), which names the blocking callback
+    (a sync file write, a CPU-heavy parse, a time.sleep) while it still runs.
+    """
+
+    def __init__(self, interval: float = None, threshold: float = None, samples: int = None):
+        """Initialize with sampling interval, block threshold and history size from Config."""
+        self.interval = Config.LOOP_MONITOR_INTERVAL if interval is None else interval
+        self.threshold = Config.LOOP_BLOCK_THRESHOLD if threshold is None else threshold
+        self.lags: Deque[float] = deque(maxlen=Config.LOOP_LAG_SAMPLES if samples is None else samples)
+        self.blocks: Deque[BlockEvent] = deque(maxlen=20)
+        self.strict = Config.LOOP_MONITOR_STRICT
+        self.max_lag = 0.0
+        self.block_count = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._current_block: Optional[BlockEvent] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._violations: Deque[LoopBlockedError] = deque(maxlen=20)  # Strict mode, raised by check()
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+            block = self._current_block
+            if block is not None:
+                self._current_block = None
+                block.duration = lag + self.interval
+                metrics.incr("loop_blocks")
+                logger.warning(
+                    "Event loop blocked for %.0f ms in:\n%s", block.duration * 1000, "".join(block.stack)
+                )
+                if self.strict:
+                    # Raised on the caller side by check(): raising here would end the sampler
+                    self._violations.append(LoopBlockedError(
+                        f"Event loop blocked for {block.duration * 1000:.0f} ms\n" + "".join(block.stack)
+                    ))
+
+    def _watch(self) -> None:
+        # Poll at a fraction of the threshold so a block is caught while it is still running
+        poll = max(self.threshold / 4, 0.005)
+        while not self._stopping.wait(poll):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled < self.threshold or self._current_block is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            block = BlockEvent(traceback.format_stack(frame))
+            self.blocks.append(block)
+            self.block_count += 1
+            self._current_block = block
+
+    def start(self) -> None:
+        """Start sampling on the running loop (idempotent)."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._sample())
+        self._stopping.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Loop monitor started (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self) -> None:
+        """Stop sampling and the watchdog thread."""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def check(self) -> None:
+        """
+        Raise the oldest strict-mode violation not reported yet, if any.
+
+        Raises:
+            LoopBlockedError: With the captured stack of the blocking call
+        """
+        if self._violations:
+            raise self._violations.popleft()
+
+    @asynccontextmanager
+    async def expect_no_blocking(self):
+        """
+        Fail if the loop blocks past the threshold inside the block (for tests).
+
+        Raises:
+            LoopBlockedError: With the captured stack of the blocking call
+        """
+        self.start()
+        seen = self.block_count
+        yield
+        # Let the sampler wake up and time a block that just ended
+        await asyncio.sleep(self.interval * 2)
+        if self.block_count > seen:
+            # First block inside the context (the oldest one still kept)
+            block = self.blocks[max(len(self.blocks) - (self.block_count - seen), 0)]
+            raise LoopBlockedError(
+                f"Event loop blocked for {block.duration * 1000:.0f} ms\n" + "".join(block.stack)
+            )
+
+    def percentiles(self) -> Dict[str, float]:
+        """Lag percentiles in milliseconds over the recent samples."""
+        if not self.lags:
+            return {"p50": 0.0, "p90": 0.0, "p99": 0.0}
+        ordered = sorted(self.lags)
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+        return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99)}
+
+    def get_stats(self, detailed: bool = False) -> Dict:
+        """
+        Get lag percentiles and recent blocking events.
+
+        Args:
+            detailed: Include captured stacks instead of a count; admin only
+
+        Returns:
+            Dictionary with lag percentiles, max lag and blocking events
+        """
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "threshold_ms": self.threshold * 1000,
+            "samples": len(self.lags),
+            "lag_ms": self.percentiles(),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "blocks": [b.to_dict() for b in self.blocks] if detailed else len(self.blocks),
+        }
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,46 @@
+"""
+Metrics - Lightweight in-process counters for operators
+"""
+import time
+from typing import Dict
+
+# Global registries
+counters: Dict[str, int] = {}  # metric name -> value
+started_at = time.time()
+
+
+def incr(name: str, value: int = 1) -> None:
+    """
+    Increment a named counter.
+
+    Args:
+        name: Metric name (e.g. "part_fetch_retries")
+        value: Amount to add
+    """
+    counters[name] = counters.get(name, 0) + value
+
+
+def get(name: str) -> int:
+    """
+    Get the current value of a counter.
+
+    Args:
+        name: Metric name
+
+    Returns:
+        Counter value, 0 if never incremented
+    """
+    return counters.get(name, 0)
+
+
+def get_stats() -> Dict:
+    """
+    Get a snapshot of all counters.
+
+    Returns:
+        Dictionary with uptime and counter values
+    """
+    return {
+        "uptime_seconds": int(time.time() - started_at),
+        "counters": dict(sorted(counters.items())),
+    }
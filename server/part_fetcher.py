@@ -0,0 +1,131 @@
+"""
+Part Fetcher - Resilient GetFile calls with bounded backoff and retry budgets
+"""
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, TypeVar
+from pyrogram.errors import FloodWait, InternalServerError, ServiceUnavailable
+
+from config import Config
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Errors worth retrying: network hiccups, Telegram-side 5xx, and the
+# AttributeError pyrogram raises when a media session lost its connection.
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    asyncio.TimeoutError,
+    OSError,
+    AttributeError,
+    InternalServerError,
+    ServiceUnavailable,
+)
+
+
+class RetryBudget:
+    """
+    Retry allowance shared by every part of a single stream.
+
+    A flaky DC can make each part need a retry or two; the budget stops one
+    response from retrying forever and holding a connection open.
+    """
+
+    def __init__(self, limit: int = None):
+        """Initialize the budget with a number of allowed retries."""
+        self.limit = Config.STREAM_RETRY_BUDGET if limit is None else limit
+        self.used = 0
+
+    @property
+    def remaining(self) -> int:
+        """Retries left for this stream."""
+        return max(self.limit - self.used, 0)
+
+    def consume(self) -> bool:
+        """
+        Take one retry from the budget.
+
+        Returns:
+            True if a retry was available, False if the budget is exhausted
+        """
+        if self.used >= self.limit:
+            return False
+        self.used += 1
+        return True
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempt: Retry number, starting at 1
+
+    Returns:
+        Seconds to sleep before the next attempt
+    """
+    ceiling = min(
+        Config.STREAM_RETRY_MAX_DELAY,
+        Config.STREAM_RETRY_BASE_DELAY * (2 ** (attempt - 1)),
+    )
+    return random.uniform(0, ceiling)
+
+
+async def fetch_part(
+    fetch: Callable[[], Awaitable[T]],
+    budget: RetryBudget,
+    reset_session: Optional[Callable[[], Awaitable[None]]] = None,
+    description: str = "part",
+) -> T:
+    """
+    Run a part fetch, retrying transient failures.
+
+    Args:
+        fetch: Coroutine factory performing one GetFile request
+        budget: Per-stream retry budget
+        reset_session: Optional coroutine factory replacing the media session,
+            called after repeated failures
+        description: Human-readable label used in logs
+
+    Returns:
+        Whatever fetch returns
+
+    Raises:
+        The last error once attempts or the budget are exhausted
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fetch()
+        except FloodWait as e:
+            if e.value > Config.STREAM_FLOODWAIT_THRESHOLD or not budget.consume():
+                metrics.incr("part_fetch_exhausted")
+                raise
+            metrics.incr("part_fetch_floodwaits")
+            logger.warning(f"FloodWait fetching {description}: sleeping {e.value}s")
+            await asyncio.sleep(e.value)
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            metrics.incr("part_fetch_retries")
+            if attempt >= Config.STREAM_RETRY_ATTEMPTS or not budget.consume():
+                metrics.incr("part_fetch_exhausted")
+                logger.error(
+                    f"Giving up on {description} after {attempt} attempts "
+                    f"({budget.remaining} retries left in budget): {e!r}"
+                )
+                raise
+
+            if reset_session is not None and attempt % Config.STREAM_SESSION_RESET_AFTER == 0:
+                metrics.incr("media_session_resets")
+                logger.warning(f"Replacing media session after {attempt} failures on {description}")
+                try:
+                    await reset_session()
+                except Exception as reset_err:
+                    logger.error(f"Failed to reset media session: {reset_err}")
+
+            delay = backoff_delay(attempt)
+            logger.info(f"Retrying {description} in {delay:.2f}s (attempt {attempt}): {e!r}")
+            await asyncio.sleep(delay)
@@ -0,0 +1,146 @@
+"""
+Playlist - Lazily generated M3U playlists for message ranges
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+
+from config import Config
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram returns at most 200 messages per get_messages call
+PAGE_SIZE = 200
+
+# (message_id, title, duration) of each media message in a page
+PageEntries = List[Tuple[int, str, int]]
+
+
+class PageCache:
+    """
+    LRU cache of playlist entries per aligned 200-id page.
+
+    Pages are aligned to multiples of PAGE_SIZE, so overlapping ranges
+    (a season, then one episode range inside it) share fetched pages.
+    """
+
+    def __init__(self, max_pages: int = None, ttl: float = None):
+        """Initialize with size and age limits, defaulting to Config values."""
+        self.max_pages = Config.PLAYLIST_CACHE_PAGES if max_pages is None else max_pages
+        self.ttl = Config.PLAYLIST_CACHE_TTL if ttl is None else ttl
+        self.pages: "OrderedDict[Tuple[int, int], Tuple[float, PageEntries]]" = OrderedDict()
+
+    def get(self, chat_id: int, page_start: int) -> Optional[PageEntries]:
+        key = (chat_id, page_start)
+        cached = self.pages.get(key)
+        if cached is None:
+            return None
+        cached_at, entries = cached
+        if time.time() - cached_at > self.ttl:
+            del self.pages[key]
+            return None
+        self.pages.move_to_end(key)
+        return entries
+
+    def put(self, chat_id: int, page_start: int, entries: PageEntries) -> None:
+        self.pages[(chat_id, page_start)] = (time.time(), entries)
+        self.pages.move_to_end((chat_id, page_start))
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+
+
+page_cache = PageCache()
+
+
+def _entry_title(msg, media) -> str:
+    """Display title for #EXTINF: file name, else first caption line, else the message id."""
+    title = getattr(media, "title", None) or getattr(media, "file_name", None)
+    if not title and msg.caption:
+        title = msg.caption.splitlines()[0]
+    title = title or f"Message {msg.id}"
+    return " ".join(title.split())  # M3U entries are single lines
+
+
+async def _fetch_page(client: Client, chat_id: int, page_start: int, streamer=None) -> Optional[PageEntries]:
+    """Fetch one aligned page of messages, returning None if it could not be fetched."""
+    ids = list(range(max(page_start, 1), page_start + PAGE_SIZE))
+    while True:
+        try:
+            msgs = await client.get_messages(chat_id, ids)
+            break
+        except FloodWait as e:
+            if e.value > Config.STREAM_FLOODWAIT_THRESHOLD:
+                logger.warning(f"Playlist page {chat_id}/{page_start}: FloodWait {e.value}s, giving up")
+                return None
+            await asyncio.sleep(e.value)
+        except Exception as e:
+            logger.error(f"Playlist page {chat_id}/{page_start} fetch failed: {e}")
+            return None
+
+    entries: PageEntries = []
+    for msg in msgs:
+        if not msg or getattr(msg, "empty", False) or not msg.media:
+            continue
+        media = getattr(msg, msg.media.value, None)
+        if media is None or not getattr(media, "file_id", None):
+            continue
+        if streamer is not None:
+            streamer.cache_message(msg)  # Playing an entry then skips get_messages
+        entries.append((msg.id, _entry_title(msg, media), getattr(media, "duration", 0) or 0))
+    return entries
+
+
+async def iter_playlist(
+    client: Client,
+    chat_id: int,
+    first_id: int,
+    last_id: int,
+    streamer=None,
+) -> AsyncGenerator[str, None]:
+    """
+    Yields an extended M3U playlist for messages first_id..last_id, page by page.
+
+    Args:
+        client: Pyrogram client used for get_messages
+        chat_id: Telegram chat ID
+        first_id: First message ID (inclusive)
+        last_id: Last message ID (inclusive)
+        streamer: Optional ByteStreamer whose metadata cache is pre-populated
+
+    Yields:
+        Playlist text, one page of entries at a time
+    """
+    yield "#EXTM3U\n"
+    page_start = first_id - first_id % PAGE_SIZE
+    while page_start <= last_id:
+        entries = page_cache.get(chat_id, page_start)
+        if entries is None:
+            metrics.incr("playlist_page_misses")
+            entries = await _fetch_page(client, chat_id, page_start, streamer)
+            if entries is not None:
+                page_cache.put(chat_id, page_start, entries)
+            else:
+                # Leave a visible marker instead of a silent gap (players skip # comment lines)
+                gap_first, gap_last = max(page_start, first_id), min(page_start + PAGE_SIZE - 1, last_id)
+                metrics.incr("playlist_page_errors")
+                logger.warning(f"Playlist {chat_id}/{first_id}-{last_id}: messages {gap_first}-{gap_last} missing")
+                yield f"# Messages {gap_first}-{gap_last} could not be loaded\n"
+        else:
+            metrics.incr("playlist_page_hits")
+
+        lines = []
+        for msg_id, title, duration in entries or ():
+            if first_id <= msg_id <= last_id:
+                lines.append(
+                    f"#EXTINF:{duration if duration > 0 else -1},{title}\n"
+                    f"{Config.URL}/stream/{chat_id}/{msg_id}\n"
+                )
+        if lines:
+            yield "".join(lines)
+        page_start += PAGE_SIZE
@@ -0,0 +1,152 @@
+"""
+Popularity - Heavy-hitter tracking of streamed and linked files (space-saving sketch)
+"""
+import time
+import logging
+from typing import Dict, Hashable, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SpaceSaving:
+    """
+    Space-saving top-k summary (Metwally, Agrawal & El Abbadi).
+
+    Monitors at most `capacity` keys. An unmonitored key replaces the one
+    with the lowest count and inherits that count as its error bound, so
+    every true heavy hitter is kept and its count is over-estimated by at
+    most `error`.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1)
+        self.counts: Dict[Hashable, float] = {}
+        self.errors: Dict[Hashable, float] = {}
+
+    def offer(self, key: Hashable, weight: float = 1.0) -> Optional[Hashable]:
+        """
+        Count one occurrence of key.
+
+        Returns:
+            The key evicted to make room, if any
+        """
+        if key in self.counts:
+            self.counts[key] += weight
+            return None
+        evicted = None
+        floor = 0.0
+        if len(self.counts) >= self.capacity:
+            evicted = min(self.counts, key=self.counts.__getitem__)
+            floor = self.counts.pop(evicted)
+            self.errors.pop(evicted, None)
+        self.counts[key] = floor + weight
+        self.errors[key] = floor
+        return evicted
+
+    def scale(self, factor: float) -> None:
+        """Multiply every count (and error) by factor, e.g. for exponential decay."""
+        for key in self.counts:
+            self.counts[key] *= factor
+            self.errors[key] *= factor
+
+    def top(self, n: int) -> List[tuple]:
+        """(key, count, error) for the n highest counts."""
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+
+class PopularityTracker:
+    """
+    Trending files by canonical file key, with exponentially decaying counts.
+
+    Stream views and link generations both count. Counts halve every
+    POPULARITY_HALF_LIFE seconds, so tonight's spike outranks last week's
+    hit. Enough metadata is kept per monitored file for the cache warmer
+    to fetch it (a chat/message to resolve it from, size and duration).
+    """
+
+    def __init__(self, capacity: int = None, half_life: float = None):
+        """Initialize with summary capacity and half-life from Config."""
+        self.summary = SpaceSaving(Config.POPULARITY_CAPACITY if capacity is None else capacity)
+        self.half_life = Config.POPULARITY_HALF_LIFE if half_life is None else half_life
+        self.files: Dict[Hashable, Dict] = {}  # Metadata of monitored keys only
+        self.events = 0
+        self._decayed_at = time.monotonic()
+
+    def _decay(self) -> None:
+        if not self.half_life:
+            return
+        now = time.monotonic()
+        elapsed = now - self._decayed_at
+        # Applied in steps of a tenth of the half-life to keep offers O(1)
+        if elapsed >= self.half_life / 10:
+            self.summary.scale(0.5 ** (elapsed / self.half_life))
+            self._decayed_at = now
+
+    def _record(self, kind: str, file_key: Hashable, chat_id: int, message_id: int, info: Optional[Dict]) -> None:
+        self._decay()
+        self.events += 1
+        evicted = self.summary.offer(file_key)
+        if evicted is not None:
+            self.files.pop(evicted, None)
+        meta = self.files.setdefault(file_key, {"streams": 0, "links": 0})
+        meta[kind] += 1
+        meta.update(chat_id=chat_id, message_id=message_id, last_seen=time.time())
+        if info:
+            meta.update(
+                file_name=info.get("file_name"),
+                file_size=info.get("file_size", 0) or 0,
+                duration=info.get("duration", 0) or 0,
+            )
+
+    def record_stream(self, file_key: Hashable, chat_id: int, message_id: int, info: Dict = None) -> None:
+        """Count a new viewing of a file (a stream request starting at its head)."""
+        self._record("streams", file_key, chat_id, message_id, info)
+
+    def record_link(self, file_key: Hashable, chat_id: int, message_id: int, info: Dict = None) -> None:
+        """Count a stream link generated for a file."""
+        self._record("links", file_key, chat_id, message_id, info)
+
+    def top(self, n: int = None) -> List[Dict]:
+        """
+        Current trending files.
+
+        Args:
+            n: Number of files, defaults to POPULARITY_TOP_K
+
+        Returns:
+            List of dicts with file key, decayed score, error bound and metadata
+        """
+        self._decay()
+        n = Config.POPULARITY_TOP_K if n is None else n
+        return [
+            {"file_key": key, "score": round(count, 2), "error": round(error, 2), **self.files.get(key, {})}
+            for key, count, error in self.summary.top(n)
+        ]
+
+    def get_stats(self, detailed: bool = False) -> Dict:
+        """
+        Get tracker counters, and the top 10 if detailed.
+
+        Args:
+            detailed: Include file keys and names of the top files; admin only
+
+        Returns:
+            Dictionary with event count, monitored keys and top files
+        """
+        stats = {
+            "events": self.events,
+            "monitored": len(self.summary.counts),
+            "half_life_seconds": self.half_life,
+        }
+        if detailed:
+            stats["top"] = [
+                {"file_key": str(e["file_key"]), "score": e["score"], "file_name": e.get("file_name")}
+                for e in self.top(10)
+            ]
+        return stats
+
+
+popularity = PopularityTracker()
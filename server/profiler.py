@@ -0,0 +1,222 @@
+"""
+Profiler - On-demand sampling CPU profiles and tracemalloc snapshots
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# Innermost Python frames of a thread parked in a blocking call; these are not CPU time
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),  # Idle executor worker in work_queue.get()
+    ("handlers.py", "dequeue"),  # QueueListener waiting for records
+}
+# The sampler can only look when it gets the GIL. At the default 5 ms switch interval it mostly
+# gets it when the loop releases it voluntarily (in select), hiding the CPU work in between.
+SAMPLING_SWITCH_INTERVAL = 0.0005
+# Diagnostics threads that would only show up as noise
+EXCLUDED_THREADS = {"loop-watchdog", "log-listener", "trace-exporter", "access-trace"}
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a CPU profile is requested while another one is running."""
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    short = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of working threads from a background thread at a fixed interval.
+
+    Nothing is installed in the profiled code (no sys.setprofile), so the
+    cost is one sys._current_frames() walk per interval and the event loop
+    keeps serving streams while the profile runs. Threads parked in a
+    blocking wait (the loop in select, idle executor workers) and the
+    diagnostics threads are left out, so the profile shows CPU work only.
+    Output is in the collapsed format ("frame;frame;frame count") read by
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = None):
+        """Initialize with the sampling interval, defaulting to Config."""
+        self.interval = Config.PROFILE_INTERVAL if interval is None else interval
+        self.running = False
+        self.last_summary: Optional[Dict] = None
+
+    def _sample(self, seconds: float, stacks: Counter, loop_thread_id: int) -> Dict:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        names[loop_thread_id] = "event-loop"
+        ticks = idle = 0
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(switch_interval, SAMPLING_SWITCH_INTERVAL))
+        try:
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                ticks += 1
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me or names.get(thread_id) in EXCLUDED_THREADS:
+                        continue
+                    code = frame.f_code
+                    if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                        idle += 1
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(names.get(thread_id, f"thread-{thread_id}"))
+                    stacks[";".join(reversed(labels))] += 1
+                time.sleep(self.interval)
+        finally:
+            sys.setswitchinterval(switch_interval)
+        return {"ticks": ticks, "idle_samples": idle}
+
+    async def profile(self, seconds: float) -> str:
+        """
+        Sample working threads for `seconds` and return collapsed stacks.
+
+        Args:
+            seconds: Profile length, capped at PROFILE_MAX_SECONDS
+
+        Returns:
+            Collapsed stack text, one "stack count" line per distinct stack
+
+        Raises:
+            ProfilerBusy: If a profile is already running
+        """
+        if self.running:
+            raise ProfilerBusy("A CPU profile is already running")
+        seconds = max(0.1, min(seconds, Config.PROFILE_MAX_SECONDS))
+        self.running = True
+        stacks: Counter = Counter()
+        started = time.monotonic()
+        try:
+            counts = await asyncio.get_running_loop().run_in_executor(
+                None, self._sample, seconds, stacks, threading.get_ident()
+            )
+        finally:
+            self.running = False
+        self.last_summary = {
+            "seconds": round(time.monotonic() - started, 2),
+            "samples": sum(stacks.values()),
+            "distinct_stacks": len(stacks),
+            **counts,
+        }
+        logger.info(
+            "CPU profile done: %s samples over %ss", self.last_summary["samples"], self.last_summary["seconds"]
+        )
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def top_frames(collapsed: str, limit: int = 10) -> List[str]:
+    """Leaf frames with the most samples, for a quick text summary."""
+    leaves: Counter = Counter()
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(" ")
+        leaves[stack.rsplit(";", 1)[-1]] += int(count)
+    total = sum(leaves.values()) or 1
+    return [f"{count * 100 / total:5.1f}%  {frame}" for frame, count in leaves.most_common(limit)]
+
+
+class MemoryTracer:
+    """
+    tracemalloc wrapper for on-demand allocation snapshots and diffs.
+
+    Tracing is off until started because it slows every allocation; it
+    keeps only the last snapshot as the baseline for the next diff.
+    """
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = None) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(Config.TRACEMALLOC_FRAMES if frames is None else frames)
+            self.baseline = None
+            logger.info("tracemalloc started")
+
+    def stop(self) -> None:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("tracemalloc stopped")
+        self.baseline = None
+
+    def _take(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running; start it first")
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def snapshot(self, limit: int = 20) -> Dict:
+        """
+        Top allocation sites by size; the snapshot becomes the next diff's baseline.
+
+        Returns:
+            Dictionary with traced totals and the top `limit` sites
+        """
+        snap = self._take()
+        self.baseline = snap
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {"site": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                for stat in snap.statistics("lineno")[:limit]
+            ],
+        }
+
+    def diff(self, limit: int = 20) -> Dict:
+        """
+        Allocation growth per site since the previous snapshot (or diff).
+
+        Returns:
+            Dictionary with the top `limit` sites by size change
+        """
+        snap = self._take()
+        if self.baseline is None:
+            self.baseline = snap
+            return {"baseline_taken": True, "top": []}
+        changes = snap.compare_to(self.baseline, "lineno")
+        self.baseline = snap
+        return {
+            "baseline_taken": False,
+            "top": [
+                {
+                    "site": str(stat.traceback[0]),
+                    "size_diff_bytes": stat.size_diff,
+                    "size_bytes": stat.size,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in changes[:limit]
+            ],
+        }
+
+
+profiler = SamplingProfiler()
+memory_tracer = MemoryTracer()
@@ -3,27 +3,31 @@ Improved streaming routes with ByteStreamer integration
 """
 import re
 import math
+import time
 import logging
 import mimetypes
 from fastapi import APIRouter, Request, HTTPException, Response
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from bot_client import bot
-from server.byte_streamer import ByteStreamer
+from config import Config
+from database import db
+from server.byte_streamer import get_byte_streamer
+from server import metrics, dc_mapping, file_identity, session_manager, tracing
+from server.admission import AdmissionRejected, admission, client_ip
+from server.access_trace import recorder as access_recorder
+from server.chunk_cache import PART_SIZE, chunk_cache
+from server.popularity import popularity
+from server.cache_warmer import cache_warmer
+from server.scheduler import scheduler
+from server.playlist import iter_playlist
+from server.job_queue import jobs
+from server.file_registry import file_registry
+from server.loop_monitor import loop_monitor
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# Global ByteStreamer instance (cached)
-byte_streamer: ByteStreamer = None
-
-
-async def get_byte_streamer() -> ByteStreamer:
-    """Get or create ByteStreamer instance."""
-    global byte_streamer
-    if byte_streamer is None:
-        byte_streamer = ByteStreamer(bot)
-    return byte_streamer
-
 
 @router.get("/stream/{chat_id}/{message_id}")
 async def stream_media(chat_id: int, message_id: int, request: Request):
@@ -31,28 +35,84 @@ async def stream_media(chat_id: int, message_id: int, request: Request):
     Stream media files from Telegram with Range request support.
     Uses ByteStreamer for efficient caching and session management.
     """
-    logger.info(f"Stream request: Chat {chat_id}, Message {message_id}")
+    # Every log line and span below carries this request's id
+    trace = tracing.start_trace(
+        "stream_media",
+        request.headers.get("x-request-id"),
+        chat_id=chat_id,
+        message_id=message_id,
+        range=request.headers.get("range", ""),
+    )
+    logger.info("Stream request: Chat %s, Message %s", chat_id, message_id)
     
+    try:
+        response = await admit_stream(chat_id, message_id, request, trace)
+    except BaseException as e:
+        trace.root.attributes["status"] = getattr(e, "status_code", 500)
+        trace.finish(e)
+        raise
+    if not isinstance(response, StreamingResponse):
+        trace.root.attributes["status"] = response.status_code
+        trace.finish()
+    response.headers["X-Request-ID"] = trace.request_id
+    return response
+
+
+async def admit_stream(chat_id: int, message_id: int, request: Request, trace) -> Response:
+    """Admission control around serve_stream; the ticket lives as long as the response body."""
     if not bot.is_connected:
         logger.warning(f"Bot not connected. Status: {bot.boot_status}")
         raise HTTPException(status_code=503, detail=f"Bot Unavailable: {bot.boot_status}")
 
-    # Get message and validate media
+    # Admission control: shed load early instead of degrading every stream
+    try:
+        with tracing.span("admission"):
+            # Per-file cap counts every link to the same bytes together
+            ticket = await admission.acquire(client_ip(request), file_identity.file_key(chat_id, message_id))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy ({e.reason}), please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    try:
+        response = await serve_stream(chat_id, message_id, request, ticket, trace)
+    except BaseException:
+        ticket.release()
+        raise
+    if not isinstance(response, StreamingResponse):
+        ticket.release()
+    return response
+
+
+async def serve_stream(chat_id: int, message_id: int, request: Request, ticket, trace) -> Response:
+    """
+    Builds the response for an admitted stream request.
+    The admission ticket is released and the trace finished when the body
+    finishes or the client disconnects.
+    """
+    # Get ByteStreamer instance
+    streamer = await get_byte_streamer()
+
+    # Get media properties (cached if available, e.g. pre-populated by /batch)
     try:
-        msg = await bot.get_messages(chat_id, message_id)
+        if chat_id == Config.BIN_CHANNEL:
+            # Bin channel copies are described by their registry entry
+            with tracing.span("file_registry.prime"):
+                await file_registry.prime(streamer, bot, message_id)
+        with tracing.span("get_media_info", cached=streamer.is_cached(chat_id, message_id)):
+            media_info = await streamer.get_media_info(chat_id, message_id)
     except Exception as e:
         logger.error(f"Failed to get message {message_id} from chat {chat_id}: {e}")
         raise HTTPException(status_code=404, detail="Message not found")
 
-    if not msg or not msg.media:
+    if not media_info:
         raise HTTPException(status_code=404, detail="No media found in message")
 
-    # Extract media properties
-    media = getattr(msg, msg.media.value)
-    file_id = media.file_id
-    file_size = media.file_size
-    mime_type = getattr(media, "mime_type", "application/octet-stream")
-    file_name = getattr(media, "file_name", "video.mp4")
+    file_size = media_info["file_size"]
+    mime_type = media_info["mime_type"]
+    file_name = media_info["file_name"] or "video.mp4"
 
     # Improve MIME type detection
     if mime_type == "application/octet-stream" and file_name:
@@ -82,6 +142,10 @@ async def stream_media(chat_id: int, message_id: int, request: Request):
             headers={"Content-Range": f"bytes */{file_size}"}
         )
 
+    if start < PART_SIZE:
+        # A request for the head is a new viewing; seeks and probes are not counted
+        popularity.record_stream(file_identity.file_key(chat_id, message_id), chat_id, message_id, media_info)
+
     # Calculate chunk parameters (aligned to 4096 bytes for Telegram)
     chunk_size = 1024 * 1024  # 1 MB chunks
     until_bytes = min(end, file_size - 1)
@@ -96,23 +160,29 @@ async def stream_media(chat_id: int, message_id: int, request: Request):
     req_length = until_bytes - start + 1
 
     logger.debug(
-        f"Range: {start}-{until_bytes}/{file_size}, "
-        f"Offset: {offset}, Parts: {part_count}, "
-        f"First cut: {first_part_cut}, Last cut: {last_part_cut}"
+        "Range: %s-%s/%s, Offset: %s, Parts: %s, First cut: %s, Last cut: %s",
+        start, until_bytes, file_size, offset, part_count, first_part_cut, last_part_cut,
     )
 
-    # Get ByteStreamer instance
-    streamer = await get_byte_streamer()
-    
     # Get file properties (cached if available)
     try:
-        file_props = await streamer.get_file_properties(chat_id, message_id)
+        with tracing.span("get_file_properties"):
+            file_props = await streamer.get_file_properties(chat_id, message_id)
     except Exception as e:
         logger.error(f"Failed to get file properties: {e}")
         raise HTTPException(status_code=500, detail="Failed to process file")
 
-    # Stream generator using ByteStreamer
+    trace.root.attributes.update(status=206 if range_header else 200, dc_id=file_props.dc_id, parts=part_count)
+
+    # Stream generator using ByteStreamer, fair-queued per client IP
     async def stream_generator():
+        # The body runs in the server's task; re-enter the request's trace there
+        tracing.activate(trace)
+        handle = scheduler.open_stream(ticket.client_ip, f"{chat_id}/{message_id} @ {start}")
+        error = None
+        sent = chunks = 0
+        write_ns = 0
+        first_byte_ns = None
         try:
             async for chunk in streamer.yield_file(
                 file_props,
@@ -120,12 +190,46 @@ async def stream_media(chat_id: int, message_id: int, request: Request):
                 first_part_cut,
                 last_part_cut,
                 part_count,
-                chunk_size
+                chunk_size,
+                stream=handle,
             ):
+                if first_byte_ns is None:
+                    trace.mark_first_byte()
+                    first_byte_ns = time.time_ns()
+                # Time spent suspended at yield is the server writing to the client
+                resumed = time.perf_counter_ns()
                 yield chunk
-        except Exception as e:
-            logger.exception(f"Streaming error: {e}")
+                write_ns += time.perf_counter_ns() - resumed
+                sent += len(chunk)
+                chunks += 1
+        except BaseException as e:
+            error = e
+            if isinstance(e, Exception):
+                logger.exception(f"Streaming error: {e}")
             raise
+        finally:
+            handle.close()
+            ticket.release()
+            if first_byte_ns is not None:
+                trace.record(
+                    "http.write", first_byte_ns, time.time_ns(),
+                    bytes=sent, chunks=chunks, blocked_ms=round(write_ns / 1e6, 1),
+                )
+            trace.root.attributes["bytes_sent"] = sent
+            trace.finish(error)
+            access_recorder.record(
+                trace.root.start_ns / 1e9,
+                ticket.client_ip,
+                file_identity.file_key(chat_id, message_id),
+                file_size,
+                start,
+                until_bytes,
+                sent,
+            )
+
+    def release():
+        ticket.release()
+        trace.finish()
 
     # Response headers
     headers = {
@@ -140,7 +244,67 @@ async def stream_media(chat_id: int, message_id: int, request: Request):
         stream_generator(),
         status_code=206 if range_header else 200,
         headers=headers,
-        media_type=mime_type
+        media_type=mime_type,
+        background=BackgroundTask(release),
+    )
+
+
+PLAYLIST_MEDIA_TYPES = {
+    "m3u": "audio/x-mpegurl",
+    "m3u8": "application/vnd.apple.mpegurl",
+}
+
+
+@router.get("/playlist/{chat_id}/{first_id}/{last_id}.{ext}")
+async def playlist(chat_id: int, first_id: int, last_id: int, ext: str, request: Request):
+    """
+    Stream an M3U/M3U8 playlist of every media message in a range.
+    Entries are generated page by page, so whole seasons open in VLC from one URL.
+    Each request holds an admission slot while it fetches pages, so one client
+    cannot fan out get_messages calls past the per-IP cap.
+    """
+    if ext not in PLAYLIST_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Playlist format must be .m3u or .m3u8")
+    if first_id <= 0 or first_id > last_id:
+        raise HTTPException(status_code=400, detail="Invalid message range")
+    if last_id - first_id + 1 > Config.PLAYLIST_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range too large (max {Config.PLAYLIST_MAX_MESSAGES} messages)",
+        )
+    if not bot.is_connected:
+        raise HTTPException(status_code=503, detail=f"Bot Unavailable: {bot.boot_status}")
+
+    try:
+        # A fresh key per request: only the per-IP and global caps apply, not the per-file one
+        ticket = await admission.acquire(client_ip(request), ("playlist", object()))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy ({e.reason}), please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    try:
+        streamer = await get_byte_streamer()
+    except BaseException:
+        ticket.release()
+        raise
+
+    async def playlist_generator():
+        try:
+            async for text in iter_playlist(bot, chat_id, first_id, last_id, streamer):
+                yield text.encode("utf-8")
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        playlist_generator(),
+        media_type=PLAYLIST_MEDIA_TYPES[ext],
+        headers={
+            "Content-Disposition": f'inline; filename="playlist_{first_id}_{last_id}.{ext}"',
+        },
+        background=BackgroundTask(ticket.release),
     )
 
 
@@ -156,7 +320,8 @@ async def root():
             "Range request support",
             "File caching",
             "Media session management",
-            "VLC compatible streaming"
+            "VLC compatible streaming",
+            "M3U playlists for message ranges"
         ],
         "message": "Send a file to the bot to get a stream link."
     }
@@ -170,3 +335,25 @@ async def health_check():
         "bot_connected": bot.is_connected,
         "bot_status": bot.boot_status if hasattr(bot, 'boot_status') else "Unknown"
     }
+
+
+@router.get("/stats")
+async def stats():
+    """Operational counters (retries, truncations, sessions, DC mappings); detail is in /admin/stats."""
+    return {
+        "metrics": metrics.get_stats(),
+        "admission": admission.get_stats(),
+        "bandwidth": scheduler.get_stats(),
+        "sessions": session_manager.get_stats(),
+        "dc_mapping": dc_mapping.get_stats(),
+        "file_identity": file_identity.get_stats(),
+        "database": db.breaker.get_stats() if db else None,
+        "jobs": jobs.get_stats(),
+        "file_registry": file_registry.get_stats(),
+        "event_loop": loop_monitor.get_stats(),
+        "tracing": tracing.get_stats(),
+        "access_trace": access_recorder.get_stats(),
+        "chunk_cache": chunk_cache.get_stats(),
+        "popularity": popularity.get_stats(),
+        "cache_warmer": cache_warmer.get_stats(),
+    }
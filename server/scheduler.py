@@ -0,0 +1,211 @@
+"""
+Fair Scheduler - Weighted fair queuing of Telegram part fetches across streams
+"""
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Tuple
+
+from config import Config
+from server import metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower is served first
+INTERACTIVE = 0  # Player is blocked on these bytes (startup, seek, tail probe)
+BULK = 1  # Read-ahead and sustained downloads
+BACKGROUND = 2  # Cache warming; only served when no stream fetch is waiting
+
+RATE_WINDOW = 10.0  # Seconds of history used for per-stream bandwidth
+
+
+class StreamHandle:
+    """
+    One active stream registered with the scheduler.
+
+    Parts are fetched through slot(); delivered bytes are reported with record()
+    so operators can see per-stream bandwidth.
+    """
+
+    def __init__(self, scheduler: "FairScheduler", stream_id: int, flow: str, label: str):
+        self.scheduler = scheduler
+        self.stream_id = stream_id
+        self.flow = flow
+        self.label = label
+        self.started_at = time.time()
+        self.bytes_sent = 0
+        self.parts_fetched = 0
+        self.window: Deque[Tuple[float, int]] = deque()  # (timestamp, bytes)
+        self.closed = False
+
+    def priority_for(self, part_index: int) -> int:
+        """First INTERACTIVE_PARTS parts of a response are what the player waits on."""
+        return INTERACTIVE if part_index < Config.INTERACTIVE_PARTS else BULK
+
+    @asynccontextmanager
+    async def slot(self, priority: int, nbytes: int):
+        """Hold one fetch slot for the duration of a GetFile call."""
+        await self.scheduler.acquire(self.flow, priority, nbytes)
+        try:
+            yield
+        finally:
+            self.scheduler.release()
+        self.parts_fetched += 1
+
+    def record(self, nbytes: int) -> None:
+        """Record bytes delivered to the client."""
+        now = time.time()
+        self.bytes_sent += nbytes
+        self.window.append((now, nbytes))
+        while self.window and now - self.window[0][0] > RATE_WINDOW:
+            self.window.popleft()
+
+    def rate(self) -> float:
+        """Bytes per second over the last RATE_WINDOW seconds."""
+        now = time.time()
+        recent = sum(n for ts, n in self.window if now - ts <= RATE_WINDOW)
+        return recent / min(RATE_WINDOW, max(now - self.started_at, 1.0))
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.scheduler._close_stream(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "flow": self.flow,
+            "label": self.label,
+            "age_seconds": int(time.time() - self.started_at),
+            "bytes_sent": self.bytes_sent,
+            "parts_fetched": self.parts_fetched,
+            "rate_bps": int(self.rate()),
+        }
+
+
+class FairScheduler:
+    """
+    Start-time fair queuing over a fixed number of in-flight part fetches.
+
+    Every flow (client IP) gets an equal share of Telegram throughput no matter
+    how many connections it opens, so a download accelerator competes as one
+    viewer. Waiting fetches are ordered by (priority class, virtual start tag).
+    """
+
+    def __init__(self, max_inflight: int = None):
+        """Initialize with the global in-flight fetch limit (0 disables scheduling)."""
+        self.max_inflight = Config.MAX_INFLIGHT_PARTS if max_inflight is None else max_inflight
+        self.inflight = 0
+        self.virtual_time = 0.0
+        self.flow_finish: Dict[str, float] = {}  # flow -> virtual finish tag of its last fetch
+        self.flow_weights: Dict[str, float] = {}  # flow -> weight (default 1.0)
+        self.queue: List[Tuple[int, float, int, asyncio.Future]] = []
+        self.streams: Dict[int, StreamHandle] = {}
+        self._seq = itertools.count()
+        self._stream_ids = itertools.count(1)
+
+    def open_stream(self, flow: str, label: str = "") -> StreamHandle:
+        """
+        Register an active stream.
+
+        Args:
+            flow: Fairness key, normally the client IP
+            label: Human-readable description for stats
+
+        Returns:
+            StreamHandle; call close() when the stream ends
+        """
+        handle = StreamHandle(self, next(self._stream_ids), flow, label)
+        self.streams[handle.stream_id] = handle
+        return handle
+
+    def _close_stream(self, handle: StreamHandle) -> None:
+        self.streams.pop(handle.stream_id, None)
+        if not any(s.flow == handle.flow for s in self.streams.values()):
+            # Idle flows earn no credit, so their tags can be forgotten
+            self.flow_finish.pop(handle.flow, None)
+
+    def set_weight(self, flow: str, weight: float) -> None:
+        """Give a flow a larger (or smaller) share than the default 1.0."""
+        self.flow_weights[flow] = weight
+
+    async def acquire(self, flow: str, priority: int, nbytes: int) -> None:
+        """Wait until this flow's fetch is due."""
+        if not self.max_inflight:
+            return
+
+        start = max(self.virtual_time, self.flow_finish.get(flow, 0.0))
+        self.flow_finish[flow] = start + nbytes / self.flow_weights.get(flow, 1.0)
+
+        if self.inflight < self.max_inflight and not self.queue:
+            self.inflight += 1
+            self.virtual_time = max(self.virtual_time, start)
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, start, next(self._seq), waiter))
+        metrics.incr("scheduler_waits")
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted as we were cancelled: hand it on
+                self.release()
+            else:
+                waiter.cancel()  # Skipped lazily when popped
+            raise
+
+    def release(self) -> None:
+        """Free a fetch slot and grant it to the next due fetch."""
+        if not self.max_inflight:
+            return
+        self.inflight -= 1
+        while self.queue:
+            priority, start, _, waiter = heapq.heappop(self.queue)
+            if waiter.done():
+                continue
+            self.inflight += 1
+            self.virtual_time = max(self.virtual_time, start)
+            waiter.set_result(None)
+            break
+
+    def is_idle(self, share: float) -> bool:
+        """True if nothing is queued and under `share` of the fetch slots are in use."""
+        if any(not w.done() for *_, w in self.queue):
+            return False
+        return not self.max_inflight or self.inflight < self.max_inflight * share
+
+    def get_stats(self, detailed: bool = False) -> Dict:
+        """
+        Get scheduler load, and per-flow and per-stream bandwidth if detailed.
+
+        Args:
+            detailed: Include flows by client IP and streams by file; admin only
+
+        Returns:
+            Dictionary with in-flight/queued counts, flows and streams
+        """
+        flows: Dict[str, Dict] = {}
+        for handle in self.streams.values():
+            flow = flows.setdefault(handle.flow, {"streams": 0, "rate_bps": 0, "bytes_sent": 0})
+            flow["streams"] += 1
+            flow["rate_bps"] += int(handle.rate())
+            flow["bytes_sent"] += handle.bytes_sent
+        stats = {
+            "inflight": self.inflight,
+            "queued": sum(1 for *_, w in self.queue if not w.done()),
+            "max_inflight": self.max_inflight,
+            "flows": len(flows),
+            "streams": len(self.streams),
+            "rate_bps": sum(flow["rate_bps"] for flow in flows.values()),
+        }
+        if detailed:
+            stats["flows"] = flows
+            stats["streams"] = [h.to_dict() for h in self.streams.values()]
+        return stats
+
+
+scheduler = FairScheduler()
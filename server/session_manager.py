@@ -0,0 +1,181 @@
+"""
+Session Manager - Keepalive, idle reaping and health reporting for DC sessions
+"""
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Optional
+from pyrogram import raw
+
+from config import Config
+from server import metrics
+from server.dc_manager import (
+    MAIN_DC_ID,
+    dc_clients,
+    get_main_client,
+    get_dc_media_session,
+    invalidate_dc_client,
+    invalidate_dc_media_session,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStats:
+    """Usage bookkeeping for one session object."""
+
+    def __init__(self, session_ref: int):
+        self.session_ref = session_ref  # id() of the tracked Session/Client
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.requests = 0
+        self.ping_failures = 0
+
+    def to_dict(self, now: float) -> Dict:
+        return {
+            "age_seconds": int(now - self.created_at),
+            "idle_seconds": int(now - self.last_used),
+            "requests": self.requests,
+            "ping_failures": self.ping_failures,
+        }
+
+
+# Global registries
+media_session_stats: Dict[int, SessionStats] = {}  # dc_id -> stats of client.media_sessions[dc_id]
+dc_client_stats: Dict[int, SessionStats] = {}  # dc_id -> stats of dc_manager.dc_clients[dc_id]
+dc_last_traffic: Dict[int, float] = {}  # dc_id -> unix timestamp of the last part fetched
+
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+def _stats_for(registry: Dict[int, SessionStats], dc_id: int, session) -> SessionStats:
+    """Return stats for session, starting fresh if the DC got a new session object."""
+    stats = registry.get(dc_id)
+    if stats is None or stats.session_ref != id(session):
+        stats = SessionStats(id(session))
+        registry[dc_id] = stats
+    return stats
+
+
+def record_use(dc_id: int, session) -> None:
+    """
+    Record one request sent over a media session.
+
+    Args:
+        dc_id: Data center ID of the session
+        session: The Session object used
+    """
+    now = time.time()
+    stats = _stats_for(media_session_stats, dc_id, session)
+    stats.last_used = now
+    stats.requests += 1
+    dc_last_traffic[dc_id] = now
+
+
+async def _ping(session) -> bool:
+    """Send a Ping and wait for the Pong, so a dead socket is noticed before a stream needs it."""
+    try:
+        await asyncio.wait_for(
+            session.send(raw.functions.Ping(ping_id=random.getrandbits(63))),
+            Config.SESSION_PING_TIMEOUT,
+        )
+        return True
+    except Exception as e:
+        logger.debug(f"Ping failed: {e!r}")
+        return False
+
+
+async def sweep() -> None:
+    """
+    Run one maintenance pass over all sessions.
+
+    - Idle beyond SESSION_IDLE_TIMEOUT: closed to free sockets, buffers and ping tasks
+    - Used within SESSION_ACTIVE_WINDOW: pinged, and rebuilt if the ping fails
+    - DCs with recent traffic but no session: re-established ahead of the next request
+    """
+    now = time.time()
+    client = await get_main_client()
+
+    for dc_id, session in list(client.media_sessions.items()):
+        stats = _stats_for(media_session_stats, dc_id, session)
+        idle = now - stats.last_used
+
+        if idle > Config.SESSION_IDLE_TIMEOUT:
+            logger.info(f"Closing media session for DC {dc_id} (idle {int(idle)}s)")
+            await invalidate_dc_media_session(dc_id, client)
+            media_session_stats.pop(dc_id, None)
+            dc_last_traffic.pop(dc_id, None)
+            metrics.incr("sessions_reaped")
+        elif idle < Config.SESSION_ACTIVE_WINDOW:
+            if await _ping(session):
+                stats.ping_failures = 0
+                continue
+            stats.ping_failures += 1
+            metrics.incr("session_ping_failures")
+            logger.warning(f"Media session for DC {dc_id} failed keepalive ping, re-establishing")
+            await invalidate_dc_media_session(dc_id, client)
+            media_session_stats.pop(dc_id, None)
+
+    # Re-establish sessions for DCs that are still streaming
+    for dc_id, last_traffic in list(dc_last_traffic.items()):
+        if now - last_traffic > Config.SESSION_ACTIVE_WINDOW:
+            dc_last_traffic.pop(dc_id, None)
+            continue
+        if dc_id not in client.media_sessions:
+            try:
+                await get_dc_media_session(dc_id, client)
+                metrics.incr("sessions_reestablished")
+                logger.info(f"Re-established media session for active DC {dc_id}")
+            except Exception as e:
+                logger.error(f"Failed to re-establish media session for DC {dc_id}: {e}")
+
+    # Full DC clients are never used per-request, so idle time counts from first sight
+    for dc_id, dc_client in list(dc_clients.items()):
+        if dc_id == MAIN_DC_ID:
+            continue
+        stats = _stats_for(dc_client_stats, dc_id, dc_client)
+        if now - stats.last_used > Config.SESSION_IDLE_TIMEOUT:
+            await invalidate_dc_client(dc_id)
+            dc_client_stats.pop(dc_id, None)
+            metrics.incr("sessions_reaped")
+
+
+async def run_sweeper() -> None:
+    """Run sweep() every SESSION_SWEEP_INTERVAL seconds until cancelled."""
+    while True:
+        await asyncio.sleep(Config.SESSION_SWEEP_INTERVAL)
+        try:
+            await sweep()
+        except Exception as e:
+            logger.exception(f"Session sweep failed: {e}")
+
+
+def start() -> None:
+    """Start the background sweeper (idempotent)."""
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(run_sweeper())
+        logger.info("Session manager started")
+
+
+def stop() -> None:
+    """Cancel the background sweeper."""
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        _sweeper_task = None
+
+
+def get_stats() -> Dict:
+    """
+    Get per-session age, idle time and request counts.
+
+    Returns:
+        Dictionary keyed by session kind, then DC ID
+    """
+    now = time.time()
+    return {
+        "media_sessions": {dc_id: s.to_dict(now) for dc_id, s in media_session_stats.items()},
+        "dc_clients": {dc_id: s.to_dict(now) for dc_id, s in dc_client_stats.items()},
+    }
@@ -0,0 +1,36 @@
+"""
+Single Flight - Deduplicate concurrent async work per key
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+async def single_flight(pending: Dict, key: Hashable, factory: Callable[[], Awaitable]):
+    """Run factory() once per key; concurrent callers await the same result.
+    The shared task is shielded so one cancelled caller does not abort it for the others.
+
+    Args:
+        pending: Caller-owned dict of in-progress futures, keyed like key
+        key: Identifies the work being shared
+        factory: Zero-argument callable returning the awaitable to run
+
+    Returns:
+        The factory's result (its exception is raised in every waiter)
+    """
+    future = pending.get(key)
+    if future is None:
+        future = asyncio.ensure_future(factory())
+        pending[key] = future
+
+        def _done(fut):
+            pending.pop(key, None)
+            if not fut.cancelled():
+                fut.exception()  # Mark retrieved even if every waiter went away
+
+        future.add_done_callback(_done)
+    else:
+        logger.debug("Joining in-progress work for %s", key)
+    return await asyncio.shield(future)
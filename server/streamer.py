@@ -9,8 +9,10 @@ from pyrogram.raw.functions.upload import GetFile
 from pyrogram.raw.types import InputDocumentFileLocation, InputPhotoFileLocation
 from pyrogram.errors import FileMigrate, FloodWait
 
-from server.dc_manager import get_main_client, get_dc_client, invalidate_dc_client
+from server import file_identity, metrics, session_manager
+from server.dc_manager import get_main_client, get_dc_media_session, invalidate_dc_media_session
 from server.dc_mapping import get_file_dc, set_file_dc
+from server.part_fetcher import RetryBudget, fetch_part
 
 logger = logging.getLogger(__name__)
 
@@ -33,26 +35,53 @@ class TelegramFileStreamer:
         self.file_size = file_size
         self.chunk_size = 512 * 1024  # 512 KiB chunks
         self.client = None
+        self.media_session = None  # Media-only session when the file lives on another DC
+        self.media_dc_id = None
         self.cached_location = None
 
     async def _ensure_client(self):
-        """Ensure we have the correct client for this file.
+        """Ensure we have the correct session for this file.
         Uses DC mapping if available, otherwise uses main client.
         """
         if self.client is not None:
             return
+        self.client = await get_main_client()
+        # Share the DC mapping with every other link to the same file
+        file_identity.register(self.chat_id, self.message_id, file_identity.unique_id_of(FileId.decode(self.file_id)))
         dc_id = get_file_dc(self.chat_id, self.message_id)
         if dc_id is not None:
             try:
-                self.client = await get_dc_client(dc_id)
-                logger.info(
-                    f"Using cached DC {dc_id} client for Chat {self.chat_id}, Message {self.message_id}"
+                self.media_session = await get_dc_media_session(dc_id, self.client)
+                self.media_dc_id = dc_id
+                logger.debug(
+                    "Using cached DC %s media session for Chat %s, Message %s", dc_id, self.chat_id, self.message_id
                 )
             except RuntimeError as e:
-                logger.error(f"Failed to get DC {dc_id} client: {e}")
-                self.client = await get_main_client()
-        else:
-            self.client = await get_main_client()
+                logger.error(f"Failed to get DC {dc_id} media session: {e}")
+
+    async def _invoke(self, query):
+        """Send query over the DC media session if we have one, else the main client."""
+        if self.media_session is not None:
+            session_manager.record_use(self.media_dc_id, self.media_session)
+            return await self.media_session.send(query)
+        return await self.client.invoke(query)
+
+    async def _reset_client(self):
+        """Drop a failing media session so the next attempt reconnects.
+        The main bot client is never stopped here.
+        """
+        if self.media_dc_id is not None:
+            await invalidate_dc_media_session(self.media_dc_id, self.client)
+            self.media_session = await get_dc_media_session(self.media_dc_id, self.client)
+
+    async def _get_file(self, location, offset: int, limit: int, budget: RetryBudget):
+        """Invoke GetFile on the current session, retrying transient failures."""
+        return await fetch_part(
+            lambda: self._invoke(GetFile(location=location, offset=offset, limit=limit)),
+            budget,
+            reset_session=self._reset_client,
+            description=f"Chat {self.chat_id}, Message {self.message_id} at offset {offset}",
+        )
 
     async def get_file_location(self):
         """Decode file_id and create InputFileLocation.
@@ -88,6 +117,7 @@ class TelegramFileStreamer:
         if end is None:
             end = self.file_size
         current_offset = start
+        budget = RetryBudget()
 
         while current_offset < end:
             if self.cached_location is None:
@@ -111,9 +141,7 @@ class TelegramFileStreamer:
                 request_limit = self.chunk_size
 
             try:
-                result = await self.client.invoke(
-                    GetFile(location=location, offset=aligned_offset, limit=request_limit)
-                )
+                result = await self._get_file(location, aligned_offset, request_limit, budget)
                 chunk = result.bytes
                 if gap:
                     chunk = chunk[gap:]
@@ -132,23 +160,21 @@ class TelegramFileStreamer:
                     target_dc = e.value
                     logger.warning(f"DC Migration: File is on DC {target_dc}")
                     try:
-                        new_client = await get_dc_client(target_dc)
-                    except RuntimeError as client_err:
+                        new_session = await get_dc_media_session(target_dc, self.client)
+                    except Exception as client_err:
                         logger.error(
-                            f"Failed to get DC {target_dc} client for Chat {self.chat_id}, Message {self.message_id}: {client_err}"
+                            f"Failed to get DC {target_dc} media session for Chat {self.chat_id}, Message {self.message_id}: {client_err}"
                         )
+                        metrics.incr("stream_truncations")
                         return
-                    self.client = new_client
+                    self.media_session = new_session
+                    self.media_dc_id = target_dc
                     set_file_dc(self.chat_id, self.message_id, target_dc)
                     # Refresh location for new DC
                     self.cached_location = await self.get_file_location()
                     try:
-                        result = await self.client.invoke(
-                            GetFile(
-                                location=self.cached_location,
-                                offset=aligned_offset,
-                                limit=request_limit,
-                            )
+                        result = await self._get_file(
+                            self.cached_location, aligned_offset, request_limit, budget
                         )
                         chunk = result.bytes
                         if gap:
@@ -166,29 +192,34 @@ class TelegramFileStreamer:
                             f"Still migrating after attempt {migrate_attempt}, retrying..."
                         )
                         if migrate_attempt >= 2:
-                            await invalidate_dc_client(target_dc)
+                            await invalidate_dc_media_session(target_dc, self.client)
                         await asyncio.sleep(0.5)
                         continue
                     except FloodWait as fw:
                         logger.error(
                             f"FloodWait while retrying on DC {target_dc}: {fw.value}s"
                         )
+                        metrics.incr("stream_truncations")
                         return
                     except Exception as retry_err:
                         logger.exception(
                             f"Retry after FileMigrate failed: {retry_err}"
                         )
+                        metrics.incr("stream_truncations")
                         return
                 else:
                     logger.error(
                         f"Exceeded max DC migration attempts for Chat {self.chat_id}, Message {self.message_id}"
                     )
+                    metrics.incr("stream_truncations")
                     return
             except FloodWait as e:
-                logger.warning(f"FloodWait during streaming: {e.value}s")
-                await asyncio.sleep(e.value)
-                continue
+                # Only long waits reach here; short ones are absorbed by fetch_part
+                logger.error(f"FloodWait during streaming: {e.value}s, stream truncated")
+                metrics.incr("stream_truncations")
+                return
             except Exception as exc:
-                logger.exception(f"GetFile error at offset {current_offset}: {exc}")
+                logger.exception(f"GetFile error at offset {current_offset}, stream truncated: {exc}")
+                metrics.incr("stream_truncations")
                 return
 
@@ -0,0 +1,327 @@
+"""
+Tracing - Per-request spans, request ids in logs and slow-trace capture
+"""
+import os
+import re
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "telegram-stream-bot"
+SPAN_KIND_SERVER = 2
+SPAN_KIND_INTERNAL = 1
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Context of the request being handled; copied into tasks it creates
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Reusable stand-in for span() where only some calls are worth recording
+NOOP = nullcontext()
+
+# Global registries
+slow_traces: Deque["Trace"] = deque(maxlen=Config.TRACE_RING_SIZE)  # Most recent slow starts
+counts: Dict[str, int] = {"started": 0, "finished": 0, "slow": 0, "exported": 0, "export_errors": 0}
+
+_export_queue: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+_exporter: Optional[threading.Thread] = None
+
+
+class Span:
+    """One timed stage of a request, e.g. a get_messages call or the first GetFile."""
+
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict, start_ns: int = None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns() if start_ns is None else start_ns
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def end(self, end_ns: int = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns() if end_ns is None else end_ns
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self, origin_ns: int) -> Dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "offset_ms": round((self.start_ns - origin_ns) / 1e6, 2),
+            "duration_ms": round(self.duration_ms, 2),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+    def to_otlp(self, trace_id: str, kind: int) -> Dict:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> Dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Trace:
+    """
+    All spans of one request under a root span.
+
+    A stream's trace stays open until the body finishes, but it is judged
+    slow by its time to first byte, so a slow start is visible in the ring
+    buffer while the stream is still playing.
+    """
+
+    def __init__(self, name: str, rid: Optional[str] = None, **attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.request_id = rid if rid and _REQUEST_ID_RE.match(rid) else self.trace_id[:16]
+        self.root = Span(name, None, attributes)
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        self.first_byte_ns: Optional[int] = None
+        self.slow = False
+        counts["started"] += 1
+
+    def add(self, span: Span) -> None:
+        if len(self.spans) < Config.TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def record(self, name: str, start_ns: int, end_ns: int, **attributes) -> Span:
+        """Add an already-timed span (for stages that cannot be wrapped in a with-block)."""
+        span = Span(name, self.root.span_id, attributes, start_ns)
+        span.end(end_ns)
+        self.add(span)
+        return span
+
+    @property
+    def start_latency_ms(self) -> float:
+        """Time to first byte, or total time for responses without a body."""
+        end = self.first_byte_ns or self.root.end_ns or time.time_ns()
+        return (end - self.root.start_ns) / 1e6
+
+    def _check_slow(self) -> None:
+        if not self.slow and self.start_latency_ms >= Config.TRACE_SLOW_MS:
+            self.slow = True
+            counts["slow"] += 1
+            slow_traces.append(self)
+
+    def mark_first_byte(self) -> None:
+        if self.first_byte_ns is None:
+            self.first_byte_ns = time.time_ns()
+            self.root.attributes["ttfb_ms"] = round(self.start_latency_ms, 2)
+            self._check_slow()
+
+    def finish(self, error: BaseException = None) -> None:
+        """End the root span and export the trace (idempotent)."""
+        if self.root.end_ns is not None:
+            return
+        if error is not None:
+            self.root.error = repr(error)
+        self.root.end()
+        counts["finished"] += 1
+        self._check_slow()
+        if Config.TRACE_EXPORT_PATH:
+            _export(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "request_id": self.request_id,
+            "name": self.root.name,
+            "started_at": self.root.start_ns / 1e9,
+            "start_latency_ms": round(self.start_latency_ms, 2),
+            "in_progress": self.root.end_ns is None,
+            "dropped_spans": self.dropped_spans,
+            "spans": [span.to_dict(self.root.start_ns) for span in [self.root] + self.spans],
+        }
+
+    def to_otlp(self) -> Dict:
+        """OTLP/JSON ExportTraceServiceRequest, as written by the collector's file exporter."""
+        spans = [self.root.to_otlp(self.trace_id, SPAN_KIND_SERVER)]
+        spans += [span.to_otlp(self.trace_id, SPAN_KIND_INTERNAL) for span in self.spans]
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+
+def start_trace(name: str, rid: Optional[str] = None, **attributes) -> Trace:
+    """
+    Start a trace and make it current for this task and the tasks it creates.
+
+    Args:
+        name: Root span name (e.g. "stream_media")
+        rid: Incoming X-Request-ID, reused if well-formed
+        **attributes: Root span attributes
+
+    Returns:
+        Trace: The new trace
+    """
+    trace = Trace(name, rid, **attributes)
+    activate(trace)
+    return trace
+
+
+def activate(trace: Trace) -> None:
+    """Make trace current in this context, e.g. inside a response body generator."""
+    current_trace.set(trace)
+    current_span.set(trace.root)
+    request_id.set(trace.request_id)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the enclosed block as a child of the current span.
+
+    A no-op when no trace is active. Do not hold one open across a
+    generator's yield: the context variable must be reset in the same context.
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = current_span.get()
+    s = Span(name, parent.span_id if parent else trace.root.span_id, attributes)
+    token = current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        s.end()
+        trace.add(s)
+
+
+def record(name: str, start_ns: int, **attributes) -> None:
+    """Add a span from start_ns until now under the current span (no-op without a trace)."""
+    trace = current_trace.get()
+    if trace is None:
+        return
+    parent = current_span.get()
+    s = Span(name, parent.span_id if parent else trace.root.span_id, attributes, start_ns)
+    s.end()
+    trace.add(s)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request id; runs on the logging call's thread."""
+
+    def filter(self, record):
+        record.request_id = request_id.get() or "-"
+        return True
+
+
+def _export_worker(path: str) -> None:
+    while True:
+        line = _export_queue.get()
+        if line is None:
+            return
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+                # Drain whatever queued up meanwhile with the file already open
+                while True:
+                    try:
+                        line = _export_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if line is None:
+                        return
+                    f.write(line)
+        except OSError as e:
+            counts["export_errors"] += 1
+            logger.warning("Trace export to %s failed: %s", path, e)
+
+
+def _export(trace: Trace) -> None:
+    global _exporter
+    if _exporter is None:
+        _exporter = threading.Thread(
+            target=_export_worker, args=(Config.TRACE_EXPORT_PATH,), name="trace-exporter", daemon=True
+        )
+        _exporter.start()
+    # Serialized here (cheap) so the writer thread never touches live trace objects
+    _export_queue.put(json.dumps(trace.to_otlp(), separators=(",", ":")) + "\n")
+    counts["exported"] += 1
+
+
+def shutdown(timeout: float = 5) -> None:
+    """Flush queued exports and stop the writer thread."""
+    global _exporter
+    if _exporter is not None:
+        _export_queue.put(None)
+        _exporter.join(timeout)
+        _exporter = None
+
+
+def get_slow_traces(limit: int = 20) -> List[Dict]:
+    """
+    Most recent slow traces, newest first.
+
+    Args:
+        limit: Maximum traces returned
+
+    Returns:
+        List of trace dictionaries with their spans
+    """
+    return [trace.to_dict() for trace in list(slow_traces)[::-1][:limit]]
+
+
+def get_stats() -> Dict:
+    """
+    Get tracing counters.
+
+    Returns:
+        Dictionary with trace counts, slow threshold and export target
+    """
+    return {
+        **counts,
+        "slow_threshold_ms": Config.TRACE_SLOW_MS,
+        "slow_kept": len(slow_traces),
+        "export_path": Config.TRACE_EXPORT_PATH or None,
+    }
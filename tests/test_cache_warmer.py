@@ -0,0 +1,67 @@
+import pytest
+
+from server.cache_warmer import CacheWarmer, WarmJob, WarmJobRejected, parse_warm_target
+from server.chunk_cache import PART_SIZE, chunk_cache
+
+MB = 1024 * 1024
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("https://t.me/c/123456/10", (-100123456, 10, 10)),
+    ("t.me/c/123456/10-20", (-100123456, 10, 20)),
+    ("https://telegram.me/some_channel/42", ("some_channel", 42, 42)),
+    ("https://t.me/some_channel/5-9/", ("some_channel", 5, 9)),
+    ("https://stream.example.com/stream/-100123456/77", (-100123456, 77, 77)),
+])
+def test_parse_warm_target(text, expected):
+    assert parse_warm_target(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "hello", "https://example.com/watch/1", "t.me/c/123456/"])
+def test_parse_warm_target_rejects_other_text(text):
+    with pytest.raises(WarmJobRejected):
+        parse_warm_target(text)
+
+
+def job_with_files(count, file_size, head_mb=32, tail_mb=2):
+    job = WarmJob(1, -100123456, 1, count, head_mb, tail_mb)
+    job.files = [{"file_size": file_size, "offsets": []} for _ in range(count)]
+    return job
+
+
+def budget_parts():
+    return chunk_cache.cache.protected_capacity // PART_SIZE
+
+
+def test_plan_keeps_a_job_that_fits():
+    job = job_with_files(2, 200 * MB, head_mb=8)
+    CacheWarmer()._plan(job)
+    assert job.parts_total == 2 * (8 + 2)
+    assert not job.head_reduced
+
+
+def test_plan_reduces_the_head_of_an_oversize_job():
+    job = job_with_files(10, 200 * MB)  # 10 x (32 + 2) parts, far over the cache
+    CacheWarmer()._plan(job)
+    assert job.head_reduced
+    assert 1 <= job.head_mb < 32
+    assert job.parts_total <= budget_parts()
+    assert all(len(entry["offsets"]) == job.head_mb + 2 for entry in job.files)
+
+
+def test_plan_rejects_a_job_that_cannot_fit_with_a_1mb_head():
+    files = budget_parts() // 3 + 1  # 1 MiB head + 2 MiB tail each
+    job = job_with_files(files, 200 * MB)
+    with pytest.raises(WarmJobRejected, match="even with a 1 MiB head"):
+        CacheWarmer()._plan(job)
+
+
+def test_plan_leaves_room_for_other_holding_jobs():
+    warmer = CacheWarmer()
+    holding = job_with_files(1, 200 * MB)
+    holding.parts_total = budget_parts() - 10
+    warmer.jobs[holding.id] = holding
+    job = job_with_files(3, 200 * MB)
+    job.id = 2
+    warmer._plan(job)
+    assert job.parts_total <= 10
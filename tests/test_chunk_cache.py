@@ -0,0 +1,36 @@
+from server.chunk_cache import PART_SIZE, WTinyLFUCache
+
+MB = 1024 * 1024
+
+
+def scan(cache, file_key, parts):
+    """A one-off sequential download: every part missed once, then inserted."""
+    for part in range(parts):
+        key = (file_key, part * PART_SIZE)
+        if cache.get(key) is None:
+            cache.put(key, None, PART_SIZE)
+
+
+def test_warmed_parts_survive_a_scan():
+    cache = WTinyLFUCache(128 * MB)
+    warmed = [("premiere", part * PART_SIZE) for part in range(34)]
+    for key in warmed:
+        cache.put(key, None, PART_SIZE, admit=True)
+
+    scan(cache, "bulk-download", 300)
+
+    assert all(key in cache for key in warmed)
+    assert cache.size_bytes <= cache.capacity
+
+
+def test_scan_does_not_flush_frequently_read_parts():
+    cache = WTinyLFUCache(64 * MB)
+    hot = [("hot", part * PART_SIZE) for part in range(20)]
+    for _ in range(3):
+        for key in hot:
+            if cache.get(key) is None:
+                cache.put(key, None, PART_SIZE)
+
+    scan(cache, "bulk-download", 300)
+
+    assert sum(key in cache for key in hot) >= len(hot) - 1
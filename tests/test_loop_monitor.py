@@ -0,0 +1,52 @@
+import time
+import asyncio
+
+import pytest
+
+from server.loop_monitor import LoopBlockedError, LoopMonitor
+
+
+def strict_monitor():
+    monitor = LoopMonitor(interval=0.01, threshold=0.05)
+    monitor.strict = True
+    return monitor
+
+
+def test_strict_mode_keeps_sampling_after_a_violation():
+    async def run():
+        monitor = strict_monitor()
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            time.sleep(0.2)  # First block
+            await asyncio.sleep(0.05)
+            with pytest.raises(LoopBlockedError, match="time.sleep"):
+                monitor.check()
+            assert monitor.get_stats()["running"]
+
+            time.sleep(0.2)  # Second block must still be caught
+            await asyncio.sleep(0.05)
+            with pytest.raises(LoopBlockedError):
+                monitor.check()
+            monitor.check()  # Nothing left to report
+            assert monitor.block_count == 2
+        finally:
+            monitor.stop()
+
+    asyncio.run(run())
+
+
+def test_expect_no_blocking_raises_with_the_stack():
+    async def run():
+        monitor = strict_monitor()
+        try:
+            with pytest.raises(LoopBlockedError, match="time.sleep"):
+                async with monitor.expect_no_blocking():
+                    await asyncio.sleep(0.05)
+                    time.sleep(0.2)
+            async with monitor.expect_no_blocking():
+                await asyncio.sleep(0.1)
+        finally:
+            monitor.stop()
+
+    asyncio.run(run())
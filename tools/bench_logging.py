@@ -0,0 +1,141 @@
+"""
+Benchmark - logging overhead on the request path
+
+Times the per-call cost seen by the caller (the event loop in production)
+for the stream_media request log line under two setups:
+
+  before:      synchronous FileHandler + StreamHandler, eager f-string at INFO
+  after:       logging_setup (queue + listener thread), lazy %-style, rate
+               limiting off so every record takes the queue handoff
+  rate-limited: the same with LOG_RATE_LIMIT on; the identical call site is
+               cut off after LOG_RATE_LIMIT records per window, so this
+               mostly measures the filter's drop path
+
+All output goes to a temporary directory. A slow disk can be simulated
+with --write-delay, which sleeps inside every handler write.
+
+Usage:
+    python tools/bench_logging.py [--calls 20000] [--write-delay 0.0005]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging_setup  # noqa: E402
+from config import Config  # noqa: E402
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class SlowFile:
+    """File wrapper that sleeps on every write, like a congested disk or pipe."""
+
+    def __init__(self, path, delay):
+        self.f = open(path, "a")
+        self.delay = delay
+
+    def write(self, data):
+        if self.delay:
+            time.sleep(self.delay)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.INFO)
+
+
+def measure(log_call, calls):
+    timings = []
+    for i in range(calls):
+        start = time.perf_counter()
+        log_call(i)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "p50_us": timings[len(timings) // 2] * 1e6,
+        "p99_us": timings[int(len(timings) * 0.99)] * 1e6,
+        "total_ms": sum(timings) * 1e3,
+    }
+
+
+def bench_before(tmp, calls, delay):
+    reset_root()
+    formatter = logging.Formatter(TEXT_FORMAT)
+    stream = SlowFile(os.path.join(tmp, "before_console.log"), delay)
+    handlers = [logging.FileHandler(os.path.join(tmp, "before.log")), logging.StreamHandler(stream)]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logging.getLogger().addHandler(handler)
+    logger = logging.getLogger("server.routes_improved")
+    result = measure(lambda i: logger.info(f"Stream request: Chat {-1001234567890}, Message {i}"), calls)
+    reset_root()
+    stream.close()
+    return result
+
+
+def bench_after(tmp, calls, delay, rate_limit=0):
+    reset_root()
+    configured = Config.LOG_RATE_LIMIT
+    Config.LOG_RATE_LIMIT = rate_limit
+    stream = SlowFile(os.path.join(tmp, "after_console.log"), delay)
+    try:
+        logging_setup.setup_logging(os.path.join(tmp, "after.log"), stream)
+    finally:
+        Config.LOG_RATE_LIMIT = configured
+    logger = logging.getLogger("server.routes_improved")
+    result = measure(lambda i: logger.info("Stream request: Chat %s, Message %s", -1001234567890, i), calls)
+    started = time.perf_counter()
+    logging_setup.stop_logging()  # Drains the queue: cost paid by the writer thread, not the caller
+    result["drain_ms"] = (time.perf_counter() - started) * 1e3
+    with open(os.path.join(tmp, "after.log")) as f:
+        result["written"] = sum(1 for _ in f)
+    os.remove(os.path.join(tmp, "after.log"))
+    reset_root()
+    stream.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--write-delay", type=float, default=0.0, help="Seconds slept per console write")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            "before (sync handlers, f-string)": bench_before(tmp, args.calls, args.write_delay),
+            "after (queue + listener, lazy)": bench_after(tmp, args.calls, args.write_delay),
+            "rate-limited (filter drop path)": bench_after(
+                tmp, args.calls, args.write_delay, Config.LOG_RATE_LIMIT or 20
+            ),
+        }
+
+    print(f"{args.calls:,} request-log calls, write delay {args.write_delay * 1e3:.2f} ms\n")
+    print(f"{'setup':<36}{'mean µs':>10}{'p50 µs':>10}{'p99 µs':>10}{'caller ms':>12}{'written':>10}{'drain ms':>10}")
+    for name, r in results.items():
+        print(
+            f"{name:<36}{r['mean_us']:>10.2f}{r['p50_us']:>10.2f}{r['p99_us']:>10.2f}{r['total_ms']:>12.1f}"
+            f"{r.get('written', args.calls):>10,}{r.get('drain_ms', 0):>10.1f}"
+        )
+    print("\nDrain is the listener finishing the queue after the run (background thread, not the caller).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark - users collection lookup latency with and without indexes
+
+Seeds a throwaway database on a local MongoDB with N synthetic users, then
+times Database.is_user_exist / get_user_details before and after
+Database.ensure_indexes(), printing the winning query plan for each phase.
+
+Usage:
+    python tools/bench_users_index.py [--uri mongodb://localhost:27017] [--users 1000000]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+BENCH_DB = "TelegramStreamBotBench"
+
+
+async def seed(db: Database, count: int, batch: int = 10000):
+    await db.col.drop()
+    template = db.new_user(0)
+    for start in range(0, count, batch):
+        docs = []
+        for uid in range(start, min(start + batch, count)):
+            doc = dict(template)
+            doc['id'] = 100000000 + uid
+            docs.append(doc)
+        await db.col.insert_many(docs, ordered=False)
+    print(f"Seeded {count:,} users")
+
+
+async def time_lookups(db: Database, count: int, samples: int):
+    ids = [100000000 + random.randrange(count) for _ in range(samples)]
+    timings = {"is_user_exist": [], "get_user_details": []}
+    for uid in ids:
+        for name in timings:
+            started = time.perf_counter()
+            await getattr(db, name)(uid)
+            timings[name].append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def winning_plan(db: Database, count: int):
+    plan = await db.col.find({'id': 100000000 + count // 2}).explain()
+    stage = plan["queryPlanner"]["winningPlan"]
+    while "inputStage" in stage:
+        stage = stage["inputStage"]
+    return stage.get("stage"), stage.get("indexName")
+
+
+def report(label: str, timings):
+    for name, values in timings.items():
+        values.sort()
+        p = lambda q: values[min(int(len(values) * q), len(values) - 1)]
+        print(
+            f"{label:>12} {name:<18} p50={statistics.median(values):8.2f}ms "
+            f"p95={p(0.95):8.2f}ms p99={p(0.99):8.2f}ms (n={len(values)})"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=50, help="lookups per phase (collection scans are slow)")
+    args = parser.parse_args()
+
+    db = Database(args.uri, BENCH_DB)
+    await seed(db, args.users)
+    await db.col.drop_indexes()
+
+    print("Plan without indexes:", await winning_plan(db, args.users))
+    report("no index", await time_lookups(db, args.users, args.samples))
+
+    await db.ensure_indexes()
+    print("Index check:", await db.check_indexes())
+    print("Plan with indexes:", await winning_plan(db, args.users))
+    report("indexed", await time_lookups(db, args.users, args.samples * 20))
+
+    await db._client.drop_database(BENCH_DB)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
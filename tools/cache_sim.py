@@ -0,0 +1,180 @@
+"""
+Cache simulator - byte hit ratio of chunk-cache policies on an access trace
+
+Expands every request of an access trace (server/access_trace.py) into the
+1 MB parts the server actually fetched for the bytes it delivered, then
+replays those part accesses against:
+
+  lru        plain byte-bounded LRU
+  arc        Adaptive Replacement Cache (Megiddo & Modha), in whole parts
+  wtinylfu   server.chunk_cache.WTinyLFUCache, the policy the server runs
+
+for each cache size, and reports the byte hit ratio (delivered bytes that
+came from cache) and the part hit ratio.
+
+Usage:
+    python tools/cache_sim.py access.trace [--sizes 64,256,1024]
+    python tools/cache_sim.py --synthetic 2000 [--files 200]
+"""
+import os
+import sys
+import argparse
+from collections import OrderedDict
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.access_trace import read_trace  # noqa: E402
+from server.chunk_cache import PART_SIZE, WTinyLFUCache  # noqa: E402
+
+MB = 1024 * 1024
+
+
+class LRUPolicy:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: "OrderedDict[tuple, int]" = OrderedDict()
+        self.used = 0
+
+    def access(self, key, size: int) -> bool:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return True
+        if size <= self.capacity:
+            self.entries[key] = size
+            self.used += size
+            while self.used > self.capacity:
+                self.used -= self.entries.popitem(last=False)[1]
+        return False
+
+
+class ARCPolicy:
+    """ARC over whole parts; parts are all 1 MB except file tails, so counting entries is close to bytes."""
+
+    def __init__(self, capacity: int):
+        self.c = max(capacity // PART_SIZE, 1)
+        self.p = 0
+        self.t1: "OrderedDict[tuple, None]" = OrderedDict()
+        self.t2: "OrderedDict[tuple, None]" = OrderedDict()
+        self.b1: "OrderedDict[tuple, None]" = OrderedDict()
+        self.b2: "OrderedDict[tuple, None]" = OrderedDict()
+
+    def _replace(self, in_b2: bool) -> None:
+        if self.t1 and (len(self.t1) > self.p or (in_b2 and len(self.t1) == self.p)):
+            key, _ = self.t1.popitem(last=False)
+            self.b1[key] = None
+        else:
+            key, _ = self.t2.popitem(last=False)
+            self.b2[key] = None
+
+    def access(self, key, size: int) -> bool:
+        if key in self.t1:
+            del self.t1[key]
+            self.t2[key] = None
+            return True
+        if key in self.t2:
+            self.t2.move_to_end(key)
+            return True
+        if key in self.b1:
+            self.p = min(self.c, self.p + max(len(self.b2) // max(len(self.b1), 1), 1))
+            self._replace(False)
+            del self.b1[key]
+            self.t2[key] = None
+            return False
+        if key in self.b2:
+            self.p = max(0, self.p - max(len(self.b1) // max(len(self.b2), 1), 1))
+            self._replace(True)
+            del self.b2[key]
+            self.t2[key] = None
+            return False
+        l1 = len(self.t1) + len(self.b1)
+        total = l1 + len(self.t2) + len(self.b2)
+        if l1 == self.c:
+            if len(self.t1) < self.c:
+                self.b1.popitem(last=False)
+                self._replace(False)
+            else:
+                self.t1.popitem(last=False)
+        elif l1 < self.c and total >= self.c:
+            if total == 2 * self.c:
+                self.b2.popitem(last=False)
+            self._replace(False)
+        self.t1[key] = None
+        return False
+
+
+class WTinyLFUPolicy:
+    def __init__(self, capacity: int):
+        self.cache = WTinyLFUCache(capacity)
+
+    def access(self, key, size: int) -> bool:
+        if self.cache.get(key) is not None:
+            return True
+        self.cache.put(key, True, size)
+        return False
+
+
+POLICIES = {"lru": LRUPolicy, "arc": ARCPolicy, "wtinylfu": WTinyLFUPolicy}
+
+
+def part_accesses(records) -> Iterator[Tuple[tuple, int, int]]:
+    """Yield (key, part size, delivered bytes from that part) in trace order."""
+    for r in records:
+        if r.bytes_delivered <= 0:
+            continue
+        last_byte = r.range_start + r.bytes_delivered - 1
+        for part in range(r.range_start // PART_SIZE, last_byte // PART_SIZE + 1):
+            part_start = part * PART_SIZE
+            part_end = min(part_start + PART_SIZE, r.file_size) - 1
+            overlap = min(part_end, last_byte) - max(part_start, r.range_start) + 1
+            yield (r.file, part_start), part_end - part_start + 1, overlap
+
+
+def simulate(accesses: List[Tuple[tuple, int, int]], policy) -> Tuple[float, float]:
+    hit_bytes = total_bytes = hits = 0
+    for key, size, delivered in accesses:
+        total_bytes += delivered
+        if policy.access(key, size):
+            hits += 1
+            hit_bytes += delivered
+    return hit_bytes / total_bytes if total_bytes else 0.0, hits / len(accesses) if accesses else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", nargs="?", help="Access trace recorded with ACCESS_TRACE_PATH")
+    parser.add_argument("--synthetic", type=int, metavar="SESSIONS", help="Simulate a synthetic VLC-like trace")
+    parser.add_argument("--files", type=int, default=200, help="Distinct files in a synthetic trace")
+    parser.add_argument("--sizes", default="64,256,1024", help="Cache sizes in MiB, comma separated")
+    parser.add_argument("--policies", default=",".join(POLICIES), help="Policies to compare")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from replay_trace import synthesize
+        records = synthesize(args.synthetic, args.files)
+        source = f"synthetic trace ({args.synthetic} sessions, {args.files} files)"
+    elif args.trace:
+        records = list(read_trace(args.trace))
+        source = args.trace
+    else:
+        parser.error("give a trace file or --synthetic N")
+
+    accesses = list(part_accesses(records))
+    delivered = sum(a[2] for a in accesses)
+    distinct = len({a[0] for a in accesses})
+    print(f"{source}: {len(records):,} requests, {len(accesses):,} part accesses, "
+          f"{distinct:,} distinct parts, {delivered / MB:,.0f} MiB delivered\n")
+
+    policies = [p.strip() for p in args.policies.split(",") if p.strip()]
+    print(f"{'cache MiB':>10}" + "".join(f"{name + ' byte%':>16}{'part%':>8}" for name in policies))
+    for size_mb in (int(s) for s in args.sizes.split(",")):
+        row = f"{size_mb:>10}"
+        for name in policies:
+            byte_ratio, part_ratio = simulate(accesses, POLICIES[name](size_mb * MB))
+            row += f"{byte_ratio * 100:>15.1f}%{part_ratio * 100:>7.1f}%"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Fake Telegram backend - in-process stand-in for the bot client and media sessions
+
+Serves synthetic files through the real /stream route, ByteStreamer,
+admission and scheduler code without a network connection or a bot token.
+get_messages and upload.GetFile are answered locally with configurable
+RPC latency and per-session bandwidth, and every byte "downloaded from
+Telegram" is counted so load tests can report fetch amplification.
+
+Used by tools/replay_trace.py; can also be imported by ad-hoc benchmarks:
+
+    backend = FakeTelegram(latency=0.05)
+    chat_id, message_id = backend.add_file(500 * 1024 * 1024)
+    app = backend.install()   # ASGI app with the streaming routes
+"""
+import os
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List, Tuple, Union
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyrogram import raw  # noqa: E402
+from pyrogram.enums import MessageMediaType  # noqa: E402
+from pyrogram.file_id import FileId, FileType, FileUniqueId, FileUniqueType  # noqa: E402
+
+FAKE_CHAT_ID = -1009999999999
+PART_SIZE = 1024 * 1024
+
+
+class FakeSession:
+    """A media session for one DC; answers GetFile from synthetic bytes."""
+
+    def __init__(self, backend: "FakeTelegram", dc_id: int):
+        self.backend = backend
+        self.dc_id = dc_id
+        # Bandwidth is shared by everything this session downloads, like one TCP connection
+        self.busy_until = 0.0
+
+    async def send(self, query, *args, **kwargs):
+        if isinstance(query, raw.functions.Ping):
+            return raw.types.Pong(msg_id=0, ping_id=query.ping_id)
+        if not isinstance(query, raw.functions.upload.GetFile):
+            raise NotImplementedError(f"Fake backend does not handle {type(query).__name__}")
+
+        size = self.backend.sizes[query.location.id]
+        length = max(0, min(query.limit, size - query.offset))
+        now = time.monotonic()
+        transfer = length / self.backend.bandwidth if self.backend.bandwidth else 0.0
+        self.busy_until = max(self.busy_until, now) + transfer
+        await asyncio.sleep(self.backend.latency + (self.busy_until - now))
+
+        self.backend.get_file_calls += 1
+        self.backend.bytes_fetched += length
+        return raw.types.upload.File(
+            type=raw.types.storage.FileUnknown(), mtime=0, bytes=self.backend.block[:length]
+        )
+
+    async def stop(self):
+        pass
+
+
+class FakeClient:
+    """Just enough of the Pyrogram client for the streaming routes."""
+
+    def __init__(self, backend: "FakeTelegram"):
+        self.backend = backend
+        self.is_connected = True
+        self.boot_status = "Fake backend"
+        self.media_sessions = {dc_id: FakeSession(backend, dc_id) for dc_id in range(1, 6)}
+
+    async def get_messages(self, chat_id: int, message_ids: Union[int, List[int]]):
+        await asyncio.sleep(self.backend.latency)
+        self.backend.get_messages_calls += 1
+        if isinstance(message_ids, int):
+            return self.backend.message(chat_id, message_ids)
+        return [self.backend.message(chat_id, message_id) for message_id in message_ids]
+
+
+class FakeTelegram:
+    """
+    Synthetic files plus the fake client that serves them.
+
+    Args:
+        latency: Seconds added to every RPC (round trip to the DC)
+        bandwidth: Bytes per second per media session, 0 = unlimited
+    """
+
+    def __init__(self, latency: float = 0.05, bandwidth: float = 0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.block = os.urandom(PART_SIZE)
+        self.sizes: Dict[int, int] = {}  # media_id -> size
+        self.messages: Dict[Tuple[int, int], SimpleNamespace] = {}
+        self.get_messages_calls = 0
+        self.get_file_calls = 0
+        self.bytes_fetched = 0
+        self.client = FakeClient(self)
+
+    def add_file(self, size: int, dc_id: int = None, name: str = None) -> Tuple[int, int]:
+        """
+        Add a video file of the given size.
+
+        Returns:
+            (chat_id, message_id) to request it with
+        """
+        message_id = len(self.messages) + 1
+        media_id = 10 ** 15 + message_id
+        dc_id = dc_id or (message_id % 5) + 1
+        file_id = FileId(
+            file_type=FileType.DOCUMENT,
+            dc_id=dc_id,
+            media_id=media_id,
+            access_hash=message_id,
+            file_reference=b"",
+        ).encode()
+        unique_id = FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=media_id).encode()
+        self.sizes[media_id] = size
+        self.messages[(FAKE_CHAT_ID, message_id)] = SimpleNamespace(
+            id=message_id,
+            chat=SimpleNamespace(id=FAKE_CHAT_ID),
+            empty=False,
+            media=MessageMediaType.DOCUMENT,
+            document=SimpleNamespace(
+                file_id=file_id,
+                file_unique_id=unique_id,
+                file_size=size,
+                mime_type="video/mp4",
+                file_name=name or f"video_{message_id}.mp4",
+                duration=0,
+            ),
+        )
+        return FAKE_CHAT_ID, message_id
+
+    def message(self, chat_id: int, message_id: int):
+        return self.messages.get((chat_id, message_id)) or SimpleNamespace(
+            id=message_id, chat=SimpleNamespace(id=chat_id), empty=True, media=None
+        )
+
+    def install(self):
+        """
+        Point the streaming routes at this backend (call inside the event loop).
+
+        Returns:
+            FastAPI app serving the streaming routes
+        """
+        from fastapi import FastAPI
+        from server import byte_streamer, routes_improved
+
+        routes_improved.bot = self.client
+        byte_streamer.byte_streamer = byte_streamer.ByteStreamer(self.client)
+        app = FastAPI()
+        app.include_router(routes_improved.router)
+        return app
+
+    def get_stats(self) -> Dict:
+        return {
+            "files": len(self.sizes),
+            "get_messages_calls": self.get_messages_calls,
+            "get_file_calls": self.get_file_calls,
+            "bytes_fetched": self.bytes_fetched,
+        }
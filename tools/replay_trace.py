@@ -0,0 +1,250 @@
+"""
+Replay - drive the streaming server with a recorded access trace
+
+Reads a trace written with ACCESS_TRACE_PATH (server/access_trace.py) and
+replays every request against the real /stream route, served in-process
+by the fake Telegram backend (tools/fake_backend.py). Each replayed client
+reads exactly as many bytes as the original one did and then disconnects,
+so VLC tail probes, seeks and aborted downloads keep their real shape.
+
+Reports time to first byte, delivered throughput and how many bytes were
+fetched from "Telegram" to serve them.
+
+Without a production trace, --synthetic N first writes a VLC-like trace
+(head probes, tail probes, seeks, full downloads over Zipf-popular files).
+
+Usage:
+    python tools/replay_trace.py access.trace [--speed 10] [--latency 0.05]
+    python tools/replay_trace.py --synthetic 500 synthetic.trace
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import statistics
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from server.access_trace import AccessRecord, read_trace, write_trace  # noqa: E402
+from fake_backend import FakeTelegram  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def synthesize(sessions: int, files: int = 50, seed: int = 1, span: float = 600.0) -> List[AccessRecord]:
+    """
+    Generate a VLC-like access trace.
+
+    Each viewing session opens a Zipf-chosen file with a short head read,
+    probes the tail, plays from the start or a seek point for a while and
+    sometimes seeks again; a few sessions are full download-manager pulls.
+
+    Args:
+        sessions: Number of viewing sessions
+        files: Distinct files, popularity following Zipf(1.1)
+        seed: Random seed
+        span: Seconds over which sessions start
+
+    Returns:
+        Records sorted by timestamp
+    """
+    rng = random.Random(seed)
+    sizes = [rng.randint(200, 4096) * MB for _ in range(files)]
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(files)]
+    records = []
+    t0 = 1_700_000_000.0
+    for _ in range(sessions):
+        file = rng.choices(range(files), weights)[0]
+        size = sizes[file]
+        client = rng.getrandbits(63)
+        ts = t0 + rng.uniform(0, span)
+
+        def add(start, delivered, end=None):
+            end = size - 1 if end is None else end
+            records.append(AccessRecord(ts, client, file + 1, size, start, end, min(delivered, end - start + 1)))
+
+        if rng.random() < 0.05:
+            # Download manager: parallel ranges over the whole file
+            parts = 4
+            step = size // parts
+            for i in range(parts):
+                add(i * step, step, size - 1 if i == parts - 1 else (i + 1) * step - 1)
+            continue
+        add(0, rng.randint(64, 512) * 1024)  # Container header probe
+        ts += 0.2
+        add(size - MB, MB)  # Tail probe (moov atom / cues)
+        ts += 0.3
+        position = 0 if rng.random() < 0.7 else rng.randrange(0, size - 50 * MB)
+        for _ in range(rng.randint(1, 3)):
+            watched = rng.randint(5, 200) * MB
+            add(position, watched)
+            ts += watched / (1.5 * MB)  # ~12 Mbit/s playback
+            position = rng.randrange(0, size - 10 * MB)
+    records.sort(key=lambda r: r.ts)
+    return records
+
+
+class ReplayClient:
+    """Minimal ASGI client: one GET, reads `limit` body bytes, then disconnects."""
+
+    def __init__(self, app, client_rate: float = 0):
+        self.app = app
+        self.client_rate = client_rate
+
+    async def get(self, path: str, headers: Dict[str, str], client_ip: str, limit: int) -> Dict:
+        started = time.perf_counter()
+        result = {"status": None, "ttfb": None, "bytes": 0, "duration": 0.0}
+        done = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                result["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                body = message.get("body", b"")
+                if body and result["ttfb"] is None:
+                    result["ttfb"] = time.perf_counter() - started
+                if not done.is_set():
+                    result["bytes"] += len(body)
+                    if self.client_rate and body:
+                        await asyncio.sleep(len(body) / self.client_rate)
+                if result["bytes"] >= limit or not message.get("more_body", False):
+                    done.set()
+
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": b"",
+            "root_path": "",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": (client_ip, 50000),
+            "server": ("replay", 80),
+        }
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            done.set()
+        result["bytes"] = min(result["bytes"], limit)
+        result["duration"] = time.perf_counter() - started
+        return result
+
+
+def client_address(client: int) -> str:
+    return f"10.{(client >> 16) & 255}.{(client >> 8) & 255}.{client & 255}"
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def replay(records: List[AccessRecord], args) -> None:
+    backend = FakeTelegram(latency=args.latency, bandwidth=args.bandwidth * MB)
+    app = backend.install()
+    http = ReplayClient(app, args.client_rate * MB)
+
+    messages = {}  # file hash -> message id
+    for record in records:
+        if record.file not in messages:
+            messages[record.file] = backend.add_file(record.file_size)
+
+    inflight = asyncio.Semaphore(args.max_inflight)
+    results = []
+
+    async def one(record: AccessRecord):
+        chat_id, message_id = messages[record.file]
+        headers = {"range": f"bytes={record.range_start}-{record.range_end}"}
+        async with inflight:
+            result = await http.get(
+                f"/stream/{chat_id}/{message_id}",
+                headers,
+                client_address(record.client),
+                max(record.bytes_delivered, 1),
+            )
+        results.append(result)
+
+    t0 = records[0].ts
+    started = time.perf_counter()
+    tasks = []
+    for record in records:
+        if args.speed:
+            delay = (record.ts - t0) / args.speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(record)))
+    await asyncio.gather(*tasks)
+    # Let abandoned response bodies finalize so their fetches are counted
+    await asyncio.sleep(args.latency * 2 + 0.1)
+    wall = time.perf_counter() - started
+
+    statuses: Dict[int, int] = {}
+    for r in results:
+        statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+    ok = [r for r in results if r["status"] in (200, 206)]
+    ttfbs = [r["ttfb"] * 1000 for r in ok if r["ttfb"] is not None]
+    delivered = sum(r["bytes"] for r in ok)
+    rates = [r["bytes"] / MB / (r["duration"] - r["ttfb"]) for r in ok if r["ttfb"] and r["duration"] > r["ttfb"]]
+    stats = backend.get_stats()
+
+    print(f"Replayed {len(results)} requests over {len(messages)} files in {wall:.1f}s (speed {args.speed or 'max'})")
+    print(f"Status codes:          {dict(sorted(statuses.items(), key=lambda kv: str(kv[0])))}")
+    print(f"TTFB ms:               p50 {percentile(ttfbs, 0.5):.1f}  p90 {percentile(ttfbs, 0.9):.1f}  "
+          f"p99 {percentile(ttfbs, 0.99):.1f}  max {max(ttfbs, default=0):.1f}")
+    print(f"Delivered:             {delivered / MB:,.1f} MiB ({delivered / MB / wall:,.1f} MiB/s aggregate)")
+    if rates:
+        print(f"Per-stream MiB/s:      p50 {statistics.median(rates):.1f}  p10 {percentile(rates, 0.1):.1f}")
+    print(f"Telegram fetched:      {stats['bytes_fetched'] / MB:,.1f} MiB in {stats['get_file_calls']:,} GetFile, "
+          f"{stats['get_messages_calls']:,} get_messages")
+    if delivered:
+        print(f"Fetch amplification:   {stats['bytes_fetched'] / delivered:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="Access trace to replay (or to write with --synthetic)")
+    parser.add_argument("--synthetic", type=int, metavar="SESSIONS", help="Write a synthetic trace first")
+    parser.add_argument("--files", type=int, default=50, help="Distinct files in a synthetic trace")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time acceleration, 0 = as fast as possible")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N records")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake RPC latency in seconds")
+    parser.add_argument("--bandwidth", type=float, default=0, help="Fake MiB/s per media session, 0 = unlimited")
+    parser.add_argument("--client-rate", type=float, default=0, help="MiB/s each client reads, 0 = unlimited")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Concurrent replayed requests")
+    parser.add_argument("--log-level", default="ERROR", help="Server log level during the replay")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper())
+
+    if args.synthetic:
+        count = write_trace(args.trace, synthesize(args.synthetic, args.files))
+        print(f"Wrote {count} synthetic records to {args.trace}")
+
+    records = list(read_trace(args.trace))
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("Trace is empty")
+        return
+    asyncio.run(replay(records, args))
+
+
+if __name__ == "__main__":
+    main()
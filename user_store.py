@@ -0,0 +1,95 @@
+"""
+Telegram VLC Stream Bot - Local User Store
+Copyright (c) 2025 Akhil TG. All Rights Reserved.
+
+Embedded fallback for user tracking when MongoDB is not configured or down.
+User IDs live in SQLite (WAL mode) on disk and in an in-memory set, so
+membership checks are O(1) and a new user costs one INSERT in a worker
+thread instead of rewriting a JSON file inside the event loop.
+"""
+
+import os
+import json
+import sqlite3
+import asyncio
+import logging
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LEGACY_USERS_FILE = "users.json"
+
+
+class LocalUserStore:
+    def __init__(self, path, legacy_json=LEGACY_USERS_FILE):
+        self.path = path
+        self._lock = threading.Lock()  # sqlite3 connections are not safe for concurrent use
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, added_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._ids = {row[0] for row in self._conn.execute("SELECT id FROM users")}
+        self._migrate_json(legacy_json)
+
+    def _migrate_json(self, legacy_json):
+        """One-time import of the old users.json, renamed afterwards so it is not re-read"""
+        if not legacy_json or not os.path.exists(legacy_json):
+            return
+        try:
+            with open(legacy_json, "r") as f:
+                legacy_ids = {int(uid) for uid in json.load(f)}
+        except Exception as e:
+            logger.error(f"Could not read {legacy_json} for migration: {e}")
+            return
+
+        new_ids = legacy_ids - self._ids
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO users (id, added_at) VALUES (?, ?)",
+                [(uid, now) for uid in new_ids],
+            )
+            self._conn.commit()
+        self._ids |= new_ids
+        os.replace(legacy_json, legacy_json + ".migrated")
+        logger.info(f"Migrated {len(new_ids)} users from {legacy_json} to {self.path}")
+
+    def __contains__(self, user_id):
+        return user_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def all_ids(self):
+        return list(self._ids)
+
+    def _insert(self, user_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO users (id, added_at) VALUES (?, ?)", (user_id, time.time())
+            )
+            self._conn.commit()
+
+    async def add(self, user_id):
+        """Add a user; returns True if it was new. The disk write runs off the event loop."""
+        user_id = int(user_id)
+        if user_id in self._ids:
+            return False
+        self._ids.add(user_id)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._insert, user_id)
+        except Exception as e:
+            logger.error(f"Error saving user {user_id} to local store: {e}")
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+local_users = LocalUserStore(Config.USERS_DB_PATH)